@@ -0,0 +1,935 @@
+#!/usr/bin/env python
+"""
+Steps 1 and 2 of KAPA qPCR in one session
+
+Runs the Step 1 dilution series and the Step 2 qPCR plate set up without the deck being torn down in between. Robot work is
+scheduled into Step 1's vortex/centrifuge holds: Master Mix and Standards go into the 384 well plate while the PE plate spins,
+the 10k plate and the 384 well plate are spun together, and the 10k quadrants are pipetted while the 20k plate is off deck.
+Up to 48 samples (one 384 well qPCR plate), larger runs use Kapa_qPCR_Step1.py and Kapa_qPCR_Step2.py.
+
+Original Metadata:
+__author__ = "Joe Brown, Greg Sjogren, Diane Luo"
+__credits__ = ["Joe Brown", "Greg Sjogren", "Diane Luo"]
+__version__ = "1.0"
+__date__ = "2021-08-23"
+"""
+
+
+import math
+import json
+import itertools
+import csv
+import os
+import time
+
+
+def get_values(*names):
+    _all_values = json.loads("""{"temp_deck":"temperature module gen2",
+    "pipette_type":"p300_multi_gen2",
+    "pipette_mount":"left",
+    "pipette_type_2":"p20_multi_gen2",
+    "pipette_mount_2":"right",
+    "sample_number":9,
+    "starting_sample_volume":12,
+    "dilution_volume_1":998,
+    "sample_volume_1":2,
+    "dilution_volume_2":95,
+    "sample_volume_2":5,
+    "dilution_volume_3":40,
+    "sample_volume_3":40,
+    "sample_volume":4,
+    "master_mix_volume":6.2,
+    "set_temperature":4,
+    "disposal_volume":20,
+    "multi_dispense":true,
+    "master_mix_disposal_volume":2,
+    "multi_dispense_offsets":[],
+    "liquid_classes":{},
+    "batch_prompts":false,
+    "sample_sheet":"",
+    "tip_state_file":"",
+    "timeline_file":"",
+    "dry_run":false}""")
+    return [_all_values[n] for n in names]
+
+metadata = {
+    'protocolName': 'Kapa_Illumina Library qPCR Step 1 + 2',
+    'author': 'Greg Sjogren, Joe Brown, Diane Luo',
+    'source': 'Kapa KR0405 v9.17 Protocol',
+    'apiLevel': '2.10', 'softwareLevel': '4.50'
+    }
+
+# Approximate inner well geometry (mm) used to turn a tracked liquid volume into a meniscus height. Rectangular wells have a flat cross section, the BioRad PCR wells are a cone frustum
+labware_geometry = {
+    'agilent_4_well_73_ml_reagent_reservoir': {'shape': 'rectangular', 'x': 25.9, 'y': 71.9, 'depth': 39.22},
+    'perkinelmer_96_wellplate_2000ul': {'shape': 'rectangular', 'x': 8.0, 'y': 8.0, 'depth': 41.0},
+    'biorad_96_wellplate_200ul_pcr': {'shape': 'frustum', 'bottom_diameter': 2.68, 'top_diameter': 5.46, 'depth': 14.81}
+    }
+
+# Liquid classes, one per transfer: flow rates (uL/s), volume correction (uL added to the set volume), well bottom clearances and
+# blow out heights (mm), touch tip offset (mm), settle time (s) before blow out, and the mount Z speeds (mm/s) of moves into liquid
+# (contact_speed) and between wells (travel_speed). A clearance or blow out height of None is set by liquid tracking or per replicate,
+# a speed of None is the full mount speed. calibration is a gravimetric [slope, intercept] curve of delivered against set uL per
+# pipette model ({pipette type: [slope, intercept]}), fit by calibrate.py, used in place of correction for that pipette when set. The settings are those of Kapa_qPCR_Step1.py and Kapa_qPCR_Step2.py, see there
+# for how each was tested. Any setting can be overridden per run through the "liquid_classes" field of get_values
+liquid_classes = {
+    'buffer_1_500': {'aspirate': 94, 'dispense': 22.5, 'blow_out': 299, 'correction': -0.8, 'aspirate_clearance': None,
+                     'dispense_clearance': None, 'blow_out_height': None, 'touch_tip_offset': -5, 'settle': 3,
+                     'contact_speed': 20, 'travel_speed': None, 'calibration': None},
+    'buffer_10k': {'aspirate': 35, 'dispense': 95, 'blow_out': 299, 'correction': -1, 'aspirate_clearance': None,
+                   'dispense_clearance': 10, 'blow_out_height': 9.5, 'touch_tip_offset': -5, 'settle': 3,
+                   'contact_speed': 20, 'travel_speed': None, 'calibration': None},
+    'buffer_20k': {'aspirate': 35, 'dispense': 95, 'blow_out': 299, 'correction': -4, 'aspirate_clearance': None,
+                   'dispense_clearance': 8, 'blow_out_height': 4, 'touch_tip_offset': -5, 'settle': 3,
+                   'contact_speed': 20, 'travel_speed': None, 'calibration': None},
+    'library_1_500': {'aspirate': 2, 'dispense': 2, 'blow_out': 20, 'correction': 0, 'aspirate_clearance': 0.2,
+                      'dispense_clearance': 16.5, 'blow_out_height': 17, 'touch_tip_offset': -5, 'settle': 3,
+                      'contact_speed': None, 'travel_speed': None, 'calibration': None},
+    'library_10k': {'aspirate': 5, 'dispense': 5, 'blow_out': 20, 'correction': 0, 'aspirate_clearance': 15,
+                    'dispense_clearance': 8, 'blow_out_height': 9, 'touch_tip_offset': -5, 'settle': 3,
+                    'contact_speed': None, 'travel_speed': None, 'calibration': None},
+    'library_20k': {'aspirate': 40, 'dispense': 22.5, 'blow_out': 299, 'correction': 0, 'aspirate_clearance': 5,
+                    'dispense_clearance': 5, 'blow_out_height': 5.5, 'touch_tip_offset': -5, 'settle': 3,
+                    'contact_speed': 20, 'travel_speed': None, 'calibration': None},
+    # qPCR Master Mix from the 20k Dilution Plate into the 384 well plate with the 20 uL pipette. The -0.3 correction accounts for the
+    # pipette overdelivering an average of 0.35 uL per transfer
+    'master_mix': {'aspirate': 6.2, 'dispense': 6.2, 'blow_out': 20, 'correction': -0.3, 'aspirate_clearance': None,
+                   'dispense_clearance': 2, 'blow_out_height': 2.5, 'touch_tip_offset': -5, 'settle': 3,
+                   'contact_speed': None, 'travel_speed': None, 'calibration': None},
+    'dilute_library': {'aspirate': 4, 'dispense': 4, 'blow_out': 20, 'correction': 0.1, 'aspirate_clearance': None,
+                       'dispense_clearance': 2, 'blow_out_height': 3.5, 'touch_tip_offset': -5, 'settle': 3,
+                       'contact_speed': None, 'travel_speed': None, 'calibration': None},
+    'standards': {'aspirate': 4, 'dispense': 4, 'blow_out': 20, 'correction': -0.1, 'aspirate_clearance': 2.1,
+                  'dispense_clearance': 2, 'blow_out_height': 3.5, 'touch_tip_offset': -5, 'settle': 3,
+                  'contact_speed': None, 'travel_speed': None, 'calibration': None}
+    }
+
+# qPCR plate layout, one entry per dilution replicate as (dilution, replicate, 384 well row and column of the first sample column,
+# dilution plate aspirate height (mm)). Each sample column goes into every other 384 well column from there, and the 8 channels land
+# on every other 384 well row, so each replicate fills one quadrant of its plate half. Aspirate heights drop with each replicate as
+# the dilution plate wells empty
+qpcr_plate_layout = [
+    ('10k', 1, 'A', 1, 5), ('10k', 2, 'A', 2, 4.6), ('10k', 3, 'B', 1, 4.2),
+    ('20k', 1, 'A', 13, 7), ('20k', 2, 'A', 14, 6.6), ('20k', 3, 'B', 13, 6.2)]
+
+# Standards & NTCs replicates as (replicate, 384 well row and column), in quadrant 4 of the first 6 columns: B2, B4 and B6
+standards_layout = [(1, 'B', 2), (2, 'B', 4), (3, 'B', 6)]
+
+def load_liquid_classes(overrides):
+    """Return liquid_classes with overrides ({class name: {setting: value}}) applied."""
+    return {name: dict(settings, **overrides.get(name, {})) for name, settings in liquid_classes.items()}
+
+def set_volume(liquid_class, volume, pipette_type):
+    """Return the volume (uL) to set for volume uL to be delivered with liquid_class by a pipette_type pipette: from its gravimetric
+    calibration curve for pipette_type (delivered = slope*set + intercept, fit by calibrate.py) when it has one, else volume plus its
+    correction."""
+    calibration = (liquid_class['calibration'] or {}).get(pipette_type)
+    if calibration is not None:
+        slope, intercept = calibration
+        return (volume-intercept)/slope
+    return volume+liquid_class['correction']
+
+def apply_liquid_class(pipette, liquid_class):
+    """Set the flow rates, and any fixed well bottom clearances, of liquid_class on pipette."""
+    pipette.flow_rate.aspirate = liquid_class['aspirate']
+    pipette.flow_rate.dispense = liquid_class['dispense']
+    pipette.flow_rate.blow_out = liquid_class['blow_out']
+    if liquid_class['aspirate_clearance'] is not None:
+        pipette.well_bottom_clearance.aspirate = liquid_class['aspirate_clearance']
+    if liquid_class['dispense_clearance'] is not None:
+        pipette.well_bottom_clearance.dispense = liquid_class['dispense_clearance']
+
+def motion_profile(protocol_context, pipette, speed):
+    """Cap the Z speed (mm/s) of the mount pipette is on at speed, or lift the cap with None. max_speeds 'Z' is the left mount, 'A' the right."""
+    axis = 'Z' if pipette.mount == 'left' else 'A'
+    if speed is None:
+        protocol_context.max_speeds.pop(axis, None)
+    else:
+        protocol_context.max_speeds[axis] = speed
+
+def in_liquid(protocol_context, pipette, liquid_class, command, *args):
+    """Run pipette command (e.g. 'aspirate', its last argument the well) with the liquid_class motion profile. With a contact_speed,
+    the pipette first travels to the top of the well, unless already in it, so only the move down into the liquid runs at contact_speed.
+    Moves out and on to the next well run at travel_speed."""
+    well = args[-1]
+    last_location = protocol_context.location_cache
+    if liquid_class['contact_speed'] is not None and (last_location is None or not last_location.labware.is_well or last_location.labware.as_well() is not well):
+        pipette.move_to(well.top())
+    motion_profile(protocol_context, pipette, liquid_class['contact_speed'])
+    result = getattr(pipette, command)(*args)
+    motion_profile(protocol_context, pipette, liquid_class['travel_speed'])
+    return result
+
+def liquid_height(load_name, volume):
+    """Return the meniscus height (mm above the well bottom) of volume uL in one well of load_name."""
+    geometry = labware_geometry[load_name]
+    if geometry['shape'] == 'rectangular':
+        height = volume/(geometry['x']*geometry['y'])
+    else:
+        bottom_radius = geometry['bottom_diameter']/2
+        slope = (geometry['top_diameter']-geometry['bottom_diameter'])/2/geometry['depth']
+        height = (((3*slope*volume/math.pi)+bottom_radius**3)**(1/3)-bottom_radius)/slope
+    return min(max(height, 0), geometry['depth'])
+
+def aspirate_height(load_name, volume, aspirate_volume, immersion=2, minimum=1):
+    """Return the well bottom clearance that keeps the tip immersion mm below the meniscus left once aspirate_volume uL is drawn from volume uL."""
+    return max(minimum, liquid_height(load_name, volume-aspirate_volume)-immersion)
+
+def plan_fill(load_name, volume, max_volume, liquid_class, pipette_type, dispense_offset=0.1, blow_out_offset=0.6):
+    """Plan filling an empty well of load_name with volume uL in the fewest aspirates of at most max_volume uL. Returns one (aspirate
+    volume, dispense height, blow out height) per aspirate: an equal part of volume as set for liquid_class on pipette_type (see set_volume), dispensed
+    dispense_offset mm and blown out blow_out_offset mm above the meniscus the well fills to with that part."""
+    parts = 1
+    while parts < volume and set_volume(liquid_class, volume/parts, pipette_type) > max_volume:
+        parts += 1
+    levels = [liquid_height(load_name, volume*(p+1)/parts) for p in range(parts)]
+    return [(set_volume(liquid_class, volume/parts, pipette_type), level+dispense_offset, level+blow_out_offset) for level in levels]
+
+def settle(protocol_context, seconds):
+    """Let liquid drain down the tip for seconds before blowing out. A settle time of 0 skips the delay."""
+    if seconds > 0:
+        protocol_context.delay(seconds=seconds)
+
+def operator_prompts(protocol_context, prompts, batch=False):
+    """Pause for each of prompts in turn, blinking the rail lights between pauses. With batch, pause once on a numbered checklist of all prompts."""
+    if batch:
+        protocol_context.pause("  ".join(["{}. {}".format(i+1, prompt) for i, prompt in enumerate(prompts)]))
+        return
+    for i, prompt in enumerate(prompts):
+        if i > 0:
+            protocol_context.set_rail_lights(False)
+            protocol_context.delay(seconds=1)
+            protocol_context.set_rail_lights(True)
+        protocol_context.pause(prompt)
+
+def read_sample_sheet(sample_sheet, sample_number):
+    """Return {Initial Sample Plate well: sample ID} from the CSV sample_sheet text, one "Well,Sample" line per well (a header line is
+    skipped, wells with a blank sample are empty). Without a sample sheet, the first sample_number wells down the columns are numbered 1 on."""
+    if not sample_sheet.strip():
+        return {'{}{}'.format('ABCDEFGH'[i%8], (i//8)+1): str(i+1) for i in range(sample_number)}
+    sample_ids = {}
+    for line in csv.reader(sample_sheet.strip().splitlines()):
+        if len(line) < 2 or line[0].strip().lower() == 'well' or not line[1].strip():
+            continue
+        sample_ids[line[0].strip().upper()] = line[1].strip()
+    return sample_ids
+
+def sample_columns(sample_ids):
+    """Return the Initial Sample Plate columns (0 based, in order) holding at least one of sample_ids."""
+    return sorted(set(int(well[1:])-1 for well in sample_ids))
+
+def load_tip_state(tip_state_file):
+    """Return the tip inventory in tip_state_file as {tip rack load name: # of used columns on the partly used rack}. Without a
+    tip_state_file, or before its first run, every rack is full."""
+    if not tip_state_file or not os.path.exists(tip_state_file):
+        return {}
+    with open(tip_state_file) as state_file:
+        return json.load(state_file)
+
+def save_tip_state(protocol_context, tip_state_file, tip_state):
+    """Write tip_state to tip_state_file for the next run. Skipped when simulating, or without a tip_state_file."""
+    if not tip_state_file or protocol_context.is_simulating():
+        return
+    with open(tip_state_file, 'w') as state_file:
+        json.dump(tip_state, state_file)
+
+def plan_tip_racks(total_tips, used_columns, slots):
+    """Return the slots to load tip racks into for total_tips 8 channel tips, the # of used columns to skip on the first, partly used
+    rack, and the # of used columns of a partly used rack set aside for a later run (0 if none). A full rack replaces the partly used
+    one, which is set aside, if skipping its used columns would need more racks than there are slots."""
+    set_aside = 0
+    if math.ceil((total_tips+(used_columns*8))/96) > len(slots):
+        used_columns, set_aside = 0, used_columns
+    return slots[:math.ceil((total_tips+(used_columns*8))/96)], used_columns, set_aside
+
+def partly_used_note(used_columns, set_aside, slot):
+    """Return the note on the partly used tip rack for a "Load ... Tip Boxes" prompt: the slot it goes in, or that it is set aside."""
+    if used_columns:
+        return "(the partly used box, {} columns used, in position {})".format(str(used_columns), slot)
+    if set_aside:
+        return "(full boxes only: set the partly used box, {} columns used, aside for the next run)".format(str(set_aside))
+    return ""
+
+def next_tip_column(tipracks, used_columns):
+    """Return the first of tipracks still holding tips and its # of used columns, or (None, 0) once all are used up. used_columns is
+    the # of columns skipped on the first rack."""
+    columns = [(rack, i) for rack in tipracks for i in range(len(rack.columns()))][used_columns:]
+    return next(((rack, i) for rack, i in columns if rack.columns()[i][0].has_tip), (None, 0))
+
+# Volume ranges (uL) of the pipettes and tips, and the well capacities (uL) of the labware, the run values are checked against before the run
+pipette_volumes = {'p20_single_gen2': (1, 20), 'p20_multi_gen2': (1, 20), 'p300_single_gen2': (20, 300), 'p300_multi_gen2': (20, 300)}
+tip_volumes = {'opentrons_96_tiprack_20ul': 20, 'opentrons_96_tiprack_300ul': 300}
+well_volumes = {'agilent_4_well_73_ml_reagent_reservoir': 73000, 'perkinelmer_96_wellplate_2000ul': 2000, 'biorad_96_wellplate_200ul_pcr': 200,
+                'biorad_384_wellplate_50ul': 50}
+sample_wells = ['{}{}'.format(row, column) for column in range(1, 13) for row in 'ABCDEFGH']# IE the Initial Sample Plate wells
+
+def check_run_values(sample_ids, sample_sheet, sample_number, set_temperature, liquid_class_overrides, pipettes):
+    """Return the problems with the run values every protocol checks: the samples, the Temperature Module temperature, the liquid
+    class overrides and the pipettes ([(pipette type, mount)])."""
+    problems = []
+    if not sample_sheet.strip() and not 1 <= sample_number <= 96:
+        problems.append("sample_number is {}, use 1-96 samples.".format(sample_number))
+    elif sample_sheet.strip():
+        problems += ["Sample sheet well {} is not on the 96 well Initial Sample Plate.".format(well) for well in sample_ids if well not in sample_wells]
+        if not sample_ids:
+            problems.append("The sample sheet lists no samples.")
+    if not 4 <= set_temperature <= 95:
+        problems.append("set_temperature is {} C, the Temperature Module holds 4-95 C.".format(set_temperature))
+    for name, settings in liquid_class_overrides.items():
+        if name not in liquid_classes:
+            problems.append("liquid_classes overrides unknown liquid class {}, use one of {}.".format(name, ", ".join(liquid_classes)))
+            continue
+        problems += ["liquid_classes overrides unknown setting {} of {}.".format(setting, name) for setting in settings if setting not in liquid_classes[name]]
+    for pipette_type, mount in pipettes:
+        if pipette_type not in pipette_volumes:
+            problems.append("Pipette {} is not one of {}.".format(pipette_type, ", ".join(pipette_volumes)))
+        if mount not in ('left', 'right'):
+            problems.append("Pipette mount {} is not left or right.".format(mount))
+    if len(set(mount for pipette_type, mount in pipettes)) < len(pipettes):
+        problems.append("Both pipettes are on the {} mount.".format(pipettes[0][1]))
+    return problems
+
+def check_transfer(problems, transfer, volume, pipette_type, tip_name):
+    """Add to problems if volume uL (of transfer, e.g. "sample_volume_1") is outside the range of pipette_type with tip_name tips."""
+    if pipette_type not in pipette_volumes:
+        return
+    low, high = pipette_volumes[pipette_type][0], min(pipette_volumes[pipette_type][1], tip_volumes[tip_name])
+    if not low <= volume <= high:
+        problems.append("{} aspirates {:g} uL, outside the {:g}-{:g} uL range of the {} with {} tips.".format(transfer, volume, low, high, pipette_type, tip_name))
+
+def check_aliquots(problems, transfer, volume, dispense_offsets, pipette_type):
+    """Add to problems if a multi-dispense of volume uL (of transfer) has an aliquot below the minimum volume of pipette_type, with
+    dispense_offsets[i] added to the i-th aliquot as in multi_dispense."""
+    if pipette_type not in pipette_volumes:
+        return
+    smallest = min([volume]+[volume+offset for offset in dispense_offsets])
+    if smallest < pipette_volumes[pipette_type][0]:
+        problems.append("{} is multi-dispensed in aliquots down to {:g} uL, below the {:g} uL minimum of the {}.".format(transfer, smallest, pipette_volumes[pipette_type][0], pipette_type))
+
+def check_well(problems, contents, volume, load_name):
+    """Add to problems if volume uL (of contents, e.g. "Dilution Buffer in reservoir well A1") overfills a well of load_name."""
+    if volume > well_volumes[load_name]:
+        problems.append("{} comes to {:g} uL, more than the {:g} uL a well of {} holds.".format(contents, volume, well_volumes[load_name], load_name))
+
+def preflight(problems):
+    """Raise one ValueError listing all of problems. Run before the first prompt, so a run that cannot finish fails at the start (and
+    when the protocol is uploaded to the Opentrons App) rather than part way through. Nothing happens without problems."""
+    if problems:
+        raise ValueError("Pre-flight check failed, correct these run values and re-run the protocol: {}".format(
+            "  ".join(["{}. {}".format(i+1, problem) for i, problem in enumerate(problems)])))
+
+# Robot commands recorded in the run timeline, with the names of their positional arguments
+timed_commands = {
+    'aspirate': ('volume', 'location'), 'dispense': ('volume', 'location'), 'mix': ('repetitions', 'volume', 'location'),
+    'blow_out': ('location',), 'touch_tip': ('location',), 'move_to': ('location',), 'pick_up_tip': ('location',), 'drop_tip': ('location',), 'return_tip': (),
+    'reset_tipracks': (), 'delay': ('seconds', 'minutes'), 'pause': ('msg',), 'set_temperature': ('celsius',),
+    'start_set_temperature': ('celsius',), 'await_temperature': ('celsius',), 'deactivate': ()}
+
+def timeline_entry(command, phase, start, end, mount=None, volume=None, location=None):
+    """Return one run timeline line: the command, its phase (from the last "Phase: " comment), mount, volume, the well and column it
+    went to, and its start and end in seconds from the start of the run."""
+    well = location
+    if location is not None and not hasattr(location, 'well_name'):
+        labware = location.labware
+        well = labware.as_well() if labware.is_well else None
+    return dict(command=command, phase=phase, mount=mount, volume=volume, location=str(well) if well is not None else None,
+                column=int(well.well_name[1:]) if well is not None else None, start=round(start, 3), end=round(end, 3), seconds=round(end-start, 3))
+
+class Timed:
+    """Stand-in for the protocol context, a pipette or the temperature module that streams each of its timed_commands to the run
+    timeline as a JSON line. Instruments and modules loaded through a timed protocol context are timed too."""
+
+    def __init__(self, target, timeline):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_timeline', timeline)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if name in ('load_instrument', 'load_module'):
+            return lambda *args, **kwargs: Timed(attribute(*args, **kwargs), self._timeline)
+        if name == 'comment':
+            def comment(msg):
+                if msg.startswith('Phase: '):
+                    self._timeline['phase'] = msg[len('Phase: '):]
+                return attribute(msg)
+            return comment
+        if name not in timed_commands:
+            return attribute
+        def timed_command(*args, **kwargs):
+            start = time.monotonic()
+            result = attribute(*args, **kwargs)
+            arguments = dict(zip(timed_commands[name], args), **kwargs)
+            timeline = self._timeline
+            timeline['file'].write(json.dumps(timeline_entry(name, timeline['phase'], start-timeline['start'], time.monotonic()-timeline['start'],
+                getattr(self._target, 'mount', None), arguments.get('volume'), arguments.get('location')))+'\n')
+            return result
+        return timed_command
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+def timed(protocol_context, timeline_file):
+    """Return protocol_context streaming its run timeline to timeline_file (e.g. under /data on the robot), written a line at a time so
+    an aborted run keeps every command up to the abort. Without a timeline_file, or when simulating, protocol_context itself."""
+    if not timeline_file or protocol_context.is_simulating():
+        return protocol_context
+    return Timed(protocol_context, {'file': open(timeline_file, 'w', buffering=1), 'phase': 'Setup', 'start': time.monotonic()})
+
+class DryRun:
+    """Stand-in for the protocol context, a pipette or the temperature module in a dry run: a mechanical pass over the deck to check
+    its setup and labware calibration before committing samples. Every move and tip pick up of the run is kept, but delays and
+    temperature changes are skipped, mixes run once, Z speeds are never capped, flow rates go no lower than the pipette defaults
+    (floors) and tips go back to their racks instead of the trash, so none are used. Instruments and modules loaded through a dry run
+    protocol context dry run too."""
+
+    def __init__(self, target, floors=None):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_floors', floors or {})
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if name == 'load_instrument':
+            def load_instrument(*args, **kwargs):
+                pipette = attribute(*args, **kwargs)
+                return DryRun(pipette, {rate: getattr(pipette.flow_rate, rate) for rate in ('aspirate', 'dispense', 'blow_out')})
+            return load_instrument
+        if name == 'load_module':
+            return lambda *args, **kwargs: DryRun(attribute(*args, **kwargs))
+        if name == 'flow_rate':
+            return DryRun(attribute, self._floors)
+        if name == 'max_speeds':
+            return {}# IE contact_speed and travel_speed caps go nowhere
+        if name in ('delay', 'set_temperature', 'start_set_temperature', 'await_temperature'):
+            return lambda *args, **kwargs: None
+        if name == 'mix':
+            return lambda repetitions=1, *args, **kwargs: attribute(1, *args, **kwargs)
+        if name == 'drop_tip':
+            return lambda *args, **kwargs: self._target.return_tip()
+        return attribute
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, max(value, self._floors[name]) if name in self._floors else value)
+
+def dry_run(protocol_context, enabled):
+    """Return protocol_context dry running when enabled, else protocol_context itself."""
+    return DryRun(protocol_context) if enabled else protocol_context
+
+def close_timeline(protocol_context):
+    """Close the run timeline file of protocol_context if it is timed (see timed), under any dry run."""
+    while isinstance(protocol_context, (Timed, DryRun)):
+        if isinstance(protocol_context, Timed):
+            protocol_context._timeline['file'].close()
+        protocol_context = protocol_context._target
+
+def multi_dispense(protocol_context, pipette, volume, source, source_volume, targets, disposal_volume, dispense_offsets, liquid_class, channels=1):
+    """Fill each of targets with volume uL from as few aspirates of source as fit the tip already on pipette.
+
+    Every aspirate carries an extra disposal_volume that is blown back into source. dispense_offsets[i] is the
+    calibration correction (uL) for the i-th dispense of an aspirate, like the -0.3 uL single dispense Master Mix
+    correction. channels is the # of channels drawing from one source well. Each dispense settles and touches tip as set for
+    liquid_class, and the moves run at its speeds (see in_liquid). Returns the volume left in source.
+    """
+    while targets:
+        dispense_volumes = []
+        for i in range(len(targets)):
+            dispense_volume = volume+(dispense_offsets[i] if i < len(dispense_offsets) else 0)
+            if dispense_volumes and sum(dispense_volumes)+dispense_volume+disposal_volume > pipette.max_volume:
+                break
+            dispense_volumes.append(dispense_volume)
+        aspirate_volume = sum(dispense_volumes)+disposal_volume
+        pipette.well_bottom_clearance.aspirate = aspirate_height(source.parent.load_name, source_volume, channels*aspirate_volume)
+        in_liquid(protocol_context, pipette, liquid_class, 'aspirate', aspirate_volume, source)
+        for dispense_volume, target in zip(dispense_volumes, targets):
+            pipette.dispense(dispense_volume, target)
+            settle(protocol_context, liquid_class['settle'])
+            pipette.touch_tip(v_offset=liquid_class['touch_tip_offset'])
+        pipette.blow_out(source.top())
+        source_volume = source_volume-(channels*sum(dispense_volumes))
+        targets = targets[len(dispense_volumes):]
+    return source_volume
+
+def quadrant(row, column):
+    """Return the 384 well quadrant (1-4) of row and column: 1 for odd rows (A, C...) and odd columns, 2 for odd rows and even columns, 3 and 4 for even rows."""
+    return 1+(column+1)%2+(2 if (ord(row)-ord('A'))%2 else 0)
+
+def plate_map(col_num, plate_col_num=6):
+    """Return every multichannel transfer onto the qPCR plates for col_num dilution plate sample columns, in pipetting order.
+
+    Each transfer is a dict of plate (qPCR plate #, 1 based), content ('sample' or 'standards'), dilution ('10k', '20k' or None),
+    replicate, source_column (dilution plate column, None for Standards), well (384 well under the first channel), quadrant (1-4,
+    by the parity of the well row and column) and aspirate_height (dilution plate aspirate clearance, None for Standards). Each qPCR
+    plate takes up to plate_col_num sample columns.
+    """
+    transfers = []
+    for p in range(math.ceil(col_num/plate_col_num)):
+        first_col = p*plate_col_num# IE the first 96 well dilution plate column going onto this qPCR plate
+        for dilution, replicate, row, column, height in qpcr_plate_layout:
+            for e in range(min(plate_col_num, col_num-first_col)):
+                transfers.append(dict(plate=p+1, content='sample', dilution=dilution, replicate=replicate, source_column=first_col+e+1,
+                                      well='{}{}'.format(row, column+(2*e)), quadrant=quadrant(row, column), aspirate_height=height))
+        for replicate, row, column in standards_layout:
+            transfers.append(dict(plate=p+1, content='standards', dilution=None, replicate=replicate, source_column=None,
+                                  well='{}{}'.format(row, column), quadrant=quadrant(row, column), aspirate_height=None))
+    return transfers
+
+def transfer_quadrant(protocol_context, pipette, volume, sources, targets, aspirate_clearance, liquid_class, mix_repetitions=3):
+    """Transfer volume uL from each of sources into the matching column of targets with a fresh tip, mixing at the dispense clearance."""
+    for source, target in zip(sources, targets):
+        pipette.pick_up_tip()
+        pipette.well_bottom_clearance.aspirate = aspirate_clearance
+        in_liquid(protocol_context, pipette, liquid_class, 'aspirate', volume, source)
+        in_liquid(protocol_context, pipette, liquid_class, 'dispense', volume, target)
+        pipette.well_bottom_clearance.aspirate = liquid_class['dispense_clearance']
+        in_liquid(protocol_context, pipette, liquid_class, 'mix', mix_repetitions, volume, target)
+        settle(protocol_context, liquid_class['settle'])
+        pipette.blow_out(target.bottom(liquid_class['blow_out_height']))
+        pipette.touch_tip(v_offset=liquid_class['touch_tip_offset'])
+        pipette.drop_tip()
+
+def run(protocol_context):
+
+    [temp_deck, pipette_type, pipette_mount, pipette_type_2, pipette_mount_2, sample_number, starting_sample_volume, sample_volume_1, dilution_volume_1,
+     sample_volume_2, dilution_volume_2, sample_volume_3, dilution_volume_3, sample_volume, master_mix_volume, set_temperature, disposal_volume,
+     multi_dispense_mode, master_mix_disposal_volume, multi_dispense_offsets, liquid_class_overrides, batch_prompts, sample_sheet, tip_state_file, timeline_file, dry_run_mode] = get_values(  # noqa: F821
+        "temp_deck", "pipette_type", "pipette_mount", "pipette_type_2", "pipette_mount_2", "sample_number", "starting_sample_volume",
+        "sample_volume_1", "dilution_volume_1", "sample_volume_2", "dilution_volume_2", "sample_volume_3", "dilution_volume_3", "sample_volume",
+        "master_mix_volume", "set_temperature", "disposal_volume", "multi_dispense", "master_mix_disposal_volume", "multi_dispense_offsets", "liquid_classes", "batch_prompts", "sample_sheet", "tip_state_file", "timeline_file", "dry_run"
+    )
+    classes = load_liquid_classes(liquid_class_overrides)
+
+    # Optionally stream a timeline of every robot command to timeline_file, to compare measured phase times with estimate_runtime.py
+    protocol_context = timed(protocol_context, timeline_file)
+
+    # Optionally dry run with no reagents to check the deck setup and labware calibration: every move and tip pick up, no waits, and
+    # every tip back in its rack
+    protocol_context = dry_run(protocol_context, dry_run_mode)
+
+    # Turn Lights On
+    protocol_context.set_rail_lights(True)
+
+    #Math to make loops work for samples variables
+    # Only Initial Sample Plate columns holding a sample on the sample sheet are processed, packed into the first columns of the dilution plates in order
+    sample_ids = read_sample_sheet(sample_sheet, sample_number)
+    sample_cols = sample_columns([well for well in sample_ids if well in sample_wells])
+    col_num = len(sample_cols)# IE the total # columns you will be processing.
+    plate_col_num = 6# IE the max # of sample columns that fit on one 384 well qPCR plate (6 columns x 2 dilutions x 3 replicates + Standards & NTCs)
+
+    # Load Agilent 4 well 73 mL Reagent Reservoir
+    reagent_container = protocol_context.load_labware(
+        'agilent_4_well_73_ml_reagent_reservoir', '4')
+
+    # Load Temperature deck in Slot 10
+    temp_deck = protocol_context.load_module(temp_deck, '10')
+
+    # Start ramping the Temperature Module to the User Defined Variable now so it reaches temperature during deck setup
+    temp_deck.start_set_temperature(set_temperature)
+
+   # Populate temp_deck with final 1-20K 96 well PCR plate. Its spare columns double as the Reagent Plate, so Master Mix and Standards stay cold from set up
+    dilution_20k_plate = temp_deck.load_labware(
+        'biorad_96_wellplate_200ul_pcr')
+
+    # Load Inital Sample Plate 96 well plate in Slot 1. It is swapped for the 384 well qPCR plate once the 1:500 Transfer is done
+    sample_plate = protocol_context.load_labware(
+        'biorad_96_wellplate_200ul_pcr', '1', 'Sample plate')
+
+    # Load 1-500 2 mL 96 well dilution plate in Slot 2
+    dilution_500_plate = protocol_context.load_labware(
+        'perkinelmer_96_wellplate_2000ul', '2', 'dilution plate 1')
+
+    # Load 1-10k 96 well dilution plate in Slot 3
+    dilution_10k_plate = protocol_context.load_labware(
+        'biorad_96_wellplate_200ul_pcr', '3', 'dilution plate 2 10k plate')
+
+     # Define samples variables
+    samples_dilution_1 = [col for col in dilution_500_plate.rows()[0][:col_num]]
+    samples_dilution_2 = [col for col in dilution_10k_plate.rows()[0][:col_num]]
+    samples_dilution_3 = [col for col in dilution_20k_plate.rows()[0][:col_num]]
+
+    # Master Mix goes on the 20 uL pipette, one tip per 384 well column or, multi-dispensed, one per Master Mix column
+    master_mix_tip_cols = 2 if multi_dispense_mode else (col_num*6)+3
+
+    # Use one 300 uL tip per Dilution Buffer fill and one per sample for the 20k Transfer, tip rack goes in slot 5
+    # Optionally carry partly used tip racks over between runs. The tip inventory in tip_state_file (e.g. under /data on the robot) records
+    # the used columns of the partly used rack of each tip type, which goes in the first slot so pipetting starts from its first full column
+    tip_state = load_tip_state(tip_state_file)
+    total_tips = (col_num+3)*8
+    tip_name = 'opentrons_96_tiprack_300ul'
+    slots, used_columns, set_aside = plan_tip_racks(total_tips, tip_state.get(tip_name, 0), ['5'])
+    tipracks = [protocol_context.load_labware(tip_name, slot) for slot in slots]
+
+    # Use 20 uL tips for the 1:500 and 10k Transfers, the 6 replicate transfers per sample, the Standards and the Master Mix, tip racks go in slots 6-9 and 11
+    total_tips_2 = ((col_num*8)*2)+((col_num*8)*6)+24+(master_mix_tip_cols*8)
+    tip_name_2 = 'opentrons_96_tiprack_20ul'
+    slots_2, used_columns_2, set_aside_2 = plan_tip_racks(total_tips_2, tip_state.get(tip_name_2, 0), ['6', '7', '8', '9', '11'])
+    tiprack_num_2 = len(slots_2)
+
+    tipracks_2 = [protocol_context.load_labware(tip_name_2, slot_2) for slot_2 in slots_2]
+
+    # Telling Pippete Mount (left_pipette, in this case 300 ul multichannel) to use 300 uL tips
+    pipette = protocol_context.load_instrument(
+        pipette_type, pipette_mount, tip_racks=tipracks)
+
+    # Telling Pippete Mount 2(right pipette, in this case 20 ul multichannel) to use 20 uL tips
+    pipette_2 = protocol_context.load_instrument(
+        pipette_type_2, pipette_mount_2, tip_racks=tipracks_2)
+
+    if used_columns:
+        pipette.starting_tip = tipracks[0].columns()[used_columns][0]
+    if used_columns_2:
+        pipette_2.starting_tip = tipracks_2[0].columns()[used_columns_2][0]
+
+    # Define reagents and liquid waste. One reservoir well holds the Dilution Buffer for all 6 sample columns
+    buffer_wells = reagent_container.wells()[:1]
+    buffer_channels = 8# IE all 8 channels of the multichannel draw from the same reservoir well
+
+    # Define Reagent Source Columns on the 20k Dilution Plate, clear of the sample columns
+    # The Master Mix and Standards columns share the 20k Dilution Plate on the Temperature Module. Both are fully dispensed while the PE
+    # plate spins, before the 20k plate first leaves the module to be sealed, vortexed and spun, so only their dead volume goes with it
+    master_mix_cols = [10, 11]# IE Master Mix for the 10k replicates in Column 10, for the 20k replicates and Standards in Column 11
+    standards_col = 12# IE Standards & NTCs in Column 12
+    master_mix_sources = [dilution_20k_plate.columns()[c-1][0] for c in master_mix_cols]
+    standards_source = dilution_20k_plate.columns()[standards_col-1][0]
+
+    #Define User Deck Preparation
+    load_300_tip_boxes = len(slots)
+    load_20_tip_boxes = tiprack_num_2
+    col_1_Dilution_Buffer = math.ceil((((col_num*8)*(dilution_volume_1+dilution_volume_2+dilution_volume_3)+5000)/1000))
+    master_mix_dead_volume = 20+(master_mix_disposal_volume if multi_dispense_mode else 0)# IE uL left in each Master Mix column after the last aspirate, which multi-dispensed also draws the disposal volume
+    col_1_MM = math.ceil((((col_num*8)*3)*master_mix_volume)/8+master_mix_dead_volume)
+    col_2_MM = math.ceil(((((col_num*8)*3)+24)*master_mix_volume)/8+master_mix_dead_volume)
+    col_4_STDs = (sample_volume*3)+20
+
+    #Define Dilution Final Aspirate Volumes beyond tip capacity: the fewest parts of dilution_volume_1 that fit the tip, each with the heights it is dispensed and blown out at
+    fill_plan = plan_fill(dilution_500_plate.load_name, dilution_volume_1, pipette.max_volume, classes['buffer_1_500'], pipette_type)
+
+    # Pre-flight check of the run values against the pipette, tip and labware capacities, reported all at once before the first prompt
+    problems = check_run_values(sample_ids, sample_sheet, sample_number, set_temperature, liquid_class_overrides, [(pipette_type, pipette_mount), (pipette_type_2, pipette_mount_2)])
+    # The Reagent columns share the 20k Dilution Plate, and there is no deck room for a second qPCR plate
+    if col_num > plate_col_num:
+        problems.append("Sample number is out of range, use 48 samples (6 sample columns) or less. Please run Kapa_qPCR_Step1.py and Kapa_qPCR_Step2.py instead.")
+    if starting_sample_volume != 12:
+        problems.append("Starting sample volume is out of range, use 12uL only.")
+    if sample_volume_1 > starting_sample_volume:
+        problems.append("sample_volume_1 of {:g} uL is more than the {:g} uL starting_sample_volume.".format(sample_volume_1, starting_sample_volume))
+    for tips, racks, used, name, tip_slots in [(total_tips, len(slots), used_columns, '300 uL', 'position 5'), (total_tips_2, tiprack_num_2, used_columns_2, '20 uL', 'positions 6-9 and 11')]:
+        if tips+(used*8) > racks*96:
+            problems.append("The run needs {} {} tips, more than the Tip Boxes in {} hold.".format(tips, name, tip_slots))
+    for transfer, volume, class_name, extra_volume, pipette_name, rack_name in [
+            ("dilution_volume_2 plus disposal_volume", dilution_volume_2, 'buffer_10k', disposal_volume, pipette_type, tip_name),
+            ("dilution_volume_3 plus disposal_volume", dilution_volume_3, 'buffer_20k', disposal_volume, pipette_type, tip_name),
+            ("sample_volume_1", sample_volume_1, 'library_1_500', 0, pipette_type_2, tip_name_2),
+            ("sample_volume_2", sample_volume_2, 'library_10k', 0, pipette_type_2, tip_name_2),
+            ("sample_volume_3", sample_volume_3, 'library_20k', 0, pipette_type, tip_name),
+            ("sample_volume", sample_volume, 'dilute_library', 0, pipette_type_2, tip_name_2),
+            ("sample_volume (Standards & NTCs)", sample_volume, 'standards', 0, pipette_type_2, tip_name_2)]:
+        check_transfer(problems, transfer, set_volume(classes[class_name], volume, pipette_name)+extra_volume, pipette_name, rack_name)
+        if extra_volume:# IE multi-dispensed
+            check_aliquots(problems, transfer.replace(" plus disposal_volume", ""), set_volume(classes[class_name], volume, pipette_name), multi_dispense_offsets, pipette_name)
+    if multi_dispense_mode:
+        check_transfer(problems, "master_mix_volume plus master_mix_disposal_volume", set_volume(classes['master_mix'], master_mix_volume, pipette_type_2)+master_mix_disposal_volume, pipette_type_2, tip_name_2)
+        check_aliquots(problems, "master_mix_volume", set_volume(classes['master_mix'], master_mix_volume, pipette_type_2), multi_dispense_offsets, pipette_type_2)
+    else:
+        check_transfer(problems, "master_mix_volume", set_volume(classes['master_mix'], master_mix_volume, pipette_type_2), pipette_type_2, tip_name_2)
+    check_transfer(problems, "dilution_volume_1 in {} parts".format(len(fill_plan)), fill_plan[0][0], pipette_type, tip_name)
+    check_well(problems, "Dilution Buffer in reservoir well {}".format(buffer_wells[0].well_name), col_1_Dilution_Buffer*1000, reagent_container.load_name)
+    check_well(problems, "dilution_volume_1 plus sample_volume_1", dilution_volume_1+sample_volume_1, dilution_500_plate.load_name)
+    check_well(problems, "dilution_volume_2 plus sample_volume_2", dilution_volume_2+sample_volume_2, dilution_10k_plate.load_name)
+    check_well(problems, "dilution_volume_3 plus sample_volume_3", dilution_volume_3+sample_volume_3, dilution_20k_plate.load_name)
+    for contents, volume in [("Master Mix in column {}".format(master_mix_cols[0]), col_1_MM), ("Master Mix in column {}".format(master_mix_cols[1]), col_2_MM),
+                             ("Standards & NTCs in column {}".format(standards_col), col_4_STDs)]:
+        check_well(problems, "{} of the 20k Dilution Plate".format(contents), volume, dilution_20k_plate.load_name)
+    check_well(problems, "master_mix_volume plus sample_volume", master_mix_volume+sample_volume, 'biorad_384_wellplate_50ul')
+    preflight(problems)
+
+    #############################################################################################################################################################################
+    ##########################################################User Deck Preparation Prompts######################################################################################
+    #############################################################################################################################################################################
+    setup_prompts = [
+        "If not already present, load Temperature Module (Gen2) onto deck grid 10, plug in power & USB and press ON button. Wipe Down Deck with 70% Ethanol.",
+        """Label BioRad 96-well Hard Shell 20k Dilution Plate. Column {}- pipette {} uL Master Mix into all column wells. Column {}- pipette {} uL Master Mix into all column wells. Column {}- pipette {} uL Standards & NTCs into all column wells. Load onto Temperature Module on deck grid 10. Master Mix and Standards are all dispensed early in the run, before this plate leaves the Temperature Module""".format(str(master_mix_cols[0]), str(col_1_MM), str(master_mix_cols[1]), str(col_2_MM), str(standards_col), str(col_4_STDs)),
+        """Load {} 20 uL Tip Boxes onto deck positions in the following order: {} {}""".format(str(load_20_tip_boxes), ",".join(slots_2), partly_used_note(used_columns_2, set_aside_2, slots_2[0])),
+        """Load {} 300 uL Tip Box onto deck position 5 {}""".format(str(load_300_tip_boxes), partly_used_note(used_columns, set_aside, '5')),
+        """Load Agilent 73 mL Reagent Reservoir onto deck grid 4, then pipette {} mL Dilution Buffer (10mM TrisHCL, 0.5% Tween20) into Well {}.""".format(str(col_1_Dilution_Buffer), buffer_wells[0].well_name),
+        "Label BioRad 96-well Hard Shell Initial Sample Plate (Initial Dilution).Vortex Plate for 1 minute at Speed 10. Cnetirufe for 500 x g for 2 minutes.Load BioRad 96-well Hard Shell Initial Sample Plate onto deck grid 1.",
+        "Label and Load PE Pipetting Microplate, 2mL DW SQ 96-well plate onto deck grid 2",
+        "Label and Load BioRad 96-well Hard Shell 10k Dilution Plate onto deck grid 3",
+        "Have a BioRad Hardshell 384-well qPCR Plate ready, it is loaded after the 1:500 Transfer.",
+        "Review Deck Layout Photo. Make Sure All Plates are unsealed and tip rack overs are removed. Once you click resume, pipetting will begin!"]
+    operator_prompts(protocol_context, setup_prompts, batch_prompts)
+    ##############################################################################################################################################################################
+    ##############################################################################################################################################################################
+
+    #Turn off Deck Lights
+    protocol_context.set_rail_lights(False)
+
+    protocol_context.comment("Phase: Buffer Fill")
+
+    # Track the Dilution Buffer left in the reservoir well so the aspirate height follows the meniscus down
+    buffer_volume = col_1_Dilution_Buffer*1000
+    dilution_buffer = buffer_wells[0]
+
+    # Change Flow Rates
+    liquid_class = classes['buffer_1_500']
+    apply_liquid_class(pipette, liquid_class)
+
+    # Dispense Dilution Buffer to PE Pipetting Microplate 2mL DW SQ 96-well plate in parts, each dispensed above the last. One tip for all columns, as Dilution Buffer only goes into clean wells, pre-wet once with one mix of Dilution Buffer
+    pipette.pick_up_tip()
+    pre_wet = True
+    for target in samples_dilution_1:
+        for aspirate_volume, dispense_clearance, blow_out_height in fill_plan:
+            Dilution_Buffer_Well_Bottom = aspirate_height(reagent_container.load_name, buffer_volume, buffer_channels*aspirate_volume)
+            pipette.well_bottom_clearance.aspirate = Dilution_Buffer_Well_Bottom
+            if pre_wet:
+                pipette.well_bottom_clearance.dispense = Dilution_Buffer_Well_Bottom
+                in_liquid(protocol_context, pipette, liquid_class, 'mix', 1, aspirate_volume, dilution_buffer)
+                pre_wet = False
+            pipette.well_bottom_clearance.dispense = dispense_clearance
+            in_liquid(protocol_context, pipette, liquid_class, 'aspirate', aspirate_volume, dilution_buffer)
+            buffer_volume = buffer_volume-(buffer_channels*aspirate_volume)
+            pipette.dispense(aspirate_volume, target)
+            settle(protocol_context, liquid_class['settle'])
+            pipette.blow_out(target.bottom(blow_out_height))
+            pipette.touch_tip(v_offset=liquid_class['touch_tip_offset'])
+    pipette.drop_tip()
+
+    # Multi-dispense Dilution Buffer to the 10k and 20k Dilution Plates with one tip each
+    for class_name, dilution_volume, targets in [('buffer_10k', dilution_volume_2, samples_dilution_2), ('buffer_20k', dilution_volume_3, samples_dilution_3)]:
+        # Change Flow Rates
+        liquid_class = classes[class_name]
+        apply_liquid_class(pipette, liquid_class)
+        dilution_volume = set_volume(liquid_class, dilution_volume, pipette_type)
+
+        pipette.pick_up_tip()
+        buffer_volume = multi_dispense(protocol_context, pipette, dilution_volume, dilution_buffer, buffer_volume, targets, disposal_volume, multi_dispense_offsets, liquid_class, buffer_channels)
+        pipette.drop_tip()
+
+    # Change Flow Rates
+    liquid_class = classes['library_1_500']
+    sample_volume_1 = set_volume(liquid_class, sample_volume_1, pipette_type_2)
+
+    protocol_context.comment("Phase: 1:500 Transfer")
+
+    #Initial Sample Transfer to PE Pipetting Microplate 2mL DW SQ 96-well plate
+    for t in range(col_num):
+        samples_1 = sample_plate.rows()[0][sample_cols[t]]
+        dilutions_1 = dilution_500_plate.rows()[0][t]
+
+        pipette_2.pick_up_tip()
+        apply_liquid_class(pipette_2, liquid_class)
+        in_liquid(protocol_context, pipette_2, liquid_class, 'aspirate', sample_volume_1, samples_1)
+        in_liquid(protocol_context, pipette_2, liquid_class, 'dispense', sample_volume_1, dilutions_1)
+        pipette_2.well_bottom_clearance.aspirate = liquid_class['dispense_clearance']
+        in_liquid(protocol_context, pipette_2, liquid_class, 'mix', 1, sample_volume_1, dilutions_1)
+        settle(protocol_context, liquid_class['settle'])
+        pipette_2.blow_out(dilutions_1.bottom(liquid_class['blow_out_height']))
+        pipette_2.touch_tip(v_offset=liquid_class['touch_tip_offset'])
+        pipette_2.drop_tip()
+
+    protocol_context.set_rail_lights(True)
+
+    #################################################################################################################################################
+    ##########Prompt to Vortex PE Pipetting Microplate 2mL DW SQ 96-well plate and swap the Initial Sample Plate for the qPCR Plate####################
+    protocol_context.pause("Remove PE Pipetting Microplate 2mL DW SQ 96-well plate from deck grid 2. Seal Plate and Vortex(1 minute @ top speed). Remove Initial Sample Plate from deck grid 1. Seal Plate, and store at 4C until qPCR data analysis is complete. Remove Agilent 73 mL Reagent Reservoir to biohazard bin.")
+    protocol_context.set_rail_lights(False)
+    protocol_context.delay(seconds=1)
+    protocol_context.set_rail_lights(True)
+    protocol_context.pause("Load BioRad Hardshell 384-well qPCR Plate onto deck grid 1. Tape down with lab tape so side touches do not lift plate off of th deck. Centrifuge the PE plate now, Master Mix and Standards are dispensed while it spins. Once you click resume, pipetting will begin!")
+    ##############################################################################################################################################################################
+    ##############################################################################################################################################################################
+
+    #Turn off Deck Lights as MasterMix is Light Sensitive
+    protocol_context.set_rail_lights(False)
+
+    # Swap the Initial Sample Plate for the 384 well qPCR plate in Slot 1
+    del protocol_context.deck['1']
+    qPCR_plate = protocol_context.load_labware(
+        'biorad_384_wellplate_50ul', '1', 'qPCR plate')
+
+    # Group the transfers from the plate map into one pass per quadrant of each dilution, then one for the Standards & NTCs
+    plate_passes = [list(group) for key, group in itertools.groupby(plate_map(col_num, plate_col_num), key=lambda t: (t['dilution'], t['quadrant']))]
+    sample_passes = [group for group in plate_passes if group[0]['content'] == 'sample']
+    standards_targets = [qPCR_plate[t['well']] for group in plate_passes if group[0]['content'] == 'standards' for t in group]
+
+    # Wait for the Temperature Module to reach the User Defined Variable before Master Mix is dispensed
+    temp_deck.await_temperature(set_temperature)
+
+   #Define Master Mix Final Aspirate Volume
+    master_mix_volume = set_volume(classes['master_mix'], master_mix_volume, pipette_type_2)
+
+    #Define Sample Final Aspirate Volume
+    standards_volume = set_volume(classes['standards'], sample_volume, pipette_type_2)
+    sample_volume = set_volume(classes['dilute_library'], sample_volume, pipette_type_2)
+
+    protocol_context.comment("Phase: Master Mix")
+
+    # Define Master Mix Flow Rates
+    liquid_class = classes['master_mix']
+    apply_liquid_class(pipette_2, liquid_class)
+
+    # Master Mix targets per Master Mix column
+    master_mix_targets = [
+        [qPCR_plate[t['well']] for group in plate_passes if group[0]['dilution'] == '10k' for t in group],# Dilution Plate 1 Reps 1-3
+        [qPCR_plate[t['well']] for group in plate_passes if group[0]['dilution'] != '10k' for t in group]]# Dilution Plate 2 Reps 1-3 and Standards & NTCs
+    for master_mix_source, master_mix_source_volume, targets in zip(master_mix_sources, [col_1_MM, col_2_MM], master_mix_targets):
+
+        # Multi-dispense each Master Mix column with one tip, as MM only goes into clean wells
+        if multi_dispense_mode:
+            pipette_2.pick_up_tip()
+            multi_dispense(protocol_context, pipette_2, master_mix_volume, master_mix_source, master_mix_source_volume, targets, master_mix_disposal_volume, multi_dispense_offsets, liquid_class)
+            pipette_2.drop_tip()
+            continue
+
+        for target in targets:
+            pipette_2.pick_up_tip()
+            pipette_2.well_bottom_clearance.aspirate = aspirate_height(dilution_20k_plate.load_name, master_mix_source_volume, master_mix_volume)
+            in_liquid(protocol_context, pipette_2, liquid_class, 'aspirate', master_mix_volume, master_mix_source)
+            master_mix_source_volume = master_mix_source_volume-master_mix_volume
+            pipette_2.dispense(master_mix_volume, target)
+            settle(protocol_context, liquid_class['settle'])
+            pipette_2.blow_out(target.bottom(liquid_class['blow_out_height']))
+            pipette_2.touch_tip(v_offset=liquid_class['touch_tip_offset'])
+            pipette_2.drop_tip()
+
+    protocol_context.comment("Phase: Standards")
+
+    # Define Standards & NTCs Flow Rates and Aspiration Position
+    liquid_class = classes['standards']
+    apply_liquid_class(pipette_2, liquid_class)
+
+     # Dispense Standards & NTCs into qPCR Plate
+    transfer_quadrant(protocol_context, pipette_2, standards_volume, [standards_source]*len(standards_targets), standards_targets, liquid_class['aspirate_clearance'], liquid_class)
+
+    protocol_context.set_rail_lights(True)
+    protocol_context.pause("ReLoad PE Pipetting Microplate 2mL DW SQ 96-well plate onto deck grid 2. Remove seal. Once you click resume, pipetting will begin!")
+    protocol_context.set_rail_lights(False)
+
+    # Change Flow Rates
+    liquid_class = classes['library_10k']
+    sample_volume_2 = set_volume(liquid_class, sample_volume_2, pipette_type_2)
+
+    protocol_context.comment("Phase: 10k Transfer")
+
+    # PE Pipetting Microplate 2mL DW SQ 96-well plate Sample Transfer to Dilution 10K Plate
+    for t2 in range(col_num):
+        samples_2 = dilution_500_plate.rows()[0][t2]
+        dilutions_2 = dilution_10k_plate.rows()[0][t2]
+
+        pipette_2.pick_up_tip()
+        apply_liquid_class(pipette_2, liquid_class)
+        in_liquid(protocol_context, pipette_2, liquid_class, 'aspirate', sample_volume_2, samples_2)
+        in_liquid(protocol_context, pipette_2, liquid_class, 'dispense', sample_volume_2, dilutions_2)
+        pipette_2.well_bottom_clearance.aspirate = liquid_class['dispense_clearance']
+        in_liquid(protocol_context, pipette_2, liquid_class, 'mix', 1, sample_volume_2, dilutions_2)
+        settle(protocol_context, liquid_class['settle'])
+        pipette_2.blow_out(dilutions_2.bottom(liquid_class['blow_out_height']))
+        pipette_2.touch_tip(v_offset=liquid_class['touch_tip_offset'])
+        pipette_2.drop_tip()
+
+    protocol_context.set_rail_lights(True)
+
+    #############################################################################################################################################################################
+    ##########################################Prompt to Vortex 10k Dilution Plate and Centrifuge qPCR BioRad Hard Shell 384-well plate in the same spin##########################
+    #############################################################################################################################################################################
+    protocol_context.pause("Remove 10k Dilution BioRad Hard Shell 96-well plate from deck grid 3. Seal Plate and Vortex(1 minute @ top speed). Remove qPCR BioRad Hard Shell 384-well plate from deck grid 1. Seal Plate.")
+    protocol_context.set_rail_lights(False)
+    protocol_context.delay(seconds=1)
+    protocol_context.set_rail_lights(True)
+    protocol_context.pause("Centrifuge both plates briefly (@1500 rpm, 2 minutes). ReLoad 10k Dilution BioRad Hard Shell 96-well plate onto deck grid 3 and qPCR BioRad Hard Shell 384-well plate onto deck grid 1. Remove seals. Re-Tape qPCR Plate to Deck. Empty Trash! Once you click resume, pipetting will begin!")
+    ##############################################################################################################################################################################
+    ##############################################################################################################################################################################
+
+    protocol_context.set_rail_lights(False)
+
+    # Change Flow Rates
+    liquid_class = classes['library_20k']
+    sample_volume_3 = set_volume(liquid_class, sample_volume_3, pipette_type)
+
+    protocol_context.comment("Phase: 20k Transfer")
+
+    # Dilution 10K Plate Sample Transfer to Dilution 20K Plate
+    for t3 in range(col_num):
+        samples_3 = dilution_10k_plate.rows()[0][t3]
+        dilutions_3 = dilution_20k_plate.rows()[0][t3]
+
+        pipette.pick_up_tip()
+        apply_liquid_class(pipette, liquid_class)
+        in_liquid(protocol_context, pipette, liquid_class, 'aspirate', sample_volume_3, samples_3)
+        in_liquid(protocol_context, pipette, liquid_class, 'dispense', sample_volume_3, dilutions_3)
+        pipette.well_bottom_clearance.aspirate = liquid_class['dispense_clearance']
+        in_liquid(protocol_context, pipette, liquid_class, 'mix', 1, sample_volume_3, dilutions_3)
+        settle(protocol_context, liquid_class['settle'])
+        pipette.blow_out(dilutions_3.bottom(liquid_class['blow_out_height']))
+        pipette.touch_tip(v_offset=liquid_class['touch_tip_offset'])
+        pipette.drop_tip()
+
+    protocol_context.set_rail_lights(True)
+
+    #############################################################################################################################################################################
+    ##########################################################Prompt to Vortex 20k Dilution BioRad Hard Shell 96-well plate######################################################
+    #############################################################################################################################################################################
+    protocol_context.pause("Remove 20k Dilution BioRad Hard Shell 96-well plate from Temperature Module on deck grid 10. Master Mix and Standards are already in the qPCR plate, Columns {}, {} and {} only hold their leftover dead volume. Seal Plate and Vortex(1 minute @ top speed). Centrifuge Briefly(@1500 rpm, 2 minutes). The 10k replicates are pipetted meanwhile, once you click resume, pipetting will begin!".format(str(master_mix_cols[0]), str(master_mix_cols[1]), str(standards_col)))
+    protocol_context.set_rail_lights(False)
+
+    protocol_context.comment("Phase: Sample Quadrants")
+
+    # Define Sample Transfer Flow Rates
+    liquid_class = classes['dilute_library']
+    apply_liquid_class(pipette_2, liquid_class)
+
+    # Transfer Dilution Plate 10K to Quadrants 1-3 of qPCR Plate, at the plate map aspiration position of each replicate
+    for group in sample_passes:
+        if group[0]['dilution'] == '10k':
+            transfer_quadrant(protocol_context, pipette_2, sample_volume, [dilution_10k_plate.rows()[0][t['source_column']-1] for t in group], [qPCR_plate[t['well']] for t in group], group[0]['aspirate_height'], liquid_class)
+
+    protocol_context.set_rail_lights(True)
+    protocol_context.pause("ReLoad 20k Dilution BioRad Hard Shell 96-well plate onto Temperature Module on deck grid 10. Remove seal. Only the 20k dilutions are pipetted from it now, the Master Mix and Standards columns are used up. Once you click resume, pipetting will begin!")
+    protocol_context.set_rail_lights(False)
+
+    # Transfer Dilution Plate 20K to Quadrants 1-3 of qPCR Plate
+    for group in sample_passes:
+        if group[0]['dilution'] == '20k':
+            transfer_quadrant(protocol_context, pipette_2, sample_volume, [dilution_20k_plate.rows()[0][t['source_column']-1] for t in group], [qPCR_plate[t['well']] for t in group], group[0]['aspirate_height'], liquid_class)
+
+    protocol_context.set_rail_lights(True)
+
+    # Turn off Temperature Deck
+    temp_deck.deactivate()
+
+    ################################################################################################################################################################################
+    ######################################################################Deck Unloading Instructions###############################################################################
+    ################################################################################################################################################################################
+    # Record the partly used tip rack of each tip type for the next run
+    tip_prompts = []
+    for racks, used, aside in [(tipracks, used_columns, set_aside), (tipracks_2, used_columns_2, set_aside_2)]:
+        if aside:# IE the partly used rack set aside before the run keeps its tip state
+            tip_prompts.append("""Keep the partly used {} uL Tip Box set aside before the run ({} columns used) for the next run.""".format(str(tip_volumes[racks[0].load_name]), str(aside)))
+            continue
+        rack, tip_state[racks[0].load_name] = next_tip_column(racks, used)
+        if rack and tip_state[rack.load_name]:
+            tip_prompts.append("""Keep the partly used Tip Box in position {} ({} columns used) for the next run.""".format(rack.parent, str(tip_state[rack.load_name])))
+    if not dry_run_mode:# IE a dry run puts every tip back
+        save_tip_state(protocol_context, tip_state_file, tip_state)
+
+    teardown_prompts = [
+        "Please remove Tip Waste from deck grid 12 to biohazard bin.",
+        "Remove 10k and 20k Dilution Plates from deck grid 3 & 10. Seal Plates and store on ice until qPCR data analysis is complete.",
+        "Remove PE Pipetting Microplate 2mL DW SQ 96-well plate from deck grid 2 to biohazard bin.",
+        "Seal qPCR plate with MicroAmp Optical Adhesive Cover and remove from deck.",
+        "Remove Tip Boxes from deck. Wipe Down Deck with 70% Ethanol. Once you click 'Resume', pipette head will raise and script will end!"]
+    if tip_state_file and not dry_run_mode:
+        teardown_prompts[-1:-1] = tip_prompts
+    operator_prompts(protocol_context, teardown_prompts, batch_prompts)
+    ################################################################################################################################################################################
+    ################################################################################################################################################################################
+
+    protocol_context.set_rail_lights(False)
+
+    # Close the run timeline, if one was streamed
+    close_timeline(protocol_context)
+
+if __name__ == '__main__':
+    from opentrons import simulate
+    protocol = simulate.get_protocol_api('2.10')
+    run(protocol)
+    for line in protocol.commands():
+        print(line)
@@ -12,8 +12,9 @@ __date__ = "2021-08-23"
 
 import math
 import json
-from opentrons import protocol_api, types #needed for trying to set specific pipette movements before pipetting
-from opentrons import simulate
+import csv
+import os
+import time
 
 
 def get_values(*names):
@@ -30,7 +31,16 @@ def get_values(*names):
     "sample_volume_2":5,
     "dilution_volume_3":40,
     "sample_volume_3":40,
-    "set_temperature":4}""")
+    "set_temperature":4,
+    "multi_dispense":false,
+    "disposal_volume":20,
+    "multi_dispense_offsets":[],
+    "liquid_classes":{},
+    "batch_prompts":false,
+    "sample_sheet":"",
+    "tip_state_file":"",
+    "timeline_file":"",
+    "dry_run":false}""")
     return [_all_values[n] for n in names]
 
 metadata = {
@@ -40,15 +50,399 @@ metadata = {
     'apiLevel': '2.10', 'softwareLevel': '4.50'
     }
 
+# Approximate inner well geometry (mm) used to turn a tracked liquid volume into a meniscus height. Rectangular wells have a flat cross section, the BioRad PCR wells are a cone frustum
+labware_geometry = {
+    'agilent_4_well_73_ml_reagent_reservoir': {'shape': 'rectangular', 'x': 25.9, 'y': 71.9, 'depth': 39.22},
+    'perkinelmer_96_wellplate_2000ul': {'shape': 'rectangular', 'x': 8.0, 'y': 8.0, 'depth': 41.0},
+    'biorad_96_wellplate_200ul_pcr': {'shape': 'frustum', 'bottom_diameter': 2.68, 'top_diameter': 5.46, 'depth': 14.81}
+    }
+
+# Liquid classes, one per transfer: flow rates (uL/s), volume correction (uL added to the set volume), well bottom clearances and
+# blow out heights (mm), touch tip offset (mm), settle time (s) before blow out, and the mount Z speeds (mm/s) of moves into liquid
+# (contact_speed) and between wells (travel_speed). A clearance or blow out height of None is set by liquid tracking, a speed of None
+# is the full mount speed. calibration is a gravimetric [slope, intercept] curve of delivered against set uL per pipette model
+# ({pipette type: [slope, intercept]}), fit by calibrate.py, used in place of correction for that pipette when set. Any setting can be overridden per run through the "liquid_classes" field of get_values
+liquid_classes = {
+    # Dilution Buffer into the PE 2mL plate, dispensed in as few parts as fit the tip (4 for 998 uL), each just above the meniscus it
+    # rises to. Aspirate at 94, the pipette default speed, so
+    # dispense can be very low for accuracy. 250 and 95 leave a decent amount of volume in tips when blowout. at 250 the volume is
+    # moving too fast for the buffer to escape surface tension. Still happens at 30, but less so. 15 looks great, but is SLOWWWWW.
+    # 22.5 takes 4 minutes per column and is reproducible to +/- 2 uL, and at best Opentrons promises +/-1.5 uL. The -0.8 correction
+    # accounts for the pipette overdelivering an average of 0.8 uL per transfer
+    'buffer_1_500': {'aspirate': 94, 'dispense': 22.5, 'blow_out': 299, 'correction': -0.8, 'aspirate_clearance': None,
+                     'dispense_clearance': None, 'blow_out_height': None, 'touch_tip_offset': -5, 'settle': 3,
+                     'contact_speed': 20, 'travel_speed': None, 'calibration': None},
+    # Dilution Buffer into the 10k plate. Dispense of 95 tested empirically, gives better results than orignal set point of 250 JSB 08/30/21.
+    # Giving a value of 95 to dispense actually yields 96 uL, so the set volume is corrected to 94
+    'buffer_10k': {'aspirate': 35, 'dispense': 95, 'blow_out': 299, 'correction': -1, 'aspirate_clearance': None,
+                   'dispense_clearance': 10, 'blow_out_height': 9.5, 'touch_tip_offset': -5, 'settle': 3,
+                   'contact_speed': 20, 'travel_speed': None, 'calibration': None},
+    # Dilution Buffer into the 20k plate. Giving a value of 36 to dispense actually yields 40-41 uL
+    'buffer_20k': {'aspirate': 35, 'dispense': 95, 'blow_out': 299, 'correction': -4, 'aspirate_clearance': None,
+                   'dispense_clearance': 8, 'blow_out_height': 4, 'touch_tip_offset': -5, 'settle': 3,
+                   'contact_speed': 20, 'travel_speed': None, 'calibration': None},
+    # Library from the Initial Sample Plate (12 uL starting volume) into the PE 2mL plate, mixed at the dispense clearance
+    'library_1_500': {'aspirate': 2, 'dispense': 2, 'blow_out': 20, 'correction': 0, 'aspirate_clearance': 0.2,
+                      'dispense_clearance': 16.5, 'blow_out_height': 17, 'touch_tip_offset': -5, 'settle': 3,
+                      'contact_speed': None, 'travel_speed': None, 'calibration': None},
+    # Dilute library from the PE 2mL plate into the 10k plate
+    'library_10k': {'aspirate': 5, 'dispense': 5, 'blow_out': 20, 'correction': 0, 'aspirate_clearance': 15,
+                    'dispense_clearance': 8, 'blow_out_height': 9, 'touch_tip_offset': -5, 'settle': 3,
+                    'contact_speed': None, 'travel_speed': None, 'calibration': None},
+    # Dilute library from the 10k plate into the 20k plate, with the 300 uL pipette
+    'library_20k': {'aspirate': 40, 'dispense': 22.5, 'blow_out': 299, 'correction': 0, 'aspirate_clearance': 5,
+                    'dispense_clearance': 5, 'blow_out_height': 5.5, 'touch_tip_offset': -5, 'settle': 3,
+                    'contact_speed': 20, 'travel_speed': None, 'calibration': None}
+    }
+
+def load_liquid_classes(overrides):
+    """Return liquid_classes with overrides ({class name: {setting: value}}) applied."""
+    return {name: dict(settings, **overrides.get(name, {})) for name, settings in liquid_classes.items()}
+
+def set_volume(liquid_class, volume, pipette_type):
+    """Return the volume (uL) to set for volume uL to be delivered with liquid_class by a pipette_type pipette: from its gravimetric
+    calibration curve for pipette_type (delivered = slope*set + intercept, fit by calibrate.py) when it has one, else volume plus its
+    correction."""
+    calibration = (liquid_class['calibration'] or {}).get(pipette_type)
+    if calibration is not None:
+        slope, intercept = calibration
+        return (volume-intercept)/slope
+    return volume+liquid_class['correction']
+
+def apply_liquid_class(pipette, liquid_class):
+    """Set the flow rates, and any fixed well bottom clearances, of liquid_class on pipette."""
+    pipette.flow_rate.aspirate = liquid_class['aspirate']
+    pipette.flow_rate.dispense = liquid_class['dispense']
+    pipette.flow_rate.blow_out = liquid_class['blow_out']
+    if liquid_class['aspirate_clearance'] is not None:
+        pipette.well_bottom_clearance.aspirate = liquid_class['aspirate_clearance']
+    if liquid_class['dispense_clearance'] is not None:
+        pipette.well_bottom_clearance.dispense = liquid_class['dispense_clearance']
+
+def motion_profile(protocol_context, pipette, speed):
+    """Cap the Z speed (mm/s) of the mount pipette is on at speed, or lift the cap with None. max_speeds 'Z' is the left mount, 'A' the right."""
+    axis = 'Z' if pipette.mount == 'left' else 'A'
+    if speed is None:
+        protocol_context.max_speeds.pop(axis, None)
+    else:
+        protocol_context.max_speeds[axis] = speed
+
+def in_liquid(protocol_context, pipette, liquid_class, command, *args):
+    """Run pipette command (e.g. 'aspirate', its last argument the well) with the liquid_class motion profile. With a contact_speed,
+    the pipette first travels to the top of the well, unless already in it, so only the move down into the liquid runs at contact_speed.
+    Moves out and on to the next well run at travel_speed."""
+    well = args[-1]
+    last_location = protocol_context.location_cache
+    if liquid_class['contact_speed'] is not None and (last_location is None or not last_location.labware.is_well or last_location.labware.as_well() is not well):
+        pipette.move_to(well.top())
+    motion_profile(protocol_context, pipette, liquid_class['contact_speed'])
+    result = getattr(pipette, command)(*args)
+    motion_profile(protocol_context, pipette, liquid_class['travel_speed'])
+    return result
+
+def liquid_height(load_name, volume):
+    """Return the meniscus height (mm above the well bottom) of volume uL in one well of load_name."""
+    geometry = labware_geometry[load_name]
+    if geometry['shape'] == 'rectangular':
+        height = volume/(geometry['x']*geometry['y'])
+    else:
+        bottom_radius = geometry['bottom_diameter']/2
+        slope = (geometry['top_diameter']-geometry['bottom_diameter'])/2/geometry['depth']
+        height = (((3*slope*volume/math.pi)+bottom_radius**3)**(1/3)-bottom_radius)/slope
+    return min(max(height, 0), geometry['depth'])
+
+def aspirate_height(load_name, volume, aspirate_volume, immersion=2, minimum=1):
+    """Return the well bottom clearance that keeps the tip immersion mm below the meniscus left once aspirate_volume uL is drawn from volume uL."""
+    return max(minimum, liquid_height(load_name, volume-aspirate_volume)-immersion)
+
+def plan_fill(load_name, volume, max_volume, liquid_class, pipette_type, dispense_offset=0.1, blow_out_offset=0.6):
+    """Plan filling an empty well of load_name with volume uL in the fewest aspirates of at most max_volume uL. Returns one (aspirate
+    volume, dispense height, blow out height) per aspirate: an equal part of volume as set for liquid_class on pipette_type (see set_volume), dispensed
+    dispense_offset mm and blown out blow_out_offset mm above the meniscus the well fills to with that part."""
+    parts = 1
+    while parts < volume and set_volume(liquid_class, volume/parts, pipette_type) > max_volume:
+        parts += 1
+    levels = [liquid_height(load_name, volume*(p+1)/parts) for p in range(parts)]
+    return [(set_volume(liquid_class, volume/parts, pipette_type), level+dispense_offset, level+blow_out_offset) for level in levels]
+
+def settle(protocol_context, seconds):
+    """Let liquid drain down the tip for seconds before blowing out. A settle time of 0 skips the delay."""
+    if seconds > 0:
+        protocol_context.delay(seconds=seconds)
+
+def operator_prompts(protocol_context, prompts, batch=False):
+    """Pause for each of prompts in turn, blinking the rail lights between pauses. With batch, pause once on a numbered checklist of all prompts."""
+    if batch:
+        protocol_context.pause("  ".join(["{}. {}".format(i+1, prompt) for i, prompt in enumerate(prompts)]))
+        return
+    for i, prompt in enumerate(prompts):
+        if i > 0:
+            protocol_context.set_rail_lights(False)
+            protocol_context.delay(seconds=1)
+            protocol_context.set_rail_lights(True)
+        protocol_context.pause(prompt)
+
+def read_sample_sheet(sample_sheet, sample_number):
+    """Return {Initial Sample Plate well: sample ID} from the CSV sample_sheet text, one "Well,Sample" line per well (a header line is
+    skipped, wells with a blank sample are empty). Without a sample sheet, the first sample_number wells down the columns are numbered 1 on."""
+    if not sample_sheet.strip():
+        return {'{}{}'.format('ABCDEFGH'[i%8], (i//8)+1): str(i+1) for i in range(sample_number)}
+    sample_ids = {}
+    for line in csv.reader(sample_sheet.strip().splitlines()):
+        if len(line) < 2 or line[0].strip().lower() == 'well' or not line[1].strip():
+            continue
+        sample_ids[line[0].strip().upper()] = line[1].strip()
+    return sample_ids
+
+def sample_columns(sample_ids):
+    """Return the Initial Sample Plate columns (0 based, in order) holding at least one of sample_ids."""
+    return sorted(set(int(well[1:])-1 for well in sample_ids))
+
+def load_tip_state(tip_state_file):
+    """Return the tip inventory in tip_state_file as {tip rack load name: # of used columns on the partly used rack}. Without a
+    tip_state_file, or before its first run, every rack is full."""
+    if not tip_state_file or not os.path.exists(tip_state_file):
+        return {}
+    with open(tip_state_file) as state_file:
+        return json.load(state_file)
+
+def save_tip_state(protocol_context, tip_state_file, tip_state):
+    """Write tip_state to tip_state_file for the next run. Skipped when simulating, or without a tip_state_file."""
+    if not tip_state_file or protocol_context.is_simulating():
+        return
+    with open(tip_state_file, 'w') as state_file:
+        json.dump(tip_state, state_file)
+
+def plan_tip_racks(total_tips, used_columns, slots):
+    """Return the slots to load tip racks into for total_tips 8 channel tips, the # of used columns to skip on the first, partly used
+    rack, and the # of used columns of a partly used rack set aside for a later run (0 if none). A full rack replaces the partly used
+    one, which is set aside, if skipping its used columns would need more racks than there are slots."""
+    set_aside = 0
+    if math.ceil((total_tips+(used_columns*8))/96) > len(slots):
+        used_columns, set_aside = 0, used_columns
+    return slots[:math.ceil((total_tips+(used_columns*8))/96)], used_columns, set_aside
+
+def partly_used_note(used_columns, set_aside, slot):
+    """Return the note on the partly used tip rack for a "Load ... Tip Boxes" prompt: the slot it goes in, or that it is set aside."""
+    if used_columns:
+        return "(the partly used box, {} columns used, in position {})".format(str(used_columns), slot)
+    if set_aside:
+        return "(full boxes only: set the partly used box, {} columns used, aside for the next run)".format(str(set_aside))
+    return ""
+
+def next_tip_column(tipracks, used_columns):
+    """Return the first of tipracks still holding tips and its # of used columns, or (None, 0) once all are used up. used_columns is
+    the # of columns skipped on the first rack."""
+    columns = [(rack, i) for rack in tipracks for i in range(len(rack.columns()))][used_columns:]
+    return next(((rack, i) for rack, i in columns if rack.columns()[i][0].has_tip), (None, 0))
+
+# Volume ranges (uL) of the pipettes and tips, and the well capacities (uL) of the labware, the run values are checked against before the run
+pipette_volumes = {'p20_single_gen2': (1, 20), 'p20_multi_gen2': (1, 20), 'p300_single_gen2': (20, 300), 'p300_multi_gen2': (20, 300)}
+tip_volumes = {'opentrons_96_tiprack_20ul': 20, 'opentrons_96_tiprack_300ul': 300}
+well_volumes = {'agilent_4_well_73_ml_reagent_reservoir': 73000, 'perkinelmer_96_wellplate_2000ul': 2000, 'biorad_96_wellplate_200ul_pcr': 200}
+sample_wells = ['{}{}'.format(row, column) for column in range(1, 13) for row in 'ABCDEFGH']# IE the Initial Sample Plate wells
+
+def check_run_values(sample_ids, sample_sheet, sample_number, set_temperature, liquid_class_overrides, pipettes):
+    """Return the problems with the run values every protocol checks: the samples, the Temperature Module temperature, the liquid
+    class overrides and the pipettes ([(pipette type, mount)])."""
+    problems = []
+    if not sample_sheet.strip() and not 1 <= sample_number <= 96:
+        problems.append("sample_number is {}, use 1-96 samples.".format(sample_number))
+    elif sample_sheet.strip():
+        problems += ["Sample sheet well {} is not on the 96 well Initial Sample Plate.".format(well) for well in sample_ids if well not in sample_wells]
+        if not sample_ids:
+            problems.append("The sample sheet lists no samples.")
+    if not 4 <= set_temperature <= 95:
+        problems.append("set_temperature is {} C, the Temperature Module holds 4-95 C.".format(set_temperature))
+    for name, settings in liquid_class_overrides.items():
+        if name not in liquid_classes:
+            problems.append("liquid_classes overrides unknown liquid class {}, use one of {}.".format(name, ", ".join(liquid_classes)))
+            continue
+        problems += ["liquid_classes overrides unknown setting {} of {}.".format(setting, name) for setting in settings if setting not in liquid_classes[name]]
+    for pipette_type, mount in pipettes:
+        if pipette_type not in pipette_volumes:
+            problems.append("Pipette {} is not one of {}.".format(pipette_type, ", ".join(pipette_volumes)))
+        if mount not in ('left', 'right'):
+            problems.append("Pipette mount {} is not left or right.".format(mount))
+    if len(set(mount for pipette_type, mount in pipettes)) < len(pipettes):
+        problems.append("Both pipettes are on the {} mount.".format(pipettes[0][1]))
+    return problems
+
+def check_transfer(problems, transfer, volume, pipette_type, tip_name):
+    """Add to problems if volume uL (of transfer, e.g. "sample_volume_1") is outside the range of pipette_type with tip_name tips."""
+    if pipette_type not in pipette_volumes:
+        return
+    low, high = pipette_volumes[pipette_type][0], min(pipette_volumes[pipette_type][1], tip_volumes[tip_name])
+    if not low <= volume <= high:
+        problems.append("{} aspirates {:g} uL, outside the {:g}-{:g} uL range of the {} with {} tips.".format(transfer, volume, low, high, pipette_type, tip_name))
+
+def check_aliquots(problems, transfer, volume, dispense_offsets, pipette_type):
+    """Add to problems if a multi-dispense of volume uL (of transfer) has an aliquot below the minimum volume of pipette_type, with
+    dispense_offsets[i] added to the i-th aliquot as in multi_dispense."""
+    if pipette_type not in pipette_volumes:
+        return
+    smallest = min([volume]+[volume+offset for offset in dispense_offsets])
+    if smallest < pipette_volumes[pipette_type][0]:
+        problems.append("{} is multi-dispensed in aliquots down to {:g} uL, below the {:g} uL minimum of the {}.".format(transfer, smallest, pipette_volumes[pipette_type][0], pipette_type))
+
+def check_well(problems, contents, volume, load_name):
+    """Add to problems if volume uL (of contents, e.g. "Dilution Buffer in reservoir well A1") overfills a well of load_name."""
+    if volume > well_volumes[load_name]:
+        problems.append("{} comes to {:g} uL, more than the {:g} uL a well of {} holds.".format(contents, volume, well_volumes[load_name], load_name))
+
+def preflight(problems):
+    """Raise one ValueError listing all of problems. Run before the first prompt, so a run that cannot finish fails at the start (and
+    when the protocol is uploaded to the Opentrons App) rather than part way through. Nothing happens without problems."""
+    if problems:
+        raise ValueError("Pre-flight check failed, correct these run values and re-run the protocol: {}".format(
+            "  ".join(["{}. {}".format(i+1, problem) for i, problem in enumerate(problems)])))
+
+# Robot commands recorded in the run timeline, with the names of their positional arguments
+timed_commands = {
+    'aspirate': ('volume', 'location'), 'dispense': ('volume', 'location'), 'mix': ('repetitions', 'volume', 'location'),
+    'blow_out': ('location',), 'touch_tip': ('location',), 'move_to': ('location',), 'pick_up_tip': ('location',), 'drop_tip': ('location',), 'return_tip': (),
+    'reset_tipracks': (), 'delay': ('seconds', 'minutes'), 'pause': ('msg',), 'set_temperature': ('celsius',),
+    'start_set_temperature': ('celsius',), 'await_temperature': ('celsius',), 'deactivate': ()}
+
+def timeline_entry(command, phase, start, end, mount=None, volume=None, location=None):
+    """Return one run timeline line: the command, its phase (from the last "Phase: " comment), mount, volume, the well and column it
+    went to, and its start and end in seconds from the start of the run."""
+    well = location
+    if location is not None and not hasattr(location, 'well_name'):
+        labware = location.labware
+        well = labware.as_well() if labware.is_well else None
+    return dict(command=command, phase=phase, mount=mount, volume=volume, location=str(well) if well is not None else None,
+                column=int(well.well_name[1:]) if well is not None else None, start=round(start, 3), end=round(end, 3), seconds=round(end-start, 3))
+
+class Timed:
+    """Stand-in for the protocol context, a pipette or the temperature module that streams each of its timed_commands to the run
+    timeline as a JSON line. Instruments and modules loaded through a timed protocol context are timed too."""
+
+    def __init__(self, target, timeline):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_timeline', timeline)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if name in ('load_instrument', 'load_module'):
+            return lambda *args, **kwargs: Timed(attribute(*args, **kwargs), self._timeline)
+        if name == 'comment':
+            def comment(msg):
+                if msg.startswith('Phase: '):
+                    self._timeline['phase'] = msg[len('Phase: '):]
+                return attribute(msg)
+            return comment
+        if name not in timed_commands:
+            return attribute
+        def timed_command(*args, **kwargs):
+            start = time.monotonic()
+            result = attribute(*args, **kwargs)
+            arguments = dict(zip(timed_commands[name], args), **kwargs)
+            timeline = self._timeline
+            timeline['file'].write(json.dumps(timeline_entry(name, timeline['phase'], start-timeline['start'], time.monotonic()-timeline['start'],
+                getattr(self._target, 'mount', None), arguments.get('volume'), arguments.get('location')))+'\n')
+            return result
+        return timed_command
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+def timed(protocol_context, timeline_file):
+    """Return protocol_context streaming its run timeline to timeline_file (e.g. under /data on the robot), written a line at a time so
+    an aborted run keeps every command up to the abort. Without a timeline_file, or when simulating, protocol_context itself."""
+    if not timeline_file or protocol_context.is_simulating():
+        return protocol_context
+    return Timed(protocol_context, {'file': open(timeline_file, 'w', buffering=1), 'phase': 'Setup', 'start': time.monotonic()})
+
+class DryRun:
+    """Stand-in for the protocol context, a pipette or the temperature module in a dry run: a mechanical pass over the deck to check
+    its setup and labware calibration before committing samples. Every move and tip pick up of the run is kept, but delays and
+    temperature changes are skipped, mixes run once, Z speeds are never capped, flow rates go no lower than the pipette defaults
+    (floors) and tips go back to their racks instead of the trash, so none are used. Instruments and modules loaded through a dry run
+    protocol context dry run too."""
+
+    def __init__(self, target, floors=None):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_floors', floors or {})
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if name == 'load_instrument':
+            def load_instrument(*args, **kwargs):
+                pipette = attribute(*args, **kwargs)
+                return DryRun(pipette, {rate: getattr(pipette.flow_rate, rate) for rate in ('aspirate', 'dispense', 'blow_out')})
+            return load_instrument
+        if name == 'load_module':
+            return lambda *args, **kwargs: DryRun(attribute(*args, **kwargs))
+        if name == 'flow_rate':
+            return DryRun(attribute, self._floors)
+        if name == 'max_speeds':
+            return {}# IE contact_speed and travel_speed caps go nowhere
+        if name in ('delay', 'set_temperature', 'start_set_temperature', 'await_temperature'):
+            return lambda *args, **kwargs: None
+        if name == 'mix':
+            return lambda repetitions=1, *args, **kwargs: attribute(1, *args, **kwargs)
+        if name == 'drop_tip':
+            return lambda *args, **kwargs: self._target.return_tip()
+        return attribute
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, max(value, self._floors[name]) if name in self._floors else value)
+
+def dry_run(protocol_context, enabled):
+    """Return protocol_context dry running when enabled, else protocol_context itself."""
+    return DryRun(protocol_context) if enabled else protocol_context
+
+def close_timeline(protocol_context):
+    """Close the run timeline file of protocol_context if it is timed (see timed), under any dry run."""
+    while isinstance(protocol_context, (Timed, DryRun)):
+        if isinstance(protocol_context, Timed):
+            protocol_context._timeline['file'].close()
+        protocol_context = protocol_context._target
+
+def multi_dispense(protocol_context, pipette, volume, source, source_volume, targets, disposal_volume, dispense_offsets, liquid_class, channels=1):
+    """Fill each of targets with volume uL from as few aspirates of source as fit the tip already on pipette.
+
+    Every aspirate carries an extra disposal_volume that is blown back into source. dispense_offsets[i] is the
+    calibration correction (uL) for the i-th dispense of an aspirate, like the -0.3 uL single dispense Master Mix
+    correction. channels is the # of channels drawing from one source well. Each dispense settles and touches tip as set for
+    liquid_class, and the moves run at its speeds (see in_liquid). Returns the volume left in source.
+    """
+    while targets:
+        dispense_volumes = []
+        for i in range(len(targets)):
+            dispense_volume = volume+(dispense_offsets[i] if i < len(dispense_offsets) else 0)
+            if dispense_volumes and sum(dispense_volumes)+dispense_volume+disposal_volume > pipette.max_volume:
+                break
+            dispense_volumes.append(dispense_volume)
+        aspirate_volume = sum(dispense_volumes)+disposal_volume
+        pipette.well_bottom_clearance.aspirate = aspirate_height(source.parent.load_name, source_volume, channels*aspirate_volume)
+        in_liquid(protocol_context, pipette, liquid_class, 'aspirate', aspirate_volume, source)
+        for dispense_volume, target in zip(dispense_volumes, targets):
+            pipette.dispense(dispense_volume, target)
+            settle(protocol_context, liquid_class['settle'])
+            pipette.touch_tip(v_offset=liquid_class['touch_tip_offset'])
+        pipette.blow_out(source.top())
+        source_volume = source_volume-(channels*sum(dispense_volumes))
+        targets = targets[len(dispense_volumes):]
+    return source_volume
+
 def run(protocol_context):
 
-    [temp_deck, pipette_type, pipette_mount, pipette_type_2, pipette_mount_2, sample_number, starting_sample_volume, sample_volume_1, dilution_volume_1, sample_volume_2, dilution_volume_2, sample_volume_3, dilution_volume_3, set_temperature] = get_values(  # noqa: F821
+    [temp_deck, pipette_type, pipette_mount, pipette_type_2, pipette_mount_2, sample_number, starting_sample_volume, sample_volume_1, dilution_volume_1, sample_volume_2, dilution_volume_2, sample_volume_3, dilution_volume_3, set_temperature, multi_dispense_mode, disposal_volume, multi_dispense_offsets, liquid_class_overrides, batch_prompts, sample_sheet, tip_state_file, timeline_file, dry_run_mode] = get_values(  # noqa: F821
         "temp_deck", "pipette_type", "pipette_mount", "pipette_type_2", "pipette_mount_2", "sample_number", "starting_sample_volume",
-        "sample_volume_1", "dilution_volume_1", "sample_volume_2", "dilution_volume_2", "sample_volume_3", "dilution_volume_3", "set_temperature"
+        "sample_volume_1", "dilution_volume_1", "sample_volume_2", "dilution_volume_2", "sample_volume_3", "dilution_volume_3", "set_temperature",
+        "multi_dispense", "disposal_volume", "multi_dispense_offsets", "liquid_classes", "batch_prompts", "sample_sheet", "tip_state_file", "timeline_file", "dry_run"
     )
-    # Set Speed of Z Axis
-    protocol_context.max_speeds['Z'] = 100
-    
+    classes = load_liquid_classes(liquid_class_overrides)
+
+    # Optionally stream a timeline of every robot command to timeline_file, to compare measured phase times with estimate_runtime.py
+    protocol_context = timed(protocol_context, timeline_file)
+
+    # Optionally dry run with no reagents to check the deck setup and labware calibration: every move and tip pick up, no waits, and
+    # every tip back in its rack
+    protocol_context = dry_run(protocol_context, dry_run_mode)
+
     # Check and see If Lights are On; Turn Lights On if Currently Off; Need to Troubleshoot this
     #protocol_context.rail_lights_on
     #original_light_status = protocol_context.rail_lights_on
@@ -74,6 +468,9 @@ def run(protocol_context):
      
     # Load Temperature deck in Slot 10
     temp_deck = protocol_context.load_module(temp_deck, '10')
+    
+    # Start ramping the Temperature Module to the User Defined Variable now so it reaches temperature during deck setup
+    temp_deck.start_set_temperature(set_temperature)
    
    # Populate temp_deck with final 1-20K 96 well PCR Reagent Plate
     dilution_20k_plate = temp_deck.load_labware(
@@ -91,29 +488,39 @@ def run(protocol_context):
     dilution_10k_plate = protocol_context.load_labware(
         'biorad_96_wellplate_200ul_pcr', '3', 'dilution plate 2 10k plate')
         
-     # Define samples variables
-    col_num = math.ceil(sample_number/8)# IE the total # columns you will be processing. 
-    samples = [col for col in sample_plate.rows()[0][:col_num]]
+     # Define samples variables. Only Initial Sample Plate columns holding a sample on the sample sheet are processed, packed into the first
+     # columns of the dilution plates in order. A partial column is still pipetted with all 8 channels, as apiLevel 2.10 multichannels cannot pick up fewer tips
+    sample_ids = read_sample_sheet(sample_sheet, sample_number)
+    sample_cols = sample_columns([well for well in sample_ids if well in sample_wells])
+    col_num = len(sample_cols)# IE the total # columns you will be processing. 
+    samples = [sample_plate.rows()[0][c] for c in sample_cols]
     samples_dilution_1 = [col for col in dilution_500_plate.rows()[0][:col_num]]
     samples_dilution_2 = [col for col in dilution_10k_plate.rows()[0][:col_num]]
     samples_dilution_3 = [col for col in dilution_20k_plate.rows()[0][:col_num]]
     samples_10k = [col for col in dilution_10k_plate.rows()[0][:col_num]]
     samples_20k = [col for col in dilution_20k_plate.rows()[0][:col_num]]
         
-    # Use four 300 uL tips per sample, tip racks go in slots 5-8 300uL tips
-    total_tips = (col_num*8)*4
-    tiprack_num = math.ceil(total_tips/96)
-    slots = ['5', '6', '7', '8'][:tiprack_num]
+    # Use four 300 uL tips per sample, tip racks go in slots 5-8 300uL tips. Multi-dispense mode uses one tip per Dilution Buffer fill instead of one per column
+    if multi_dispense_mode:
+        total_tips = (col_num+3)*8
+    else:
+        total_tips = (col_num*8)*4
     
+    # Optionally carry partly used tip racks over between runs. The tip inventory in tip_state_file (e.g. under /data on the robot) records
+    # the used columns of the partly used rack of each tip type, which goes in the first slot so pipetting starts from its first full column
+    tip_state = load_tip_state(tip_state_file)
     tip_name = 'opentrons_96_tiprack_300ul'
+    slots, used_columns, set_aside = plan_tip_racks(total_tips, tip_state.get(tip_name, 0), ['5', '6', '7', '8'])
+    tiprack_num = len(slots)
+    
     tipracks = [protocol_context.load_labware(tip_name, slot) for slot in slots]
 
-    # Use one 20 uL tips per sample, tip rack goes in slot 10 20 uL tips
+    # Use two 20 uL tips per sample, tip racks go in slots 9 and 11 20 uL tips
     total_tips_2 = (col_num*8)*2
-    tiprack_num_2 = math.ceil(total_tips_2/96)
-    slots_2 = ['9'][:tiprack_num_2]
-
     tip_name_2 = 'opentrons_96_tiprack_20ul'
+    slots_2, used_columns_2, set_aside_2 = plan_tip_racks(total_tips_2, tip_state.get(tip_name_2, 0), ['9', '11'])
+    tiprack_num_2 = len(slots_2)
+
     tipracks_2 = [protocol_context.load_labware(tip_name_2, slot_2) for slot_2 in slots_2]
     
     # Telling Pippete Mount (left_pipette, in this case 300 ul multichannel) to use 300 uL tips
@@ -123,60 +530,70 @@ def run(protocol_context):
     # Telling Pippete Mount 2(right pipette, in this case 20 ul multichannel) to use 20 uL tips 
     pipette_2 = protocol_context.load_instrument(
         pipette_type_2, pipette_mount_2, tip_racks=tipracks_2)
-     
-    # Define reagents and liquid waste
-    dilution_buffer = reagent_container.wells()[0]
     
-    # Starting Sample Volume Error Handling
-    if starting_sample_volume == 12:
-        starting_aspirate_height = 0.2
-        pipette_2.well_bottom_clearance.aspirate = starting_aspirate_height
-    else: 
-        protocol_context.pause("Starting sample volume is out of range, use 12uL only. Please re-run protocol script and correct volume.")
+    if used_columns:
+        pipette.starting_tip = tipracks[0].columns()[used_columns][0]
+    if used_columns_2:
+        pipette_2.starting_tip = tipracks_2[0].columns()[used_columns_2][0]
+     
+    # Define reagents and liquid waste. One reservoir well holds the Dilution Buffer for up to 6 sample columns, so full plate runs (7-12 columns) draw from wells A1 and A2
+    buffer_col_num = 6
+    buffer_wells = reagent_container.wells()[:math.ceil(col_num/buffer_col_num)]
+    buffer_well_col_num = [min(buffer_col_num, col_num - (buffer_col_num*w)) for w in range(len(buffer_wells))]# IE the # of sample columns served by each reservoir well
+    buffer_channels = 8# IE all 8 channels of the multichannel draw from the same reservoir well
     
     #Define User Deck Preparation
-    load_tips = ((col_num*8)*4)
-    load_300_tip_boxes = math.ceil(load_tips/96)
-    load_tips2 = ((col_num*8)*2)
-    load_20_tip_boxes = math.ceil(load_tips2/96)
-    col_1_Dilution_Buffer = math.ceil((((col_num*8)*(dilution_volume_1+dilution_volume_2+dilution_volume_3)+5000)/1000))
+    load_300_tip_boxes = tiprack_num
+    load_20_tip_boxes = tiprack_num_2
+    col_1_Dilution_Buffer = [math.ceil((((n*8)*(dilution_volume_1+dilution_volume_2+dilution_volume_3)+5000)/1000)) for n in buffer_well_col_num]
+    
+    #Define Dilution Final Aspirate Volumes beyond tip capacity: the fewest parts of dilution_volume_1 that fit the tip, each with the heights it is dispensed and blown out at
+    fill_plan = plan_fill(dilution_500_plate.load_name, dilution_volume_1, pipette.max_volume, classes['buffer_1_500'], pipette_type)
+
+    # Pre-flight check of the run values against the pipette, tip and labware capacities, reported all at once before the first prompt
+    problems = check_run_values(sample_ids, sample_sheet, sample_number, set_temperature, liquid_class_overrides, [(pipette_type, pipette_mount), (pipette_type_2, pipette_mount_2)])
+    if starting_sample_volume != 12:
+        problems.append("Starting sample volume is out of range, use 12uL only.")
+    if sample_volume_1 > starting_sample_volume:
+        problems.append("sample_volume_1 of {:g} uL is more than the {:g} uL starting_sample_volume.".format(sample_volume_1, starting_sample_volume))
+    for tips, racks, used, name, tip_slots in [(total_tips, tiprack_num, used_columns, '300 uL', 'positions 5-8'), (total_tips_2, tiprack_num_2, used_columns_2, '20 uL', 'positions 9 and 11')]:
+        if tips+(used*8) > racks*96:
+            problems.append("The run needs {} {} tips, more than the Tip Boxes in {} hold.".format(tips, name, tip_slots))
+    for transfer, volume, class_name, pipette_name, rack_name in [
+            ("dilution_volume_2", dilution_volume_2, 'buffer_10k', pipette_type, tip_name),
+            ("dilution_volume_3", dilution_volume_3, 'buffer_20k', pipette_type, tip_name),
+            ("sample_volume_1", sample_volume_1, 'library_1_500', pipette_type_2, tip_name_2),
+            ("sample_volume_2", sample_volume_2, 'library_10k', pipette_type_2, tip_name_2),
+            ("sample_volume_3", sample_volume_3, 'library_20k', pipette_type, tip_name)]:
+        check_transfer(problems, transfer, set_volume(classes[class_name], volume, pipette_name), pipette_name, rack_name)
+    check_transfer(problems, "dilution_volume_1 in {} parts".format(len(fill_plan)), fill_plan[0][0], pipette_type, tip_name)
+    if multi_dispense_mode:
+        for transfer, volume, class_name in [("dilution_volume_2", dilution_volume_2, 'buffer_10k'), ("dilution_volume_3", dilution_volume_3, 'buffer_20k')]:
+            check_transfer(problems, "{} plus disposal_volume".format(transfer), set_volume(classes[class_name], volume, pipette_type)+disposal_volume, pipette_type, tip_name)
+            check_aliquots(problems, transfer, set_volume(classes[class_name], volume, pipette_type), multi_dispense_offsets, pipette_type)
+    for v, w in zip(col_1_Dilution_Buffer, buffer_wells):
+        check_well(problems, "Dilution Buffer in reservoir well {}".format(w.well_name), v*1000, reagent_container.load_name)
+    check_well(problems, "dilution_volume_1 plus sample_volume_1", dilution_volume_1+sample_volume_1, dilution_500_plate.load_name)
+    check_well(problems, "dilution_volume_2 plus sample_volume_2", dilution_volume_2+sample_volume_2, dilution_10k_plate.load_name)
+    check_well(problems, "dilution_volume_3 plus sample_volume_3", dilution_volume_3+sample_volume_3, dilution_20k_plate.load_name)
+    preflight(problems)
     
     #############################################################################################################################################################################
     ##########################################################User Deck Preparation Prompts######################################################################################
     #############################################################################################################################################################################
-    protocol_context.pause("If not already present, load Temperature Module (Gen2) onto deck grid 10, plug in power & USB and press ON button. Wipe Down Deck with 70% Ethanol.")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Label and Load BioRad 96-well Hard Shell 20k Dilution Plate onto Temperature Module on deck grid 10")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Load  1 20 uL Tip Box onto deck grid 9")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("""Load {} 300 uL Tip Boxes onto deck positions in the following order: 5,6,7,8 """.format(str(load_300_tip_boxes)))
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("""1. Load Agilent 73 mL Reagent Reservoir onto deck grid 4.    2. Pipette {} mL Dilution Buffer (10mM TrisHCL, 0.5% Tween20) into Well A1.""".format(str(col_1_Dilution_Buffer)))
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Label BioRad 96-well Hard Shell Initial Sample Plate (Initial Dilution).Vortex Plate for 1 minute at Speed 10. Cnetirufe for 500 x g for 2 minutes.Load BioRad 96-well Hard Shell Initial Sample Plate onto deck grid 1.")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Label and Load PE Pipetting Microplate, 2mL DW SQ 96-well plate onto deck grid 2")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Label and Load BioRad 96-well Hard Shell 10k Dilution Plate onto deck grid 3")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Review Deck Layout Photo. Make Sure All Plates are unsealed and tip rack overs are removed. Once you click resume, pipetting will begin!")
+    setup_prompts = [
+        "If not already present, load Temperature Module (Gen2) onto deck grid 10, plug in power & USB and press ON button. Wipe Down Deck with 70% Ethanol.",
+        "Label and Load BioRad 96-well Hard Shell 20k Dilution Plate onto Temperature Module on deck grid 10",
+        """Load {} 20 uL Tip Boxes onto deck positions in the following order: 9,11 {}""".format(str(load_20_tip_boxes), partly_used_note(used_columns_2, set_aside_2, '9')),
+        """Load {} 300 uL Tip Boxes onto deck positions in the following order: 5,6,7,8 {}""".format(str(load_300_tip_boxes), partly_used_note(used_columns, set_aside, '5')),
+        """Load Agilent 73 mL Reagent Reservoir onto deck grid 4, then pipette {}.""".format(" and ".join(["""{} mL Dilution Buffer (10mM TrisHCL, 0.5% Tween20) into Well {}""".format(str(v), w.well_name) for v, w in zip(col_1_Dilution_Buffer, buffer_wells)])),
+        "Label BioRad 96-well Hard Shell Initial Sample Plate (Initial Dilution).Vortex Plate for 1 minute at Speed 10. Cnetirufe for 500 x g for 2 minutes.Load BioRad 96-well Hard Shell Initial Sample Plate onto deck grid 1.",
+        "Label and Load PE Pipetting Microplate, 2mL DW SQ 96-well plate onto deck grid 2",
+        "Label and Load BioRad 96-well Hard Shell 10k Dilution Plate onto deck grid 3",
+        "Review Deck Layout Photo. Make Sure All Plates are unsealed and tip rack overs are removed. Once you click resume, pipetting will begin!"]
+    if sample_cols != list(range(col_num)):
+        setup_prompts.insert(-1, """Sample sheet: Initial Sample Plate columns {} go into dilution plate columns {}. Use the same sample sheet for Step 2.""".format(",".join(str(c+1) for c in sample_cols), ",".join(str(t+1) for t in range(col_num))))
+    operator_prompts(protocol_context, setup_prompts, batch_prompts)
   
     ##############################################################################################################################################################################
     ##############################################################################################################################################################################
@@ -184,196 +601,129 @@ def run(protocol_context):
     #Turn off Deck Lights 
     protocol_context.set_rail_lights(False)
     
-    # Define Well Bottom for Reagent Reservoir (agilent_4_well_73_ml_reagent_reservoir) to dilution_500_plate (perkinelmer_96_wellplate_2000ul) 
-    if col_num == 6:
-        Dilution_Buffer_Well_Bottom=25
-    if col_num == 5:
-        Dilution_Buffer_Well_Bottom=21
-    if col_num == 4:
-        Dilution_Buffer_Well_Bottom=17
-    if col_num == 3:
-        Dilution_Buffer_Well_Bottom=13
-    if col_num == 2:
-        Dilution_Buffer_Well_Bottom=9
-    if col_num == 1:
-        Dilution_Buffer_Well_Bottom=5
-    
-   #Define Dilution Final Aspirate Volume beyond tip capacity
-    aspirate_volume = (dilution_volume_1/4)-0.8# subtraction of 0.8 is to account for pipette overdelivering an average of 0.8 uL per trasnsfer
+    protocol_context.comment("Phase: Buffer Fill")
+
+    # Track the Dilution Buffer left in each reservoir well so the aspirate height follows the meniscus down
+    buffer_volumes = [v*1000 for v in col_1_Dilution_Buffer]
     
     # Change Flow Rates
-    pipette.flow_rate.aspirate = 94 #speeding up so dispense can be very low for accuracy. 94 choosen as its pipette default speed.  
-    pipette.flow_rate.dispense = 22.5 #250 and 95 leave a decent amount of volume in tips when blowout. at 250 the volume is moving too fast for the buffer to escape surface tension. Still happens at 30, but less so. 15 looks great , but is SLOWWWWW. take the middle between the two, which is 22.5. doesnt look as good, but takes 4 minutes per column to fill up. Fairly repoducbile too, +/- 2 uL, and at best Opentrons promises +/-1.5 uL 
-    pipette.flow_rate.blow_out = 299
-
-    # Dispense Dilution Buffer to PE Pipetting Microplate 2mL DW SQ 96-well plate
-    for target in samples_dilution_1:
-        protocol_context.max_speeds['Z'] = 200 # Set Speed of Z Axis
-        pipette.pick_up_tip()
-        pipette.well_bottom_clearance.aspirate = Dilution_Buffer_Well_Bottom
-        pipette.well_bottom_clearance.dispense = Dilution_Buffer_Well_Bottom
-        pipette.mix(1, aspirate_volume, dilution_buffer)
-        pipette.well_bottom_clearance.aspirate = Dilution_Buffer_Well_Bottom
-        pipette.well_bottom_clearance.dispense = 4
-        protocol_context.max_speeds['Z'] = 20 # Set Speed of Z Axis
-        pipette.aspirate(aspirate_volume, dilution_buffer)
-        protocol_context.max_speeds['Z'] = 200 # Set Speed of Z Axis
-        pipette.dispense(aspirate_volume, target)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(target.bottom(4.5))
-        pipette.touch_tip(v_offset=-5)
-        pipette.well_bottom_clearance.aspirate = Dilution_Buffer_Well_Bottom
-        pipette.well_bottom_clearance.dispense = Dilution_Buffer_Well_Bottom
-        pipette.mix(1, aspirate_volume, dilution_buffer)
-        pipette.well_bottom_clearance.aspirate = Dilution_Buffer_Well_Bottom
-        pipette.well_bottom_clearance.dispense = 8
-        protocol_context.max_speeds['Z'] = 20 # Set Speed of Z Axis
-        pipette.aspirate(aspirate_volume, dilution_buffer)
-        protocol_context.max_speeds['Z'] = 200 # Set Speed of Z Axis
-        pipette.dispense(aspirate_volume, target)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(target.bottom(8.5))
-        pipette.touch_tip(v_offset=-5)
-        pipette.well_bottom_clearance.aspirate = Dilution_Buffer_Well_Bottom
-        pipette.well_bottom_clearance.dispense = Dilution_Buffer_Well_Bottom
-        pipette.mix(1, aspirate_volume, dilution_buffer)
-        pipette.well_bottom_clearance.aspirate = Dilution_Buffer_Well_Bottom
-        pipette.well_bottom_clearance.dispense = 12
-        protocol_context.max_speeds['Z'] = 20 # Set Speed of Z Axis
-        pipette.aspirate(aspirate_volume, dilution_buffer)
-        protocol_context.max_speeds['Z'] = 200 # Set Speed of Z Axis
-        pipette.dispense(aspirate_volume, target)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(target.bottom(12.5))
-        pipette.touch_tip(v_offset=-5)
-        pipette.well_bottom_clearance.aspirate = Dilution_Buffer_Well_Bottom
-        pipette.well_bottom_clearance.dispense = Dilution_Buffer_Well_Bottom
-        pipette.mix(1, aspirate_volume, dilution_buffer)
-        pipette.well_bottom_clearance.aspirate = Dilution_Buffer_Well_Bottom
-        pipette.well_bottom_clearance.dispense = 16
-        protocol_context.max_speeds['Z'] = 20 # Set Speed of Z Axis
-        pipette.aspirate(aspirate_volume, dilution_buffer)
-        protocol_context.max_speeds['Z'] = 200 # Set Speed of Z Axis
-        pipette.dispense(aspirate_volume, target)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(target.bottom(16.5))
-        pipette.touch_tip(v_offset=-5)
-        protocol_context.max_speeds['Z'] = 200 # Set Speed of Z Axis
-        pipette.drop_tip()
-        Dilution_Buffer_Well_Bottom = Dilution_Buffer_Well_Bottom-4
+    liquid_class = classes['buffer_1_500']
+    apply_liquid_class(pipette, liquid_class)
+    
+    # Dispense Dilution Buffer to PE Pipetting Microplate 2mL DW SQ 96-well plate in parts, each dispensed above the last. Each new tip
+    # is pre-wet once, with one mix of Dilution Buffer before its first aspirate
+    for col, target in enumerate(samples_dilution_1):
+        w = col//buffer_col_num
+        dilution_buffer = buffer_wells[w]
+        if col == 0 or not multi_dispense_mode:
+            pipette.pick_up_tip()
+            pre_wet = True
+        for aspirate_volume, dispense_clearance, blow_out_height in fill_plan:
+            Dilution_Buffer_Well_Bottom = aspirate_height(reagent_container.load_name, buffer_volumes[w], buffer_channels*aspirate_volume)
+            pipette.well_bottom_clearance.aspirate = Dilution_Buffer_Well_Bottom
+            if pre_wet:
+                pipette.well_bottom_clearance.dispense = Dilution_Buffer_Well_Bottom
+                in_liquid(protocol_context, pipette, liquid_class, 'mix', 1, aspirate_volume, dilution_buffer)
+                pre_wet = False
+            pipette.well_bottom_clearance.dispense = dispense_clearance
+            in_liquid(protocol_context, pipette, liquid_class, 'aspirate', aspirate_volume, dilution_buffer)
+            buffer_volumes[w] = buffer_volumes[w]-(buffer_channels*aspirate_volume)
+            pipette.dispense(aspirate_volume, target)
+            settle(protocol_context, liquid_class['settle'])
+            pipette.blow_out(target.bottom(blow_out_height))
+            pipette.touch_tip(v_offset=liquid_class['touch_tip_offset'])
+        if col == col_num-1 or not multi_dispense_mode:
+            pipette.drop_tip()
         
-    # Define Well Bottom for Reagent Reservoir (agilent_4_well_73_ml_reagent_reservoir) to dilution_10k_plate_plate (biorad_96_wellplate_200ul_pcr) 
-    if col_num == 6:
-        Dilution_Buffer_Well_Bottom=4
-    if col_num == 5:
-        Dilution_Buffer_Well_Bottom=3.4
-    if col_num == 4:
-        Dilution_Buffer_Well_Bottom=2.8
-    if col_num == 3:
-        Dilution_Buffer_Well_Bottom=2.2
-    if col_num == 2:
-        Dilution_Buffer_Well_Bottom=1.6
-    if col_num == 1:
-        Dilution_Buffer_Well_Bottom=1
-     
     # Change Flow Rates
-    pipette.flow_rate.aspirate = 35
-    pipette.flow_rate.dispense = 95 # tested empircally, 95 gives better results than orignal set point of 250 JSB 08/30/21
-    pipette.flow_rate.blow_out = 299
-    dilution_volume_2 = (dilution_volume_2)-1 # giving a value of 95 to dispense actually yields 96 uL. so this is to correct the set volume to 94, which will actually yield 95 uL. 
+    liquid_class = classes['buffer_10k']
+    apply_liquid_class(pipette, liquid_class)
+    dilution_volume_2 = set_volume(liquid_class, dilution_volume_2, pipette_type)
 
     # Dispense Dilution Buffer to BioRad Hardshell 96-well plate (10k Dilution Plate)
-    for target in samples_dilution_2:
-        protocol_context.max_speeds['Z'] = 100 # Set Speed of Z Axis
+    if multi_dispense_mode:
+        # Multi-dispense with one tip, as Dilution Buffer only goes into clean wells
         pipette.pick_up_tip()
-        protocol_context.max_speeds['Z'] = 20 # Set Speed of Z Axis
-        pipette.well_bottom_clearance.aspirate = Dilution_Buffer_Well_Bottom
-        pipette.well_bottom_clearance.dispense = Dilution_Buffer_Well_Bottom
-        pipette.mix(1, dilution_volume_2, dilution_buffer)
-        pipette.well_bottom_clearance.aspirate = Dilution_Buffer_Well_Bottom
-        pipette.well_bottom_clearance.dispense = 10
-        pipette.aspirate(dilution_volume_2, dilution_buffer)
-        protocol_context.max_speeds['Z'] = 100 # Set Speed of Z Axis
-        pipette.dispense(dilution_volume_2, target)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(target.bottom(9.5))
-        pipette.touch_tip(v_offset=-5)
-        protocol_context.max_speeds['Z'] = 100 # Set Speed of Z Axis
+        for w, dilution_buffer in enumerate(buffer_wells):
+            buffer_volumes[w] = multi_dispense(protocol_context, pipette, dilution_volume_2, dilution_buffer, buffer_volumes[w], samples_dilution_2[w*buffer_col_num:(w+1)*buffer_col_num], disposal_volume, multi_dispense_offsets, liquid_class, buffer_channels)
         pipette.drop_tip()
-        Dilution_Buffer_Well_Bottom = Dilution_Buffer_Well_Bottom-0.6
+    else:
+        for col, target in enumerate(samples_dilution_2):
+            w = col//buffer_col_num
+            dilution_buffer = buffer_wells[w]
+            # Define Well Bottom for Reagent Reservoir (agilent_4_well_73_ml_reagent_reservoir) to dilution_10k_plate_plate (biorad_96_wellplate_200ul_pcr)
+            Dilution_Buffer_Well_Bottom = aspirate_height(reagent_container.load_name, buffer_volumes[w], buffer_channels*dilution_volume_2)
+            pipette.pick_up_tip()
+            pipette.well_bottom_clearance.aspirate = Dilution_Buffer_Well_Bottom
+            pipette.well_bottom_clearance.dispense = Dilution_Buffer_Well_Bottom
+            in_liquid(protocol_context, pipette, liquid_class, 'mix', 1, dilution_volume_2, dilution_buffer)
+            pipette.well_bottom_clearance.aspirate = Dilution_Buffer_Well_Bottom
+            pipette.well_bottom_clearance.dispense = liquid_class['dispense_clearance']
+            in_liquid(protocol_context, pipette, liquid_class, 'aspirate', dilution_volume_2, dilution_buffer)
+            buffer_volumes[w] = buffer_volumes[w]-(buffer_channels*dilution_volume_2)
+            pipette.dispense(dilution_volume_2, target)
+            settle(protocol_context, liquid_class['settle'])
+            pipette.blow_out(target.bottom(liquid_class['blow_out_height']))
+            pipette.touch_tip(v_offset=liquid_class['touch_tip_offset'])
+            pipette.drop_tip()
         
    # Dispense Dilution Buffer to 20k Dilution BioRad Hard Shell 96-well plate onto Temperature Module
    
    # Change Flow Rates
-    pipette.flow_rate.aspirate = 35
-    pipette.flow_rate.dispense = 95
-    pipette.flow_rate.blow_out = 299
-    dilution_volume_3 = (dilution_volume_3)-4 # giving a value of 36 to dispense actually yields 40-41 uL. so this is to correct the set volume to 39, which will actually yield 40-41 uL.
-    
-    Dilution_Buffer_Well_Bottom=1
+    liquid_class = classes['buffer_20k']
+    apply_liquid_class(pipette, liquid_class)
+    dilution_volume_3 = set_volume(liquid_class, dilution_volume_3, pipette_type)
     
-    for target in samples_dilution_3:
-        protocol_context.max_speeds['Z'] = 100 # Set Speed of Z Axis
+    if multi_dispense_mode:
+        # Multi-dispense with one tip, as Dilution Buffer only goes into clean wells
         pipette.pick_up_tip()
-        protocol_context.max_speeds['Z'] = 20 # Set Speed of Z Axis
-        pipette.well_bottom_clearance.aspirate = Dilution_Buffer_Well_Bottom
-        pipette.well_bottom_clearance.dispense = Dilution_Buffer_Well_Bottom
-        pipette.mix(1, dilution_volume_3, dilution_buffer)
-        pipette.well_bottom_clearance.aspirate = Dilution_Buffer_Well_Bottom
-        pipette.well_bottom_clearance.dispense = 8
-        pipette.aspirate(dilution_volume_3, dilution_buffer)
-        protocol_context.max_speeds['Z'] = 100 # Set Speed of Z Axis
-        pipette.dispense(dilution_volume_3, target)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(target.bottom(4))
-        pipette.touch_tip(v_offset=-5)
-        protocol_context.max_speeds['Z'] = 100 # Set Speed of Z Axis
+        for w, dilution_buffer in enumerate(buffer_wells):
+            buffer_volumes[w] = multi_dispense(protocol_context, pipette, dilution_volume_3, dilution_buffer, buffer_volumes[w], samples_dilution_3[w*buffer_col_num:(w+1)*buffer_col_num], disposal_volume, multi_dispense_offsets, liquid_class, buffer_channels)
         pipette.drop_tip()
+    else:
+        for col, target in enumerate(samples_dilution_3):
+            w = col//buffer_col_num
+            dilution_buffer = buffer_wells[w]
+            # Define Well Bottom for Reagent Reservoir (agilent_4_well_73_ml_reagent_reservoir) to dilution_20k_plate (biorad_96_wellplate_200ul_pcr)
+            Dilution_Buffer_Well_Bottom = aspirate_height(reagent_container.load_name, buffer_volumes[w], buffer_channels*dilution_volume_3)
+            pipette.pick_up_tip()
+            pipette.well_bottom_clearance.aspirate = Dilution_Buffer_Well_Bottom
+            pipette.well_bottom_clearance.dispense = Dilution_Buffer_Well_Bottom
+            in_liquid(protocol_context, pipette, liquid_class, 'mix', 1, dilution_volume_3, dilution_buffer)
+            pipette.well_bottom_clearance.aspirate = Dilution_Buffer_Well_Bottom
+            pipette.well_bottom_clearance.dispense = liquid_class['dispense_clearance']
+            in_liquid(protocol_context, pipette, liquid_class, 'aspirate', dilution_volume_3, dilution_buffer)
+            buffer_volumes[w] = buffer_volumes[w]-(buffer_channels*dilution_volume_3)
+            pipette.dispense(dilution_volume_3, target)
+            settle(protocol_context, liquid_class['settle'])
+            pipette.blow_out(target.bottom(liquid_class['blow_out_height']))
+            pipette.touch_tip(v_offset=liquid_class['touch_tip_offset'])
+            pipette.drop_tip()
         
     # Change Flow Rates
-    pipette_2.flow_rate.aspirate = 2
-    pipette_2.flow_rate.dispense = 2
-    pipette_2.flow_rate.blow_out = 20
-    #sample_volume_1 = (sample_volume_1)-0.2 # giving a value of 39 to dispense actually yields 40-41 uL. so this is to correct the set volume to 39, which will actually yield 40-41 uL.    
+    liquid_class = classes['library_1_500']
+    sample_volume_1 = set_volume(liquid_class, sample_volume_1, pipette_type_2)
   
+    protocol_context.comment("Phase: 1:500 Transfer")
+
     #Initial Sample Transfer to PE Pipetting Microplate 2mL DW SQ 96-well plate
     for t in range(col_num):
-        if t == 0:
-            samples_1 = sample_plate['A1']
-            dilutions_1 = dilution_500_plate['A1']
-        if t == 1:
-            samples_1 = sample_plate['A2']
-            dilutions_1 = dilution_500_plate['A2']
-        if t == 2:
-            samples_1 = sample_plate['A3']
-            dilutions_1 = dilution_500_plate['A3']
-        if t == 3:
-            samples_1 = sample_plate['A4']
-            dilutions_1 = dilution_500_plate['A4']
-        if t == 4:
-            samples_1 = sample_plate['A5']
-            dilutions_1 = dilution_500_plate['A5']
-        if t == 5:
-            samples_1 = sample_plate['A6']
-            dilutions_1 = dilution_500_plate['A6']
+        samples_1 = samples[t]
+        dilutions_1 = dilution_500_plate.rows()[0][t]
 
         pipette_2.pick_up_tip()
-        pipette_2.well_bottom_clearance.aspirate = starting_aspirate_height
-        pipette_2.well_bottom_clearance.dispense = 16.5
-        pipette_2.aspirate(sample_volume_1, samples_1)
-        pipette_2.dispense(sample_volume_1, dilutions_1)
-        pipette_2.well_bottom_clearance.aspirate = 16.5
-        pipette_2.mix(1, sample_volume_1, dilutions_1)
-        protocol_context.delay(seconds=3)
-        pipette_2.blow_out(dilutions_1.bottom(17))
-        pipette_2.touch_tip(v_offset=-5)
+        apply_liquid_class(pipette_2, liquid_class)
+        in_liquid(protocol_context, pipette_2, liquid_class, 'aspirate', sample_volume_1, samples_1)
+        in_liquid(protocol_context, pipette_2, liquid_class, 'dispense', sample_volume_1, dilutions_1)
+        pipette_2.well_bottom_clearance.aspirate = liquid_class['dispense_clearance']
+        in_liquid(protocol_context, pipette_2, liquid_class, 'mix', 1, sample_volume_1, dilutions_1)
+        settle(protocol_context, liquid_class['settle'])
+        pipette_2.blow_out(dilutions_1.bottom(liquid_class['blow_out_height']))
+        pipette_2.touch_tip(v_offset=liquid_class['touch_tip_offset'])
         pipette_2.drop_tip()
         
     protocol_context.set_rail_lights(True)
     
-    #Set Temperature of Temperature Module to User Defined Variable
-    temp_deck.set_temperature(set_temperature)
-    
     #################################################################################################################################################
     ##########Prompt to Vortex PE Pipetting Microplate 2mL DW SQ 96-well plate############################################################################################################################################ 
     protocol_context.pause("Remove PE Pipetting Microplate 2mL DW SQ 96-well plate from deck grid 2. Seal Plate and Vortex(1 minute @ top speed)")
@@ -387,41 +737,25 @@ def run(protocol_context):
     protocol_context.set_rail_lights(False)
     
     # Change Flow Rates
-    pipette_2.flow_rate.aspirate = 5
-    pipette_2.flow_rate.dispense = 5
-    pipette_2.flow_rate.blow_out = 20
+    liquid_class = classes['library_10k']
+    sample_volume_2 = set_volume(liquid_class, sample_volume_2, pipette_type_2)
+
+    protocol_context.comment("Phase: 10k Transfer")
 
     # PE Pipetting Microplate 2mL DW SQ 96-well plate Sample Transfer to Dilution 10K Plate
     for t2 in range(col_num):
-        if t2 == 0:
-            samples_2 = dilution_500_plate['A1']
-            dilutions_2 = dilution_10k_plate['A1']
-        if t2 == 1:
-            samples_2 = dilution_500_plate['A2']
-            dilutions_2 = dilution_10k_plate['A2']
-        if t2 == 2:
-            samples_2 = dilution_500_plate['A3']
-            dilutions_2 = dilution_10k_plate['A3']
-        if t2 == 3:
-            samples_2 = dilution_500_plate['A4']
-            dilutions_2 = dilution_10k_plate['A4']
-        if t2 == 4:
-            samples_2 = dilution_500_plate['A5']
-            dilutions_2 = dilution_10k_plate['A5']
-        if t2 == 5:
-            samples_2 = dilution_500_plate['A6']
-            dilutions_2 = dilution_10k_plate['A6']
+        samples_2 = dilution_500_plate.rows()[0][t2]
+        dilutions_2 = dilution_10k_plate.rows()[0][t2]
 
         pipette_2.pick_up_tip()
-        pipette_2.well_bottom_clearance.aspirate = 15
-        pipette_2.well_bottom_clearance.dispense = 8
-        pipette_2.aspirate(sample_volume_2, samples_2)
-        pipette_2.dispense(sample_volume_2, dilutions_2)
-        pipette_2.well_bottom_clearance.aspirate = 8
-        pipette_2.mix(1, sample_volume_2, dilutions_2)
-        protocol_context.delay(seconds=3)
-        pipette_2.blow_out(dilutions_2.bottom(9))
-        pipette_2.touch_tip(v_offset=-5)
+        apply_liquid_class(pipette_2, liquid_class)
+        in_liquid(protocol_context, pipette_2, liquid_class, 'aspirate', sample_volume_2, samples_2)
+        in_liquid(protocol_context, pipette_2, liquid_class, 'dispense', sample_volume_2, dilutions_2)
+        pipette_2.well_bottom_clearance.aspirate = liquid_class['dispense_clearance']
+        in_liquid(protocol_context, pipette_2, liquid_class, 'mix', 1, sample_volume_2, dilutions_2)
+        settle(protocol_context, liquid_class['settle'])
+        pipette_2.blow_out(dilutions_2.bottom(liquid_class['blow_out_height']))
+        pipette_2.touch_tip(v_offset=liquid_class['touch_tip_offset'])
         pipette_2.drop_tip()
  
     protocol_context.set_rail_lights(True)
@@ -440,43 +774,28 @@ def run(protocol_context):
     protocol_context.set_rail_lights(False)
 
     # Change Flow Rates
-    pipette.flow_rate.aspirate = 40
-    pipette.flow_rate.dispense = 22.5
-    pipette.flow_rate.blow_out = 299
+    liquid_class = classes['library_20k']
+    sample_volume_3 = set_volume(liquid_class, sample_volume_3, pipette_type)
     
-    protocol_context.max_speeds['Z'] = 20 # Set Speed of(Z) Axis 20uL Pippete
-          
+    # Wait for the Temperature Module to reach the User Defined Variable before sample goes into the 20k Dilution Plate
+    temp_deck.await_temperature(set_temperature)
+
+    protocol_context.comment("Phase: 20k Transfer")
+
     # Dilution 10K Plate Sample Transfer to Dilution 20K Plate
     for t3 in range(col_num):
-        if t3 == 0:
-            samples_3 = dilution_10k_plate['A1']
-            dilutions_3 = dilution_20k_plate['A1']
-        if t3 == 1:
-            samples_3 = dilution_10k_plate['A2']
-            dilutions_3 = dilution_20k_plate['A2']
-        if t3 == 2:
-            samples_3 = dilution_10k_plate['A3']
-            dilutions_3 = dilution_20k_plate['A3']
-        if t3 == 3:
-            samples_3 = dilution_10k_plate['A4']
-            dilutions_3 = dilution_20k_plate['A4']
-        if t3 == 4:
-            samples_3 = dilution_10k_plate['A5']
-            dilutions_3 = dilution_20k_plate['A5']
-        if t3 == 5:
-            samples_3 = dilution_10k_plate['A6']
-            dilutions_3 = dilution_20k_plate['A6']
+        samples_3 = dilution_10k_plate.rows()[0][t3]
+        dilutions_3 = dilution_20k_plate.rows()[0][t3]
         
         pipette.pick_up_tip()
-        pipette.well_bottom_clearance.aspirate = 5
-        pipette.well_bottom_clearance.dispense = 5
-        pipette.aspirate(sample_volume_3, samples_3)
-        pipette.dispense(sample_volume_3, dilutions_3)
-        pipette.well_bottom_clearance.aspirate = 5
-        pipette.mix(1, sample_volume_3, dilutions_3)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(dilutions_3.bottom(5.5))
-        pipette.touch_tip(v_offset=-5)
+        apply_liquid_class(pipette, liquid_class)
+        in_liquid(protocol_context, pipette, liquid_class, 'aspirate', sample_volume_3, samples_3)
+        in_liquid(protocol_context, pipette, liquid_class, 'dispense', sample_volume_3, dilutions_3)
+        pipette.well_bottom_clearance.aspirate = liquid_class['dispense_clearance']
+        in_liquid(protocol_context, pipette, liquid_class, 'mix', 1, sample_volume_3, dilutions_3)
+        settle(protocol_context, liquid_class['settle'])
+        pipette.blow_out(dilutions_3.bottom(liquid_class['blow_out_height']))
+        pipette.touch_tip(v_offset=liquid_class['touch_tip_offset'])
         pipette.drop_tip()
         
     #Turn Lights On
@@ -485,32 +804,29 @@ def run(protocol_context):
     #############################################################################################################################################################################
     ##########################################################Prompt to Vortex 20k Dilution BioRad Hard Shell 96-well plate######################################################
     #############################################################################################################################################################################  
-    protocol_context.pause("Remove 20k Dilution BioRad Hard Shell 96-well plate from Temperature Module on deck grid 10. Seal Plate and Vortex(1 minute @ top speed). Centrifuge Briefly(@1500 rpm, 2 minutes). Store on ice until ready to load onto deck for part 2 of the qPCR assay.")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Remove 10k Dilution BioRad Hard Shell 96-well plate from deck grid 3. Seal Plate and Vortex(1 minute @ top speed). Centrifuge Briefly(@1500 rpm, 2 minutes).Store on ice until ready to load onto deck for part 2 of the qPCR assay.")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    ########################################################################Deck Unloading Instructions##########################################################################
-    protocol_context.pause("Please remove Tip Waste from deck grid 12 to biohazard bin.")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Remove Initial Sample Plate from deck grid 1.Seal Plate, and store at 4C until qPCR data analysis is complete.")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Remove PE Pipetting Microplate 2mL DW SQ 96-well plate from deck grid 2 to biohazard bin.")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Remove Agilent 73 mL Reagent Reservoir to biohazard bin.")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Remove Tip Boxes from deck. Wipe Down Deck with 70% Ethanol. Once you click 'Resume', pipette head will raise and script will end!")
+    # Record the partly used tip rack of each tip type for the next run
+    tip_prompts = []
+    for racks, used, aside in [(tipracks, used_columns, set_aside), (tipracks_2, used_columns_2, set_aside_2)]:
+        if aside:# IE the partly used rack set aside before the run keeps its tip state
+            tip_prompts.append("""Keep the partly used {} uL Tip Box set aside before the run ({} columns used) for the next run.""".format(str(tip_volumes[racks[0].load_name]), str(aside)))
+            continue
+        rack, tip_state[racks[0].load_name] = next_tip_column(racks, used)
+        if rack and tip_state[rack.load_name]:
+            tip_prompts.append("""Keep the partly used Tip Box in position {} ({} columns used) for the next run.""".format(rack.parent, str(tip_state[rack.load_name])))
+    if not dry_run_mode:# IE a dry run puts every tip back
+        save_tip_state(protocol_context, tip_state_file, tip_state)
+    
+    teardown_prompts = [
+        "Remove 20k Dilution BioRad Hard Shell 96-well plate from Temperature Module on deck grid 10. Seal Plate and Vortex(1 minute @ top speed). Centrifuge Briefly(@1500 rpm, 2 minutes). Store on ice until ready to load onto deck for part 2 of the qPCR assay.",
+        "Remove 10k Dilution BioRad Hard Shell 96-well plate from deck grid 3. Seal Plate and Vortex(1 minute @ top speed). Centrifuge Briefly(@1500 rpm, 2 minutes).Store on ice until ready to load onto deck for part 2 of the qPCR assay.",
+        "Please remove Tip Waste from deck grid 12 to biohazard bin.",
+        "Remove Initial Sample Plate from deck grid 1.Seal Plate, and store at 4C until qPCR data analysis is complete.",
+        "Remove PE Pipetting Microplate 2mL DW SQ 96-well plate from deck grid 2 to biohazard bin.",
+        "Remove Agilent 73 mL Reagent Reservoir to biohazard bin.",
+        "Remove Tip Boxes from deck. Wipe Down Deck with 70% Ethanol. Once you click 'Resume', pipette head will raise and script will end!"]
+    if tip_state_file and not dry_run_mode:
+        teardown_prompts[-1:-1] = tip_prompts
+    operator_prompts(protocol_context, teardown_prompts, batch_prompts)
     ##############################################################################################################################################################################
     ##############################################################################################################################################################################
     
@@ -520,7 +836,11 @@ def run(protocol_context):
     # Turn off Temperature Deck, currently deactivated because you usually proceed to Step 2 Immediately
     #temp_deck.deactivate()
     
+    # Close the run timeline, if one was streamed
+    close_timeline(protocol_context)
+
 if __name__ == '__main__':
+    from opentrons import simulate
     protocol = simulate.get_protocol_api('2.10')
     run(protocol)
     for line in protocol.commands():
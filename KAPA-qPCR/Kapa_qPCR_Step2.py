@@ -11,8 +11,10 @@ __date__ = "2021-09-02"
 
 import math
 import json
-from opentrons import protocol_api, types #needed for trying to set specific pipette movements before pipetting
-from opentrons import simulate
+import csv
+import os
+import time
+import itertools
 
 
 def get_values(*names):
@@ -24,7 +26,18 @@ def get_values(*names):
     "sample_number":9,
     "sample_volume":4,
     "master_mix_volume":6.2,
-    "set_temperature":4}""")
+    "set_temperature":4,
+    "multi_dispense":false,
+    "disposal_volume":2,
+    "multi_dispense_offsets":[],
+    "liquid_classes":{},
+    "batch_prompts":false,
+    "sample_sheet":"",
+    "tip_state_file":"",
+    "timeline_file":"",
+    "place_tip_boxes":false,
+    "group_replicates":false,
+    "dry_run":false}""")
     return [_all_values[n] for n in names]
 
 metadata = {
@@ -34,22 +47,437 @@ metadata = {
     'apiLevel': '2.10', 'softwareLevel': '4.50'
     }
 
+# Approximate inner well geometry (mm) used to turn a tracked liquid volume into a meniscus height. The BioRad PCR wells are a cone frustum
+labware_geometry = {
+    'biorad_96_wellplate_200ul_pcr': {'shape': 'frustum', 'bottom_diameter': 2.68, 'top_diameter': 5.46, 'depth': 14.81}
+    }
+
+# Liquid classes, one per transfer: flow rates (uL/s), volume correction (uL added to the set volume), well bottom clearances and
+# blow out heights (mm), touch tip offset (mm), settle time (s) before blow out, and the mount Z speeds (mm/s) of moves into liquid
+# (contact_speed) and between wells (travel_speed). A clearance of None is set by liquid tracking or per replicate, a speed of None
+# is the full mount speed. calibration is a gravimetric [slope, intercept] curve of delivered against set uL per pipette model
+# ({pipette type: [slope, intercept]}), fit by calibrate.py, used in place of correction for that pipette when set. Any setting can be overridden per run through the "liquid_classes" field of get_values
+liquid_classes = {
+    # qPCR Master Mix from the Reagent Plate into the 384 well plate. The -0.3 correction accounts for the pipette overdelivering an
+    # average of 0.35 uL per transfer
+    'master_mix': {'aspirate': 6.2, 'dispense': 6.2, 'blow_out': 20, 'correction': -0.3, 'aspirate_clearance': None,
+                   'dispense_clearance': 2, 'blow_out_height': 2.5, 'touch_tip_offset': -5, 'settle': 3,
+                   'contact_speed': None, 'travel_speed': None, 'calibration': None},
+    'dilute_library': {'aspirate': 4, 'dispense': 4, 'blow_out': 20, 'correction': 0.1, 'aspirate_clearance': None,
+                       'dispense_clearance': 2, 'blow_out_height': 3.5, 'touch_tip_offset': -5, 'settle': 3,
+                       'contact_speed': None, 'travel_speed': None, 'calibration': None},
+    # Standards & NTCs from the Reagent Plate into the 384 well plate. The -0.1 correction is the dilute library +0.1 less a 0.2 uL
+    # overdispense, as standards are kept @4C due to low concetration
+    'standards': {'aspirate': 4, 'dispense': 4, 'blow_out': 20, 'correction': -0.1, 'aspirate_clearance': 2.1,
+                  'dispense_clearance': 2, 'blow_out_height': 3.5, 'touch_tip_offset': -5, 'settle': 3,
+                  'contact_speed': None, 'travel_speed': None, 'calibration': None}
+    }
+
+# qPCR plate layout, one entry per dilution replicate as (dilution, replicate, 384 well row and column of the first sample column,
+# dilution plate aspirate height (mm)). Each sample column goes into every other 384 well column from there, and the 8 channels land
+# on every other 384 well row, so each replicate fills one quadrant of its plate half. Aspirate heights drop with each replicate as
+# the dilution plate wells empty
+qpcr_plate_layout = [
+    ('10k', 1, 'A', 1, 5), ('10k', 2, 'A', 2, 4.6), ('10k', 3, 'B', 1, 4.2),
+    ('20k', 1, 'A', 13, 7), ('20k', 2, 'A', 14, 6.6), ('20k', 3, 'B', 13, 6.2)]
+
+# Standards & NTCs replicates as (replicate, 384 well row and column), in quadrant 4 of the first 6 columns: B2, B4 and B6
+standards_layout = [(1, 'B', 2), (2, 'B', 4), (3, 'B', 6)]
+
+def load_liquid_classes(overrides):
+    """Return liquid_classes with overrides ({class name: {setting: value}}) applied."""
+    return {name: dict(settings, **overrides.get(name, {})) for name, settings in liquid_classes.items()}
+
+def set_volume(liquid_class, volume, pipette_type):
+    """Return the volume (uL) to set for volume uL to be delivered with liquid_class by a pipette_type pipette: from its gravimetric
+    calibration curve for pipette_type (delivered = slope*set + intercept, fit by calibrate.py) when it has one, else volume plus its
+    correction."""
+    calibration = (liquid_class['calibration'] or {}).get(pipette_type)
+    if calibration is not None:
+        slope, intercept = calibration
+        return (volume-intercept)/slope
+    return volume+liquid_class['correction']
+
+def apply_liquid_class(pipette, liquid_class):
+    """Set the flow rates, and any fixed well bottom clearances, of liquid_class on pipette."""
+    pipette.flow_rate.aspirate = liquid_class['aspirate']
+    pipette.flow_rate.dispense = liquid_class['dispense']
+    pipette.flow_rate.blow_out = liquid_class['blow_out']
+    if liquid_class['aspirate_clearance'] is not None:
+        pipette.well_bottom_clearance.aspirate = liquid_class['aspirate_clearance']
+    if liquid_class['dispense_clearance'] is not None:
+        pipette.well_bottom_clearance.dispense = liquid_class['dispense_clearance']
+
+def motion_profile(protocol_context, pipette, speed):
+    """Cap the Z speed (mm/s) of the mount pipette is on at speed, or lift the cap with None. max_speeds 'Z' is the left mount, 'A' the right."""
+    axis = 'Z' if pipette.mount == 'left' else 'A'
+    if speed is None:
+        protocol_context.max_speeds.pop(axis, None)
+    else:
+        protocol_context.max_speeds[axis] = speed
+
+def in_liquid(protocol_context, pipette, liquid_class, command, *args):
+    """Run pipette command (e.g. 'aspirate', its last argument the well) with the liquid_class motion profile. With a contact_speed,
+    the pipette first travels to the top of the well, unless already in it, so only the move down into the liquid runs at contact_speed.
+    Moves out and on to the next well run at travel_speed."""
+    well = args[-1]
+    last_location = protocol_context.location_cache
+    if liquid_class['contact_speed'] is not None and (last_location is None or not last_location.labware.is_well or last_location.labware.as_well() is not well):
+        pipette.move_to(well.top())
+    motion_profile(protocol_context, pipette, liquid_class['contact_speed'])
+    result = getattr(pipette, command)(*args)
+    motion_profile(protocol_context, pipette, liquid_class['travel_speed'])
+    return result
+
+def liquid_height(load_name, volume):
+    """Return the meniscus height (mm above the well bottom) of volume uL in one well of load_name."""
+    geometry = labware_geometry[load_name]
+    if geometry['shape'] == 'rectangular':
+        height = volume/(geometry['x']*geometry['y'])
+    else:
+        bottom_radius = geometry['bottom_diameter']/2
+        slope = (geometry['top_diameter']-geometry['bottom_diameter'])/2/geometry['depth']
+        height = (((3*slope*volume/math.pi)+bottom_radius**3)**(1/3)-bottom_radius)/slope
+    return min(max(height, 0), geometry['depth'])
+
+def aspirate_height(load_name, volume, aspirate_volume, immersion=2, minimum=1):
+    """Return the well bottom clearance that keeps the tip immersion mm below the meniscus left once aspirate_volume uL is drawn from volume uL."""
+    return max(minimum, liquid_height(load_name, volume-aspirate_volume)-immersion)
+
+def settle(protocol_context, seconds):
+    """Let liquid drain down the tip for seconds before blowing out. A settle time of 0 skips the delay."""
+    if seconds > 0:
+        protocol_context.delay(seconds=seconds)
+
+def operator_prompts(protocol_context, prompts, batch=False):
+    """Pause for each of prompts in turn, blinking the rail lights between pauses. With batch, pause once on a numbered checklist of all prompts."""
+    if batch:
+        protocol_context.pause("  ".join(["{}. {}".format(i+1, prompt) for i, prompt in enumerate(prompts)]))
+        return
+    for i, prompt in enumerate(prompts):
+        if i > 0:
+            protocol_context.set_rail_lights(False)
+            protocol_context.delay(seconds=1)
+            protocol_context.set_rail_lights(True)
+        protocol_context.pause(prompt)
+
+def read_sample_sheet(sample_sheet, sample_number):
+    """Return {Initial Sample Plate well: sample ID} from the CSV sample_sheet text, one "Well,Sample" line per well (a header line is
+    skipped, wells with a blank sample are empty). Without a sample sheet, the first sample_number wells down the columns are numbered 1 on."""
+    if not sample_sheet.strip():
+        return {'{}{}'.format('ABCDEFGH'[i%8], (i//8)+1): str(i+1) for i in range(sample_number)}
+    sample_ids = {}
+    for line in csv.reader(sample_sheet.strip().splitlines()):
+        if len(line) < 2 or line[0].strip().lower() == 'well' or not line[1].strip():
+            continue
+        sample_ids[line[0].strip().upper()] = line[1].strip()
+    return sample_ids
+
+def sample_columns(sample_ids):
+    """Return the Initial Sample Plate columns (0 based, in order) holding at least one of sample_ids."""
+    return sorted(set(int(well[1:])-1 for well in sample_ids))
+
+def load_tip_state(tip_state_file):
+    """Return the tip inventory in tip_state_file as {tip rack load name: # of used columns on the partly used rack}. Without a
+    tip_state_file, or before its first run, every rack is full."""
+    if not tip_state_file or not os.path.exists(tip_state_file):
+        return {}
+    with open(tip_state_file) as state_file:
+        return json.load(state_file)
+
+def save_tip_state(protocol_context, tip_state_file, tip_state):
+    """Write tip_state to tip_state_file for the next run. Skipped when simulating, or without a tip_state_file."""
+    if not tip_state_file or protocol_context.is_simulating():
+        return
+    with open(tip_state_file, 'w') as state_file:
+        json.dump(tip_state, state_file)
+
+def plan_tip_racks(total_tips, used_columns, slots):
+    """Return the slots to load tip racks into for total_tips 8 channel tips, the # of used columns to skip on the first, partly used
+    rack, and the # of used columns of a partly used rack set aside for a later run (0 if none). A full rack replaces the partly used
+    one, which is set aside, if skipping its used columns would need more racks than there are slots."""
+    set_aside = 0
+    if math.ceil((total_tips+(used_columns*8))/96) > len(slots):
+        used_columns, set_aside = 0, used_columns
+    return slots[:math.ceil((total_tips+(used_columns*8))/96)], used_columns, set_aside
+
+def partly_used_note(used_columns, set_aside, slot):
+    """Return the note on the partly used tip rack for a "Load ... Tip Boxes" prompt: the slot it goes in, or that it is set aside."""
+    if used_columns:
+        return "(the partly used box, {} columns used, in position {})".format(str(used_columns), slot)
+    if set_aside:
+        return "(full boxes only: set the partly used box, {} columns used, aside for the next run)".format(str(set_aside))
+    return ""
+
+def next_tip_column(tipracks, used_columns):
+    """Return the first of tipracks still holding tips and its # of used columns, or (None, 0) once all are used up. used_columns is
+    the # of columns skipped on the first rack."""
+    columns = [(rack, i) for rack in tipracks for i in range(len(rack.columns()))][used_columns:]
+    return next(((rack, i) for rack, i in columns if rack.columns()[i][0].has_tip), (None, 0))
+
+# Volume ranges (uL) of the pipettes and tips, and the well capacities (uL) of the labware, the run values are checked against before the run
+pipette_volumes = {'p20_single_gen2': (1, 20), 'p20_multi_gen2': (1, 20), 'p300_single_gen2': (20, 300), 'p300_multi_gen2': (20, 300)}
+tip_volumes = {'opentrons_96_tiprack_20ul': 20, 'opentrons_96_tiprack_300ul': 300}
+well_volumes = {'biorad_96_wellplate_200ul_pcr': 200, 'biorad_384_wellplate_50ul': 50}
+sample_wells = ['{}{}'.format(row, column) for column in range(1, 13) for row in 'ABCDEFGH']# IE the Initial Sample Plate wells
+
+def check_run_values(sample_ids, sample_sheet, sample_number, set_temperature, liquid_class_overrides, pipettes):
+    """Return the problems with the run values every protocol checks: the samples, the Temperature Module temperature, the liquid
+    class overrides and the pipettes ([(pipette type, mount)])."""
+    problems = []
+    if not sample_sheet.strip() and not 1 <= sample_number <= 96:
+        problems.append("sample_number is {}, use 1-96 samples.".format(sample_number))
+    elif sample_sheet.strip():
+        problems += ["Sample sheet well {} is not on the 96 well Initial Sample Plate.".format(well) for well in sample_ids if well not in sample_wells]
+        if not sample_ids:
+            problems.append("The sample sheet lists no samples.")
+    if not 4 <= set_temperature <= 95:
+        problems.append("set_temperature is {} C, the Temperature Module holds 4-95 C.".format(set_temperature))
+    for name, settings in liquid_class_overrides.items():
+        if name not in liquid_classes:
+            problems.append("liquid_classes overrides unknown liquid class {}, use one of {}.".format(name, ", ".join(liquid_classes)))
+            continue
+        problems += ["liquid_classes overrides unknown setting {} of {}.".format(setting, name) for setting in settings if setting not in liquid_classes[name]]
+    for pipette_type, mount in pipettes:
+        if pipette_type not in pipette_volumes:
+            problems.append("Pipette {} is not one of {}.".format(pipette_type, ", ".join(pipette_volumes)))
+        if mount not in ('left', 'right'):
+            problems.append("Pipette mount {} is not left or right.".format(mount))
+    if len(set(mount for pipette_type, mount in pipettes)) < len(pipettes):
+        problems.append("Both pipettes are on the {} mount.".format(pipettes[0][1]))
+    return problems
+
+def check_transfer(problems, transfer, volume, pipette_type, tip_name):
+    """Add to problems if volume uL (of transfer, e.g. "sample_volume_1") is outside the range of pipette_type with tip_name tips."""
+    if pipette_type not in pipette_volumes:
+        return
+    low, high = pipette_volumes[pipette_type][0], min(pipette_volumes[pipette_type][1], tip_volumes[tip_name])
+    if not low <= volume <= high:
+        problems.append("{} aspirates {:g} uL, outside the {:g}-{:g} uL range of the {} with {} tips.".format(transfer, volume, low, high, pipette_type, tip_name))
+
+def check_aliquots(problems, transfer, volume, dispense_offsets, pipette_type):
+    """Add to problems if a multi-dispense of volume uL (of transfer) has an aliquot below the minimum volume of pipette_type, with
+    dispense_offsets[i] added to the i-th aliquot as in multi_dispense."""
+    if pipette_type not in pipette_volumes:
+        return
+    smallest = min([volume]+[volume+offset for offset in dispense_offsets])
+    if smallest < pipette_volumes[pipette_type][0]:
+        problems.append("{} is multi-dispensed in aliquots down to {:g} uL, below the {:g} uL minimum of the {}.".format(transfer, smallest, pipette_volumes[pipette_type][0], pipette_type))
+
+def check_well(problems, contents, volume, load_name):
+    """Add to problems if volume uL (of contents, e.g. "Dilution Buffer in reservoir well A1") overfills a well of load_name."""
+    if volume > well_volumes[load_name]:
+        problems.append("{} comes to {:g} uL, more than the {:g} uL a well of {} holds.".format(contents, volume, well_volumes[load_name], load_name))
+
+def preflight(problems):
+    """Raise one ValueError listing all of problems. Run before the first prompt, so a run that cannot finish fails at the start (and
+    when the protocol is uploaded to the Opentrons App) rather than part way through. Nothing happens without problems."""
+    if problems:
+        raise ValueError("Pre-flight check failed, correct these run values and re-run the protocol: {}".format(
+            "  ".join(["{}. {}".format(i+1, problem) for i, problem in enumerate(problems)])))
+
+# Robot commands recorded in the run timeline, with the names of their positional arguments
+timed_commands = {
+    'aspirate': ('volume', 'location'), 'dispense': ('volume', 'location'), 'mix': ('repetitions', 'volume', 'location'),
+    'blow_out': ('location',), 'touch_tip': ('location',), 'move_to': ('location',), 'pick_up_tip': ('location',), 'drop_tip': ('location',), 'return_tip': (),
+    'reset_tipracks': (), 'delay': ('seconds', 'minutes'), 'pause': ('msg',), 'set_temperature': ('celsius',),
+    'start_set_temperature': ('celsius',), 'await_temperature': ('celsius',), 'deactivate': ()}
+
+def timeline_entry(command, phase, start, end, mount=None, volume=None, location=None):
+    """Return one run timeline line: the command, its phase (from the last "Phase: " comment), mount, volume, the well and column it
+    went to, and its start and end in seconds from the start of the run."""
+    well = location
+    if location is not None and not hasattr(location, 'well_name'):
+        labware = location.labware
+        well = labware.as_well() if labware.is_well else None
+    return dict(command=command, phase=phase, mount=mount, volume=volume, location=str(well) if well is not None else None,
+                column=int(well.well_name[1:]) if well is not None else None, start=round(start, 3), end=round(end, 3), seconds=round(end-start, 3))
+
+class Timed:
+    """Stand-in for the protocol context, a pipette or the temperature module that streams each of its timed_commands to the run
+    timeline as a JSON line. Instruments and modules loaded through a timed protocol context are timed too."""
+
+    def __init__(self, target, timeline):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_timeline', timeline)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if name in ('load_instrument', 'load_module'):
+            return lambda *args, **kwargs: Timed(attribute(*args, **kwargs), self._timeline)
+        if name == 'comment':
+            def comment(msg):
+                if msg.startswith('Phase: '):
+                    self._timeline['phase'] = msg[len('Phase: '):]
+                return attribute(msg)
+            return comment
+        if name not in timed_commands:
+            return attribute
+        def timed_command(*args, **kwargs):
+            start = time.monotonic()
+            result = attribute(*args, **kwargs)
+            arguments = dict(zip(timed_commands[name], args), **kwargs)
+            timeline = self._timeline
+            timeline['file'].write(json.dumps(timeline_entry(name, timeline['phase'], start-timeline['start'], time.monotonic()-timeline['start'],
+                getattr(self._target, 'mount', None), arguments.get('volume'), arguments.get('location')))+'\n')
+            return result
+        return timed_command
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+def timed(protocol_context, timeline_file):
+    """Return protocol_context streaming its run timeline to timeline_file (e.g. under /data on the robot), written a line at a time so
+    an aborted run keeps every command up to the abort. Without a timeline_file, or when simulating, protocol_context itself."""
+    if not timeline_file or protocol_context.is_simulating():
+        return protocol_context
+    return Timed(protocol_context, {'file': open(timeline_file, 'w', buffering=1), 'phase': 'Setup', 'start': time.monotonic()})
+
+class DryRun:
+    """Stand-in for the protocol context, a pipette or the temperature module in a dry run: a mechanical pass over the deck to check
+    its setup and labware calibration before committing samples. Every move and tip pick up of the run is kept, but delays and
+    temperature changes are skipped, mixes run once, Z speeds are never capped, flow rates go no lower than the pipette defaults
+    (floors) and tips go back to their racks instead of the trash, so none are used. Instruments and modules loaded through a dry run
+    protocol context dry run too."""
+
+    def __init__(self, target, floors=None):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_floors', floors or {})
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if name == 'load_instrument':
+            def load_instrument(*args, **kwargs):
+                pipette = attribute(*args, **kwargs)
+                return DryRun(pipette, {rate: getattr(pipette.flow_rate, rate) for rate in ('aspirate', 'dispense', 'blow_out')})
+            return load_instrument
+        if name == 'load_module':
+            return lambda *args, **kwargs: DryRun(attribute(*args, **kwargs))
+        if name == 'flow_rate':
+            return DryRun(attribute, self._floors)
+        if name == 'max_speeds':
+            return {}# IE contact_speed and travel_speed caps go nowhere
+        if name in ('delay', 'set_temperature', 'start_set_temperature', 'await_temperature'):
+            return lambda *args, **kwargs: None
+        if name == 'mix':
+            return lambda repetitions=1, *args, **kwargs: attribute(1, *args, **kwargs)
+        if name == 'drop_tip':
+            return lambda *args, **kwargs: self._target.return_tip()
+        return attribute
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, max(value, self._floors[name]) if name in self._floors else value)
+
+def dry_run(protocol_context, enabled):
+    """Return protocol_context dry running when enabled, else protocol_context itself."""
+    return DryRun(protocol_context) if enabled else protocol_context
+
+def close_timeline(protocol_context):
+    """Close the run timeline file of protocol_context if it is timed (see timed), under any dry run."""
+    while isinstance(protocol_context, (Timed, DryRun)):
+        if isinstance(protocol_context, Timed):
+            protocol_context._timeline['file'].close()
+        protocol_context = protocol_context._target
+
+def plan_tip_slots(protocol_context, slots, work, used_columns=0, trash_slot='12'):
+    """Return slots reordered so the tips for each part of the run come from the racks nearest it. work lists (source slot, # of 8
+    channel tip columns) in run order. Each tip trip runs trash -> tip rack -> source, so racks are taken in turn by the length of that
+    trip. The first rack is the partly used one, with used_columns used. Only where the racks go changes, not the order of the
+    transfers: each transfer takes a fresh tip, so it makes the same trash -> tip rack -> source -> well trip in any order."""
+    position = lambda slot: protocol_context.deck.position_for(slot).point
+    trip = lambda a, b, c: math.hypot(b.x-a.x, b.y-a.y)+math.hypot(c.x-b.x, c.y-b.y)
+    remaining = list(slots)
+    ordered = []
+    left = 0# IE tip columns left on the last rack taken
+    for source_slot, tip_columns in work:
+        while tip_columns > 0 and (left or remaining):
+            if not left:
+                rack = min(remaining, key=lambda slot: trip(position(trash_slot), position(slot), position(source_slot)))
+                remaining.remove(rack)
+                ordered.append(rack)
+                left = 12-(used_columns if len(ordered) == 1 else 0)
+            used = min(left, tip_columns)
+            left, tip_columns = left-used, tip_columns-used
+    return ordered+remaining
+
+def multi_dispense(protocol_context, pipette, volume, source, source_volume, targets, disposal_volume, dispense_offsets, liquid_class, channels=1):
+    """Fill each of targets with volume uL from as few aspirates of source as fit the tip already on pipette.
+
+    Every aspirate carries an extra disposal_volume that is blown back into source. dispense_offsets[i] is the
+    calibration correction (uL) for the i-th dispense of an aspirate, like the -0.3 uL single dispense Master Mix
+    correction. channels is the # of channels drawing from one source well. Each dispense settles and touches tip as set for
+    liquid_class, and the moves run at its speeds (see in_liquid). Returns the volume left in source.
+    """
+    while targets:
+        dispense_volumes = []
+        for i in range(len(targets)):
+            dispense_volume = volume+(dispense_offsets[i] if i < len(dispense_offsets) else 0)
+            if dispense_volumes and sum(dispense_volumes)+dispense_volume+disposal_volume > pipette.max_volume:
+                break
+            dispense_volumes.append(dispense_volume)
+        aspirate_volume = sum(dispense_volumes)+disposal_volume
+        pipette.well_bottom_clearance.aspirate = aspirate_height(source.parent.load_name, source_volume, channels*aspirate_volume)
+        in_liquid(protocol_context, pipette, liquid_class, 'aspirate', aspirate_volume, source)
+        for dispense_volume, target in zip(dispense_volumes, targets):
+            pipette.dispense(dispense_volume, target)
+            settle(protocol_context, liquid_class['settle'])
+            pipette.touch_tip(v_offset=liquid_class['touch_tip_offset'])
+        pipette.blow_out(source.top())
+        source_volume = source_volume-(channels*sum(dispense_volumes))
+        targets = targets[len(dispense_volumes):]
+    return source_volume
+
+def quadrant(row, column):
+    """Return the 384 well quadrant (1-4) of row and column: 1 for odd rows (A, C...) and odd columns, 2 for odd rows and even columns, 3 and 4 for even rows."""
+    return 1+(column+1)%2+(2 if (ord(row)-ord('A'))%2 else 0)
+
+def plate_map(col_num, plate_col_num=6):
+    """Return every multichannel transfer onto the qPCR plates for col_num dilution plate sample columns, in pipetting order.
+
+    Each transfer is a dict of plate (qPCR plate #, 1 based), content ('sample' or 'standards'), dilution ('10k', '20k' or None),
+    replicate, source_column (dilution plate column, None for Standards), well (384 well under the first channel), quadrant (1-4,
+    by the parity of the well row and column) and aspirate_height (dilution plate aspirate clearance, None for Standards). Each qPCR
+    plate takes up to plate_col_num sample columns.
+    """
+    transfers = []
+    for p in range(math.ceil(col_num/plate_col_num)):
+        first_col = p*plate_col_num# IE the first 96 well dilution plate column going onto this qPCR plate
+        for dilution, replicate, row, column, height in qpcr_plate_layout:
+            for e in range(min(plate_col_num, col_num-first_col)):
+                transfers.append(dict(plate=p+1, content='sample', dilution=dilution, replicate=replicate, source_column=first_col+e+1,
+                                      well='{}{}'.format(row, column+(2*e)), quadrant=quadrant(row, column), aspirate_height=height))
+        for replicate, row, column in standards_layout:
+            transfers.append(dict(plate=p+1, content='standards', dilution=None, replicate=replicate, source_column=None,
+                                  well='{}{}'.format(row, column), quadrant=quadrant(row, column), aspirate_height=None))
+    return transfers
+
 
 def run(protocol_context):
 
     [temp_deck, pipette_type, pipette_mount, pipette_type_2, pipette_mount_2, sample_number, sample_volume,
-     master_mix_volume, set_temperature] = get_values(  # noqa: F821
+     master_mix_volume, set_temperature, multi_dispense_mode, disposal_volume, multi_dispense_offsets, liquid_class_overrides, batch_prompts,
+     sample_sheet, tip_state_file, timeline_file, place_tip_boxes, group_replicates, dry_run_mode] = get_values(  # noqa: F821
         "temp_deck", "pipette_type", "pipette_mount", "pipette_type_2", "pipette_mount_2", "sample_number",
-        "sample_volume", "master_mix_volume", "set_temperature"
+        "sample_volume", "master_mix_volume", "set_temperature", "multi_dispense", "disposal_volume", "multi_dispense_offsets", "liquid_classes", "batch_prompts",
+        "sample_sheet", "tip_state_file", "timeline_file", "place_tip_boxes", "group_replicates", "dry_run"
     )
-    # Set Speed of Z Axis
-    protocol_context.max_speeds['Z'] = 100
-    
+    classes = load_liquid_classes(liquid_class_overrides)
+
+    # Optionally stream a timeline of every robot command to timeline_file, to compare measured phase times with estimate_runtime.py
+    protocol_context = timed(protocol_context, timeline_file)
+
+    # Optionally dry run with no reagents to check the deck setup and labware calibration: every move and tip pick up, no waits, and
+    # every tip back in its rack
+    protocol_context = dry_run(protocol_context, dry_run_mode)
+
     # Set tip touch-off to true. Needs to be turned on at start of any script where tiptouching is used
     protocol_context.touch_tip = True
      
     # Load Temperature deck in Slot 10
     temp_deck = protocol_context.load_module(temp_deck, '10')
+    
+    # Start ramping the Temperature Module to the User Defined Variable now so it reaches temperature during deck setup
+    temp_deck.start_set_temperature(set_temperature)
    
    # Populate temp_deck with 96 well PCR Reagent Plate
     temp_plate = temp_deck.load_labware(
@@ -73,538 +501,270 @@ def run(protocol_context):
         'biorad_96_wellplate_200ul_pcr', '3', 'dilution 20k plate')
         
     #Math to make loops work for samples variables
-    col_num = math.ceil(sample_number/8)# IE the total # columns you will be processing. 
-    col_num_384_10k = math.ceil(sample_number/8*2)#Setting the endpoint for the slices below, based on the # of sample columns you need to process for the 10K Dilution Plate
-    col_num_384_20k = math.ceil(sample_number/8*2)+12#Setting the endpoint for the slices below, based on the # of sample columns you need to process for the 20K Dilution Plate
+    sample_ids = read_sample_sheet(sample_sheet, sample_number)
+    col_num = len(sample_columns([well for well in sample_ids if well in sample_wells]))# IE the total # columns you will be processing. Step 1 packs the sample sheet columns into the first dilution plate columns
+    plate_col_num = 6# IE the max # of sample columns that fit on one 384 well qPCR plate (6 columns x 2 dilutions x 3 replicates + Standards & NTCs). Runs with 7-12 columns are split across two qPCR plates
+    plate_num = math.ceil(col_num/plate_col_num)
+    plate_col_nums = [min(plate_col_num, col_num - (plate_col_num*p)) for p in range(plate_num)]# IE the # of sample columns going onto each qPCR plate
     #col_offset = (168 - sample_number) / 8# Leave in if we change to dipsnese standards dynamically. 
-    #standard_col_num = math.ceil(sample_number/8+col_offset)#Leave in if we change to dipsnese standards dynamically.
-    output_qPCR_quad_1_10k = [col for col in qPCR_plate.rows()[0][:col_num_384_10k:2]]#Start at Row A, 1st column (leaving no text before the first: means it will start in the first column; this could start with 0. Pipette SampleNumber/8 (rounded up) # of Columns, skipping a column in between each Sample Column that is pipetted.  
-    output_qPCR_quad_2_10k = [col for col in qPCR_plate.rows()[0][1:col_num_384_10k:2]]#Start at Row A, 2nd column (1 is used since Python is 0 based). Pipette SampleNumber/8 (rounded up) # of Columns, skipping a column in between each Sample Column that is pipetted.
-    output_qPCR_quad_3_10k = [col for col in qPCR_plate.rows()[1][:col_num_384_10k:2]]#Start at Row B, 1st column (leaving no text before the first: means it will start in the first column; this could start with 0. Pipette SampleNumber/8 (rounded up) # of Columns, skipping a column in between each Sample Column that is pipetted.
-    output_qPCR_quad_1_20k = [col for col in qPCR_plate.rows()[0][12:col_num_384_20k:2]]#Start at Row A, 13th column (12 is used since Python is 0 based). Pipette SampleNumber/8 (rounded up) # of Columns, skipping a column in between each Sample Column that is pipetted.
-    output_qPCR_quad_2_20k = [col for col in qPCR_plate.rows()[0][13:col_num_384_20k:2]]##Start at Row A, 14th column (13 is used since Python is 0 based). Pipette SampleNumber/8 (rounded up) # of Columns, skipping a column in between each Sample Column that is pipetted.
-    output_qPCR_quad_3_20k = [col for col in qPCR_plate.rows()[1][12:col_num_384_20k:2]]#Start at Row B, 13th column (12 is used since Python is 0 based). Pipette SampleNumber/8 (rounded up) # of Columns, skipping a column in between each Sample Column that is pipetted.
-    output_standards_quad_4 = [col for col in qPCR_plate.rows()[1][1:6:2]]#Start at Row B, 2nd column (1 is used since Python is 0 based), and proceed untilyou reach column 6. In this case, MM and standards go into B2, B4, and B6. 
+    #standard_col_num = math.ceil(sample_number/8+col_offset)#Leave in if we change to dipsnese standards dynamically. 
     
-    # Use only 20 uL tips per sample in this protocol, tip rack goes in slots 4-9 and 11
-    total_tips = (((col_num*8)*12)+48)# Max Number of Tips for 48 sample run. 
-    tiprack_num = math.ceil(total_tips/96)
-    slots = ['4', '5', '6', '7', '8', '9', '11'][:tiprack_num]
-
+    # Use only 20 uL tips per sample in this protocol, tip rack goes in slots 4-9 and 11. Tip Boxes are refilled between qPCR plates
+    # Optionally group the replicates: one tip per dilution plate column serves its 3 replicates, see Sample Quadrants
+    sample_tip_cols = 2 if group_replicates else 6# IE sample tips per sample column, one per dilution plate column or per replicate
+    if multi_dispense_mode:
+        plate_tips = [((n*8)*sample_tip_cols)+24+(7*8) for n in plate_col_nums]# Sample & Standards tips plus one tip per Master Mix pass
+    else:
+        plate_tips = [((n*8)*(6+sample_tip_cols))+48 for n in plate_col_nums]
+    total_tips = max(plate_tips, default=0)# Max Number of Tips for 48 sample run. 
+    tip_slots = ['4', '5', '6', '7', '8', '9', '11']
+    
+    # Optionally carry partly used tip racks over between runs. The tip inventory in tip_state_file (e.g. under /data on the robot) records
+    # the used columns of the partly used rack of each tip type, which goes in the first slot so pipetting starts from its first full column
+    tip_state = load_tip_state(tip_state_file)
     tip_name = 'opentrons_96_tiprack_20ul'
+    slots, used_columns, set_aside = plan_tip_racks(total_tips, tip_state.get(tip_name, 0), tip_slots)
+    tiprack_num = len(slots)
+    
+    # Optionally place the Tip Boxes by where their tips go to cut gantry travel: Master Mix and Standards tips near the Reagent Plate
+    # on the Temperature Module, sample tips on the way from the trash to the Dilution Plates. The transfer order is left alone, so
+    # Master Mix still goes into every well before the samples. estimate_runtime.py --baseline place_tip_boxes=false reports the time
+    # saved
+    if place_tip_boxes and col_num:
+        master_mix_tip_cols = 7 if multi_dispense_mode else (plate_col_nums[0]*6)+3
+        tip_slots = plan_tip_slots(protocol_context, tip_slots, [('10', master_mix_tip_cols), ('2', plate_col_nums[0]*sample_tip_cols//2), ('3', plate_col_nums[0]*sample_tip_cols//2), ('10', 3)], used_columns)
+        slots = tip_slots[:tiprack_num]
+
     tipracks = [protocol_context.load_labware(tip_name, slot) for slot in slots]
 
     # Telling Pippete Mount (right_pipette, in this case 20 ul multichannel) to use 20 uL tips
     pipette = protocol_context.load_instrument(
         pipette_type, pipette_mount, tip_racks=tipracks)
-     
+    if used_columns:
+        pipette.starting_tip = tipracks[0].columns()[used_columns][0]
     
+    master_mix_dead_volume = 20# IE uL left in each Master Mix column after the last aspirate
 
-    # Define Reagent Source Columns
-    master_mix_col_1 = temp_plate.wells()[0]#IE in Column 1
-    master_mix_col_2 = temp_plate.wells()[8] # IE in Column 2
-    standards_col_4 = temp_plate.wells()[32]# IE in **Column 5**
+    # Define Reagent Source Columns. Each qPCR plate has its own Master Mix and Standards columns on the Reagent Plate
+    master_mix_cols_1 = [1, 3][:plate_num]# IE in Column 1 (Column 3 for the second qPCR plate)
+    master_mix_cols_2 = [2, 4][:plate_num]# IE in Column 2 (Column 4 for the second qPCR plate)
+    standards_cols_4 = [5, 6][:plate_num]# IE in **Column 5** (**Column 6** for the second qPCR plate)
     
     #Math for User Deck Preparation
-    load_tips = ((col_num*8)*12)+48
-    load_tip_boxes = math.ceil(load_tips/96)
-    col_1_MM = math.ceil((((col_num*8)*3)*master_mix_volume)/8+20)
-    col_2_MM = math.ceil(((((col_num*8)*3)+24)*master_mix_volume)/8+20)
+    load_tip_boxes = tiprack_num
+    col_1_MM = [math.ceil((((n*8)*3)*master_mix_volume)/8+master_mix_dead_volume) for n in plate_col_nums]
+    col_2_MM = [math.ceil(((((n*8)*3)+24)*master_mix_volume)/8+master_mix_dead_volume) for n in plate_col_nums]
     col_4_STDs = (sample_volume*3)+20
     
+    # Pre-flight check of the run values against the pipette, tip and labware capacities, reported all at once before the first prompt
+    problems = check_run_values(sample_ids, sample_sheet, sample_number, set_temperature, liquid_class_overrides,
+                                [(pipette_type, pipette_mount)])
+    if total_tips+(used_columns*8) > len(tip_slots)*96:
+        problems.append("The first qPCR plate needs {} 20 uL tips, more than the Tip Boxes in positions {} hold.".format(total_tips, ",".join(tip_slots)))
+    if multi_dispense_mode:
+        check_transfer(problems, "master_mix_volume plus disposal_volume", set_volume(classes['master_mix'], master_mix_volume, pipette_type)+disposal_volume, pipette_type, tip_name)
+        check_aliquots(problems, "master_mix_volume", set_volume(classes['master_mix'], master_mix_volume, pipette_type), multi_dispense_offsets, pipette_type)
+    else:
+        check_transfer(problems, "master_mix_volume", set_volume(classes['master_mix'], master_mix_volume, pipette_type), pipette_type, tip_name)
+    check_transfer(problems, "sample_volume", set_volume(classes['dilute_library'], sample_volume, pipette_type), pipette_type, tip_name)
+    if group_replicates:
+        grouped_volumes = [set_volume(classes['dilute_library'], sample_volume, pipette_type)+(multi_dispense_offsets[i] if i < len(multi_dispense_offsets) else 0) for i in range(3)]
+        check_transfer(problems, "sample_volume for 3 grouped replicates plus disposal_volume", sum(grouped_volumes)+disposal_volume, pipette_type, tip_name)
+        check_aliquots(problems, "sample_volume for grouped replicates", set_volume(classes['dilute_library'], sample_volume, pipette_type), multi_dispense_offsets, pipette_type)
+    check_transfer(problems, "sample_volume (Standards & NTCs)", set_volume(classes['standards'], sample_volume, pipette_type), pipette_type, tip_name)
+    for p in range(plate_num):
+        check_well(problems, "Master Mix in Reagent Plate column {}".format(master_mix_cols_1[p]), col_1_MM[p], temp_plate.load_name)
+        check_well(problems, "Master Mix in Reagent Plate column {}".format(master_mix_cols_2[p]), col_2_MM[p], temp_plate.load_name)
+        check_well(problems, "Standards & NTCs in Reagent Plate column {}".format(standards_cols_4[p]), col_4_STDs, temp_plate.load_name)
+    check_well(problems, "master_mix_volume plus sample_volume", master_mix_volume+sample_volume, qPCR_plate.load_name)
+    preflight(problems)
+    
     protocol_context.set_rail_lights(True)
     #############################################################################################################################################################################
     ##########################################################User Deck Preparation Prompts######################################################################################
     #############################################################################################################################################################################
-    protocol_context.pause("If not already present, load Temperature Module (Gen2) onto deck grid 10, plug in power & USB and press ON button. Wipe Down Deck with 70% Ethanol")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("""Load {} 20 uL Tip Boxes onto deck positions in the following order: 4,5,6,7,8,9,11 """.format(str(load_tip_boxes)))
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Please load BioRad Hardshell 384-well qPCR Plate onto deck grid 1.Tape down with lab tape so side touches do not lift plate off of th deck.")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Load BioRad Hardshell 96-well 10k Dilution Plate onto deck grid 2.")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Load BioRad Hardshell 96-well 20k Dilution Plate onto deck grid 3.")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("""Set up BioRad Hardshell 96-well Reagent Plate as follows: Column 1- pipette {} uL Master Mix into all column wells.""".format(str(col_1_MM)))
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("""Set up BioRad Hardshell 96-well Reagent Plate as follows: Column 2- pipette {} uL Master Mix into all column wells.""".format(str(col_2_MM)))
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("""Set up BioRad Hardshell 96-well Reagent Plate as follows: Column 5- pipette {} uL Standards & NTCs into all column wells.""".format(str(col_4_STDs)))
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Load BioRad Hardshell 96-well Reagent Plate Plate onto the Temperature Module (Gen2) on deck grid 10.")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Review Deck Layout Photo. Make Sure All Plates are unsealed and tip rack overs are removed. Once you click resume, pipetting will begin!")
+    setup_prompts = [
+        "If not already present, load Temperature Module (Gen2) onto deck grid 10, plug in power & USB and press ON button. Wipe Down Deck with 70% Ethanol",
+        """Load {} 20 uL Tip Boxes onto deck positions in the following order: {} {}""".format(str(load_tip_boxes), ",".join(tip_slots), partly_used_note(used_columns, set_aside, tip_slots[0])),
+        "Please load BioRad Hardshell 384-well qPCR Plate onto deck grid 1.Tape down with lab tape so side touches do not lift plate off of th deck.",
+        "Load BioRad Hardshell 96-well 10k Dilution Plate onto deck grid 2.",
+        "Load BioRad Hardshell 96-well 20k Dilution Plate onto deck grid 3."]
+    for p in range(plate_num):
+        setup_prompts += [
+            """Set up BioRad Hardshell 96-well Reagent Plate as follows: Column {}- pipette {} uL Master Mix into all column wells.""".format(str(master_mix_cols_1[p]), str(col_1_MM[p])),
+            """Set up BioRad Hardshell 96-well Reagent Plate as follows: Column {}- pipette {} uL Master Mix into all column wells.""".format(str(master_mix_cols_2[p]), str(col_2_MM[p])),
+            """Set up BioRad Hardshell 96-well Reagent Plate as follows: Column {}- pipette {} uL Standards & NTCs into all column wells.""".format(str(standards_cols_4[p]), str(col_4_STDs))]
+    setup_prompts += [
+        "Load BioRad Hardshell 96-well Reagent Plate Plate onto the Temperature Module (Gen2) on deck grid 10.",
+        "Review Deck Layout Photo. Make Sure All Plates are unsealed and tip rack overs are removed. Once you click resume, pipetting will begin!"]
+    operator_prompts(protocol_context, setup_prompts, batch_prompts)
     ##############################################################################################################################################################################
     ##############################################################################################################################################################################
     
     #Turn off Deck Lights as MasterMix is Light Sensitive
     protocol_context.set_rail_lights(False)
     
-    #Set Temperature of Temperature Module to User Defined Variable
-    temp_deck.set_temperature(set_temperature)
+    # Wait for the Temperature Module to reach the User Defined Variable before Master Mix is dispensed
+    temp_deck.await_temperature(set_temperature)
     
    #Define Master Mix Final Aspirate Volume
-    master_mix_volume = (master_mix_volume)-0.3# subtraction of 0.8 is to account for pipette overdelivering an average of 0.35 uL per trasnsfer
-    
-    # Define Master Mix Flow Rates
-    pipette.flow_rate.aspirate = 6.2
-    pipette.flow_rate.dispense = 6.2
-    pipette.flow_rate.blow_out = 20
-    
-    # Define Aspiration Position
-    if col_num == 6:
-        master_mix_Well_Bottom=7
-    if col_num == 5:
-        master_mix_Well_Bottom=6.4
-    if col_num == 4:
-        master_mix_Well_Bottom=5.8
-    if col_num == 3:
-        master_mix_Well_Bottom=5.2
-    if col_num == 2:
-        master_mix_Well_Bottom=4.6
-    if col_num == 1:
-        master_mix_Well_Bottom=4
-
-    # Dispense qPCR MM for Dilution Plate 1 Rep 1
-    for target in output_qPCR_quad_1_10k:
-        pipette.pick_up_tip()
-        pipette.well_bottom_clearance.aspirate = master_mix_Well_Bottom
-        pipette.well_bottom_clearance.dispense = 2
-        pipette.aspirate(master_mix_volume, master_mix_col_1)
-        pipette.dispense(master_mix_volume, target)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(target.bottom(2.5))
-        pipette.touch_tip(v_offset=-5)
-        pipette.drop_tip()
-        master_mix_Well_Bottom=master_mix_Well_Bottom-0.4
-        
-     # Define Aspiration Position
-    if col_num == 6:
-        master_mix_Well_Bottom=4.6
-    if col_num == 5:
-        master_mix_Well_Bottom=4.4
-    if col_num == 4:
-        master_mix_Well_Bottom=4.2
-    if col_num == 3:
-        master_mix_Well_Bottom=4
-    if col_num == 2:
-        master_mix_Well_Bottom=3.8
-    if col_num == 1:
-        master_mix_Well_Bottom=3.6
-    
-    # Dispense qPCR MM for Dilution Plate 1 Rep 2
-    for target in output_qPCR_quad_2_10k:
-        pipette.pick_up_tip()
-        pipette.well_bottom_clearance.aspirate = master_mix_Well_Bottom
-        pipette.well_bottom_clearance.dispense = 2
-        pipette.aspirate(master_mix_volume, master_mix_col_1)
-        pipette.dispense(master_mix_volume, target)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(target.bottom(2.5))
-        pipette.touch_tip(v_offset=-5)
-        pipette.drop_tip()
-        master_mix_Well_Bottom=master_mix_Well_Bottom-0.4
-        
-    # Define Aspiration Position
-    if col_num == 6:
-        master_mix_Well_Bottom=2.2
-    if col_num == 5:
-        master_mix_Well_Bottom=2.4
-    if col_num == 4:
-        master_mix_Well_Bottom=2.6
-    if col_num == 3:
-        master_mix_Well_Bottom=2.8
-    if col_num == 2:
-        master_mix_Well_Bottom=3.0
-    if col_num == 1:
-        master_mix_Well_Bottom=3.2
-        
-    # Dispense qPCR MM for Dilution Plate 1 Rep 3
-    for target in output_qPCR_quad_3_10k:
-        pipette.pick_up_tip()
-        pipette.well_bottom_clearance.aspirate = master_mix_Well_Bottom
-        pipette.well_bottom_clearance.dispense = 2
-        pipette.aspirate(master_mix_volume, master_mix_col_1)
-        pipette.dispense(master_mix_volume, target)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(target.bottom(2.5))
-        pipette.touch_tip(v_offset=-5)
-        pipette.drop_tip()
-        master_mix_Well_Bottom=master_mix_Well_Bottom-0.4  
-    
-    # Define Aspiration Position for MM Column 2
-    if col_num == 6:
-        master_mix_Well_Bottom=7.4
-    if col_num == 5:
-        master_mix_Well_Bottom=6.8
-    if col_num == 4:
-        master_mix_Well_Bottom=6.2
-    if col_num == 3:
-        master_mix_Well_Bottom=5.6
-    if col_num == 2:
-        master_mix_Well_Bottom=5
-    if col_num == 1:
-        master_mix_Well_Bottom=4.4
-        
-    # Dispense qPCR MM for Dilution Plate 2 Rep 1
-    for target in output_qPCR_quad_1_20k:
-        pipette.pick_up_tip()
-        pipette.well_bottom_clearance.aspirate = master_mix_Well_Bottom
-        pipette.well_bottom_clearance.dispense = 2
-        pipette.aspirate(master_mix_volume, master_mix_col_2)
-        pipette.dispense(master_mix_volume, target)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(target.bottom(2.5))
-        pipette.touch_tip(v_offset=-5)
-        pipette.drop_tip()
-        master_mix_Well_Bottom=master_mix_Well_Bottom-0.4
-        
-     # Define Aspiration Position
-    if col_num == 6:
-        master_mix_Well_Bottom=5
-    if col_num == 5:
-        master_mix_Well_Bottom=4.8
-    if col_num == 4:
-        master_mix_Well_Bottom=4.6
-    if col_num == 3:
-        master_mix_Well_Bottom=4.4
-    if col_num == 2:
-        master_mix_Well_Bottom=4.2
-    if col_num == 1:
-        master_mix_Well_Bottom=4
-        
-    # Dispense qPCR MM for Dilution Plate 2 Rep 2
-    for target in output_qPCR_quad_2_20k:
-        pipette.pick_up_tip()
-        pipette.well_bottom_clearance.aspirate = master_mix_Well_Bottom
-        pipette.well_bottom_clearance.dispense = 2
-        pipette.aspirate(master_mix_volume, master_mix_col_2)
-        pipette.dispense(master_mix_volume, target)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(target.bottom(2.5))
-        pipette.touch_tip(v_offset=-5)
-        pipette.drop_tip()
-        master_mix_Well_Bottom=master_mix_Well_Bottom-0.4
-        
-    # Define Aspiration Position
-    if col_num == 6:
-        master_mix_Well_Bottom=2.6
-    if col_num == 5:
-        master_mix_Well_Bottom=2.8
-    if col_num == 4:
-        master_mix_Well_Bottom=3
-    if col_num == 3:
-        master_mix_Well_Bottom=3.2
-    if col_num == 2:
-        master_mix_Well_Bottom=3.4
-    if col_num == 1:
-        master_mix_Well_Bottom=3.6
-        
-    # Dispense qPCR MM for Dilution Plate 2 Rep 3
-    for target in output_qPCR_quad_3_20k:
-        pipette.pick_up_tip()
-        pipette.well_bottom_clearance.aspirate = master_mix_Well_Bottom
-        pipette.well_bottom_clearance.dispense = 2
-        pipette.aspirate(master_mix_volume, master_mix_col_2)
-        pipette.dispense(master_mix_volume, target)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(target.bottom(2.5))
-        pipette.touch_tip(v_offset=-5)
-        pipette.drop_tip()
-        master_mix_Well_Bottom=master_mix_Well_Bottom-0.4
-        
-     # Define Aspiration Position
-    master_mix_Well_Bottom=1
-    
-    # Dispense qPCR MM for Standards & NTCs
-    for target in output_standards_quad_4:
-        pipette.pick_up_tip()
-        pipette.well_bottom_clearance.aspirate = master_mix_Well_Bottom
-        pipette.well_bottom_clearance.dispense = 2
-        pipette.aspirate(master_mix_volume, master_mix_col_2)
-        pipette.dispense(master_mix_volume, target)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(target.bottom(2.5))
-        pipette.touch_tip(v_offset=-5)
-        pipette.drop_tip()
-    
-    protocol_context.set_rail_lights(True)
-    #############################################################################################################################################################################
-    ##########################################################Prompt to Centrifuge qPCR BioRad Hard Shell 384-well plate#########################################################
-    #############################################################################################################################################################################  
-    protocol_context.pause("Remove qPCR BioRad Hard Shell 384-well plate from deck grid 1. Seal Plate.")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Centrifuge plate briefly to remove all bubbles. ReLoad qPCR BioRad Hard Shell 384-well plate onto deck grid 1. Remove seal. Re-Tape Plate to Deck. Empty Trash! Once you click resume, pipetting will begin!")
-    protocol_context.set_rail_lights(False)
-    ##############################################################################################################################################################################
-    ##############################################################################################################################################################################
-    
-    protocol_context.set_rail_lights(False)
-    
-    # Define Sample Transfer Flow Rates
-    pipette.flow_rate.aspirate = 4
-    pipette.flow_rate.dispense = 4
-    pipette.flow_rate.blow_out = 20
+    master_mix_volume = set_volume(classes['master_mix'], master_mix_volume, pipette_type)
     
     #Define Sample Final Aspirate Volume
-    sample_volume = (sample_volume)+0.1 # additon of 0.1 is to account for pipette underdelivering an average of 0.125 uL per transfer
-    
-    # Define Dilution Plate Aspiration Position Replicate 1
-    dilution_plate_aspirate_Height=5
-    
-    # Transfer Dilution Plate 10K to Quadrant 1 of qPCR Plate. This Code structure will allow you to aspirate from 1 variable source column into 1 variable destination column. This is controlled by the col_num counter. 
-    for e in range(col_num):
-        if e == 0:
-            dilution_10K_source = dilution_10k_plate['A1']
-            qPCR_Dest_10K_Quad_1 = qPCR_plate['A1']
-        if e == 1:
-            dilution_10K_source = dilution_10k_plate['A2']
-            qPCR_Dest_10K_Quad_1 = qPCR_plate['A3']
-        if e == 2:
-            dilution_10K_source = dilution_10k_plate['A3']
-            qPCR_Dest_10K_Quad_1 = qPCR_plate['A5']
-        if e == 3:
-            dilution_10K_source = dilution_10k_plate['A4']
-            qPCR_Dest_10K_Quad_1 = qPCR_plate['A7']
-        if e == 4:
-            dilution_10K_source = dilution_10k_plate['A5']
-            qPCR_Dest_10K_Quad_1 = qPCR_plate['A9']
-        if e == 5:
-            dilution_10K_source = dilution_10k_plate['A6']
-            qPCR_Dest_10K_Quad_1 = qPCR_plate['A11']
-        
-        pipette.pick_up_tip()
-        pipette.well_bottom_clearance.aspirate = dilution_plate_aspirate_Height
-        pipette.well_bottom_clearance.dispense = 2
-        pipette.aspirate(sample_volume, dilution_10K_source)
-        pipette.dispense(sample_volume, qPCR_Dest_10K_Quad_1)
-        pipette.well_bottom_clearance.aspirate = 2
-        pipette.mix(3, sample_volume, qPCR_Dest_10K_Quad_1)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(qPCR_Dest_10K_Quad_1.bottom(3.5))
-        pipette.touch_tip(v_offset=-5)
-        pipette.drop_tip()
-        
-    # Define Dilution Plate Aspiration Position Replicate 2
-    dilution_plate_aspirate_Height=4.6
-    
-      # Transfer Dilution Plate 10K to Quadrant 2 of qPCR Plate
-    for e in range(col_num):
-        if e == 0:
-            dilution_10K_source = dilution_10k_plate['A1']
-            qPCR_Dest_10K_Quad_2 = qPCR_plate['A2']
-        if e == 1:
-            dilution_10K_source = dilution_10k_plate['A2']
-            qPCR_Dest_10K_Quad_2 = qPCR_plate['A4']
-        if e == 2:
-            dilution_10K_source = dilution_10k_plate['A3']
-            qPCR_Dest_10K_Quad_2 = qPCR_plate['A6']
-        if e == 3:
-            dilution_10K_source = dilution_10k_plate['A4']
-            qPCR_Dest_10K_Quad_2 = qPCR_plate['A8']
-        if e == 4:
-            dilution_10K_source = dilution_10k_plate['A5']
-            qPCR_Dest_10K_Quad_2 = qPCR_plate['A10']
-        if e == 5:
-            dilution_10K_source = dilution_10k_plate['A6']
-            qPCR_Dest_10K_Quad_2 = qPCR_plate['A12']
-        
-        pipette.pick_up_tip()
-        pipette.well_bottom_clearance.aspirate = dilution_plate_aspirate_Height
-        pipette.well_bottom_clearance.dispense = 2
-        pipette.aspirate(sample_volume, dilution_10K_source)
-        pipette.dispense(sample_volume, qPCR_Dest_10K_Quad_2)
-        pipette.well_bottom_clearance.aspirate = 2
-        pipette.mix(3, sample_volume, qPCR_Dest_10K_Quad_2)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(qPCR_Dest_10K_Quad_2.bottom(3.5))
-        pipette.touch_tip(v_offset=-5)
-        pipette.drop_tip()
-        
-        
-   # Define Dilution Plate Aspiration Position Replicate 3  
-    dilution_plate_aspirate_Height=4.2
+    standards_volume = set_volume(classes['standards'], sample_volume, pipette_type)
+    sample_volume = set_volume(classes['dilute_library'], sample_volume, pipette_type)
     
-      # Transfer Dilution Plate 10K to Quadrant 3 of qPCR Plate
-    for e in range(col_num):
-        if e == 0:
-            dilution_10K_source = dilution_10k_plate['A1']
-            qPCR_Dest_10K_Quad_3 = qPCR_plate['B1']
-        if e == 1:
-            dilution_10K_source = dilution_10k_plate['A2']
-            qPCR_Dest_10K_Quad_3 = qPCR_plate['B3']
-        if e == 2:
-            dilution_10K_source = dilution_10k_plate['A3']
-            qPCR_Dest_10K_Quad_3 = qPCR_plate['B5']
-        if e == 3:
-            dilution_10K_source = dilution_10k_plate['A4']
-            qPCR_Dest_10K_Quad_3 = qPCR_plate['B7']
-        if e == 4:
-            dilution_10K_source = dilution_10k_plate['A5']
-            qPCR_Dest_10K_Quad_3 = qPCR_plate['B9']
-        if e == 5:
-            dilution_10K_source = dilution_10k_plate['A6']
-            qPCR_Dest_10K_Quad_3 = qPCR_plate['B11']
+    # Fill one qPCR plate per batch of up to 6 sample columns
+    transfers = plate_map(col_num, plate_col_num)
+    dilution_plates = {'10k': dilution_10k_plate, '20k': dilution_20k_plate}
+    for p in range(plate_num):
+        # Group this qPCR plate's transfers from the plate map into one pass per quadrant of each dilution, then one for the Standards & NTCs
+        plate_passes = [list(group) for key, group in itertools.groupby([t for t in transfers if t['plate'] == p+1], key=lambda t: (t['dilution'], t['quadrant']))]
         
-        pipette.pick_up_tip()
-        pipette.well_bottom_clearance.aspirate = dilution_plate_aspirate_Height
-        pipette.well_bottom_clearance.dispense = 2
-        pipette.aspirate(sample_volume, dilution_10K_source)
-        pipette.dispense(sample_volume, qPCR_Dest_10K_Quad_3)
-        pipette.well_bottom_clearance.aspirate = 2
-        pipette.mix(3, sample_volume, qPCR_Dest_10K_Quad_3)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(qPCR_Dest_10K_Quad_3.bottom(3.5))
-        pipette.touch_tip(v_offset=-5)
-        pipette.drop_tip()
-             
-        # Define Dilution Plate Aspiration Position Replicate 1
-    dilution_plate_aspirate_Height=7
+        # Define Reagent Source Columns for this qPCR plate
+        master_mix_col_1 = temp_plate.columns()[master_mix_cols_1[p]-1][0]
+        master_mix_col_2 = temp_plate.columns()[master_mix_cols_2[p]-1][0]
+        standards_col_4 = temp_plate.columns()[standards_cols_4[p]-1][0]
         
-    # Transfer Dilution Plate 20K to Quadrant 1 of qPCR Plate
-    for e in range(col_num):
-        if e == 0:
-            dilution_20K_source = dilution_20k_plate['A1']
-            qPCR_Dest_20K_Quad_1 = qPCR_plate['A13']
-        if e == 1:
-            dilution_20K_source = dilution_20k_plate['A2']
-            qPCR_Dest_20K_Quad_1 = qPCR_plate['A15']
-        if e == 2:
-            dilution_20K_source = dilution_20k_plate['A3']
-            qPCR_Dest_20K_Quad_1 = qPCR_plate['A17']
-        if e == 3:
-            dilution_20K_source = dilution_20k_plate['A4']
-            qPCR_Dest_20K_Quad_1 = qPCR_plate['A19']
-        if e == 4:
-            dilution_20K_source = dilution_20k_plate['A5']
-            qPCR_Dest_20K_Quad_1 = qPCR_plate['A21']
-        if e == 5:
-            dilution_20K_source = dilution_20k_plate['A6']
-            qPCR_Dest_20K_Quad_1 = qPCR_plate['A23']
+        # Swap in a fresh qPCR plate and full Tip Boxes for the next batch of sample columns
+        if p > 0:
+            load_tips = plate_tips[p]
+            load_tip_boxes = math.ceil(load_tips/96)
+            protocol_context.set_rail_lights(True)
+            protocol_context.pause("""Remove qPCR BioRad Hard Shell 384-well plate {} from deck grid 1. Seal Plate with MicroAmp Optical Adhesive Cover and set aside. Load and tape down a new BioRad Hardshell 384-well qPCR Plate ({} of {}) onto deck grid 1.""".format(str(p), str(p+1), str(plate_num)))
+            protocol_context.set_rail_lights(False)
+            protocol_context.delay(seconds=1)
+            protocol_context.set_rail_lights(True)
+            protocol_context.pause("""Empty Trash! Replace Tip Boxes with {} full 20 uL Tip Boxes in the following order: {}. Once you click resume, pipetting will begin!""".format(str(load_tip_boxes), ",".join(tip_slots)))
+            protocol_context.set_rail_lights(False)
+            pipette.reset_tipracks()
+            pipette.starting_tip = None
+            used_columns = 0
         
-        pipette.pick_up_tip()
-        pipette.well_bottom_clearance.aspirate = dilution_plate_aspirate_Height
-        pipette.well_bottom_clearance.dispense = 2
-        pipette.aspirate(sample_volume, dilution_20K_source)
-        pipette.well_bottom_clearance.aspirate = 2
-        pipette.dispense(sample_volume, qPCR_Dest_20K_Quad_1)
-        pipette.mix(3, sample_volume, qPCR_Dest_20K_Quad_1)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(qPCR_Dest_20K_Quad_1.bottom(3.5))
-        pipette.touch_tip(v_offset=-5)
-        pipette.drop_tip()
-        
-    # Define Dilution Plate Aspiration Position Replicate 2
-    dilution_plate_aspirate_Height=6.6
+        protocol_context.comment("Phase: Master Mix")
+
+        # Track the Master Mix left in each reagent plate column so the aspirate height follows the meniscus down
+        master_mix_sources = [master_mix_col_1, master_mix_col_2]
+        master_mix_source_volumes = [col_1_MM[p], col_2_MM[p]]
         
-      # Transfer Dilution Plate 20K to Quadrant 2 of qPCR Plate
-    for e in range(col_num):
-        if e == 0:
-            dilution_20K_source = dilution_20k_plate['A1']
-            qPCR_Dest_20K_Quad_2 = qPCR_plate['A14']
-        if e == 1:
-            dilution_20K_source = dilution_20k_plate['A2']
-            qPCR_Dest_20K_Quad_2 = qPCR_plate['A16']
-        if e == 2:
-            dilution_20K_source = dilution_20k_plate['A3']
-            qPCR_Dest_20K_Quad_2 = qPCR_plate['A18']
-        if e == 3:
-            dilution_20K_source = dilution_20k_plate['A4']
-            qPCR_Dest_20K_Quad_2 = qPCR_plate['A20']
-        if e == 4:
-            dilution_20K_source = dilution_20k_plate['A5']
-            qPCR_Dest_20K_Quad_2 = qPCR_plate['A22']
-        if e == 5:
-            dilution_20K_source = dilution_20k_plate['A6']
-            qPCR_Dest_20K_Quad_2 = qPCR_plate['A24']
+        # Define Master Mix Flow Rates
+        liquid_class = classes['master_mix']
+        apply_liquid_class(pipette, liquid_class)
         
-        pipette.pick_up_tip()
-        pipette.well_bottom_clearance.aspirate = dilution_plate_aspirate_Height
-        pipette.well_bottom_clearance.dispense = 2
-        pipette.aspirate(sample_volume, dilution_20K_source)
-        pipette.dispense(sample_volume, qPCR_Dest_20K_Quad_2)
-        pipette.well_bottom_clearance.aspirate = 2
-        pipette.mix(3, sample_volume, qPCR_Dest_20K_Quad_2)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(qPCR_Dest_20K_Quad_2.bottom(3.5))
-        pipette.touch_tip(v_offset=-5)
-        pipette.drop_tip()
+        # Master Mix passes as (384 well destination columns, Reagent Plate Master Mix column). The 10k replicates draw from the first
+        # Master Mix column, the 20k replicates and the Standards & NTCs from the second
+        master_mix_passes = [([qPCR_plate[t['well']] for t in group], 0 if group[0]['dilution'] == '10k' else 1) for group in plate_passes]
+
+        # Dispense qPCR MM
+        for targets, m in master_mix_passes:
+            master_mix_source = master_mix_sources[m]
+            
+            # Multi-dispense the whole pass with one tip, as MM only goes into clean wells
+            if multi_dispense_mode:
+                pipette.pick_up_tip()
+                master_mix_source_volumes[m] = multi_dispense(protocol_context, pipette, master_mix_volume, master_mix_source, master_mix_source_volumes[m], targets, disposal_volume, multi_dispense_offsets, liquid_class)
+                pipette.drop_tip()
+                continue
+            
+            for target in targets:
+                pipette.pick_up_tip()
+                master_mix_Well_Bottom = aspirate_height(temp_plate.load_name, master_mix_source_volumes[m], master_mix_volume)
+                pipette.well_bottom_clearance.aspirate = master_mix_Well_Bottom
+                in_liquid(protocol_context, pipette, liquid_class, 'aspirate', master_mix_volume, master_mix_source)
+                master_mix_source_volumes[m] = master_mix_source_volumes[m]-master_mix_volume
+                pipette.dispense(master_mix_volume, target)
+                settle(protocol_context, liquid_class['settle'])
+                pipette.blow_out(target.bottom(liquid_class['blow_out_height']))
+                pipette.touch_tip(v_offset=liquid_class['touch_tip_offset'])
+                pipette.drop_tip()
         
+        protocol_context.set_rail_lights(True)
+        #############################################################################################################################################################################
+        ##########################################################Prompt to Centrifuge qPCR BioRad Hard Shell 384-well plate#########################################################
+        #############################################################################################################################################################################  
+        protocol_context.pause("Remove qPCR BioRad Hard Shell 384-well plate from deck grid 1. Seal Plate.")
+        protocol_context.set_rail_lights(False)
+        protocol_context.delay(seconds=1)
+        protocol_context.set_rail_lights(True)
+        protocol_context.pause("Centrifuge plate briefly to remove all bubbles. ReLoad qPCR BioRad Hard Shell 384-well plate onto deck grid 1. Remove seal. Re-Tape Plate to Deck. Empty Trash! Once you click resume, pipetting will begin!")
+        protocol_context.set_rail_lights(False)
+        ##############################################################################################################################################################################
+        ##############################################################################################################################################################################
         
-    # Define Dilution Plate Aspiration Position Replicate 3
-    dilution_plate_aspirate_Height=6.2
-    
-      # Transfer Dilution Plate 10K to Quadrant 3 of qPCR Plate
-    for e in range(col_num):
-        if e == 0:
-            dilution_20K_source = dilution_20k_plate['A1']
-            qPCR_Dest_20K_Quad_3 = qPCR_plate['B13']
-        if e == 1:
-            dilution_20K_source = dilution_20k_plate['A2']
-            qPCR_Dest_20K_Quad_3 = qPCR_plate['B15']
-        if e == 2:
-            dilution_20K_source = dilution_20k_plate['A3']
-            qPCR_Dest_20K_Quad_3 = qPCR_plate['B17']
-        if e == 3:
-            dilution_20K_source = dilution_20k_plate['A4']
-            qPCR_Dest_20K_Quad_3 = qPCR_plate['B19']
-        if e == 4:
-            dilution_20K_source = dilution_20k_plate['A5']
-            qPCR_Dest_20K_Quad_3 = qPCR_plate['B21']
-        if e == 5:
-            dilution_20K_source = dilution_20k_plate['A6']
-            qPCR_Dest_20K_Quad_3 = qPCR_plate['B23']
+        protocol_context.set_rail_lights(False)
+        protocol_context.comment("Phase: Sample Quadrants")
         
-        pipette.pick_up_tip()
-        pipette.well_bottom_clearance.aspirate = dilution_plate_aspirate_Height
-        pipette.well_bottom_clearance.dispense = 2
-        pipette.aspirate(sample_volume, dilution_20K_source)
-        pipette.dispense(sample_volume, qPCR_Dest_20K_Quad_3)
-        pipette.well_bottom_clearance.aspirate = 2
-        pipette.mix(3, sample_volume, qPCR_Dest_20K_Quad_3)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(qPCR_Dest_20K_Quad_3.bottom(3.5))
-        pipette.touch_tip(v_offset=-5)
-        pipette.drop_tip()
+        # Define Sample Transfer Flow Rates
+        liquid_class = classes['dilute_library']
+        apply_liquid_class(pipette, liquid_class)
         
-    # Define Dilution Plate Aspiration Position for Standards & NTCs
-    dilution_plate_aspirate_Height=2.1
-    sample_volume = (sample_volume-0.2) # to account for 0.2 uL overdispense based on standards being kept @4C due to low concetration.
+        # Optionally group the replicates: one tip per Dilution Plate column draws all 3 replicates plus disposal_volume in one aspirate,
+        # at the plate map aspiration position of the last, and dispenses them in turn with the multi-dispense corrections
+        # (multi_dispense_offsets). The disposal volume is blown out into the trash before mixing each replicate. The tip only carries
+        # over between replicates of the same sample, and never goes back to the Dilution Plate once it has touched Master Mix
+        replicate_groups = {}
+        for group in plate_passes:
+            if group_replicates and group[0]['content'] == 'sample':
+                for t in group:
+                    replicate_groups.setdefault((t['dilution'], t['source_column']), []).append(t)
+        for (dilution, source_column), group in replicate_groups.items():
+            dilution_source = dilution_plates[dilution].rows()[0][source_column-1]
+            targets = [qPCR_plate[t['well']] for t in group]
+            
+            dispense_volumes = [sample_volume+(multi_dispense_offsets[i] if i < len(multi_dispense_offsets) else 0) for i in range(len(targets))]
+            
+            pipette.pick_up_tip()
+            pipette.well_bottom_clearance.aspirate = group[-1]['aspirate_height']
+            in_liquid(protocol_context, pipette, liquid_class, 'aspirate', sum(dispense_volumes)+disposal_volume, dilution_source)
+            for dispense_volume, target in zip(dispense_volumes, targets):
+                in_liquid(protocol_context, pipette, liquid_class, 'dispense', dispense_volume, target)
+            pipette.blow_out(protocol_context.fixed_trash['A1'])
+            pipette.well_bottom_clearance.aspirate = liquid_class['dispense_clearance']
+            for target in targets:
+                in_liquid(protocol_context, pipette, liquid_class, 'mix', 3, sample_volume, target)
+                settle(protocol_context, liquid_class['settle'])
+                pipette.blow_out(target.bottom(liquid_class['blow_out_height']))
+                pipette.touch_tip(v_offset=liquid_class['touch_tip_offset'])
+            pipette.drop_tip()
         
-     # Dispense Standards & NTCs into qPCR Plate
-    for target in output_standards_quad_4:
-        pipette.pick_up_tip()
-        pipette.well_bottom_clearance.aspirate = dilution_plate_aspirate_Height
-        pipette.well_bottom_clearance.dispense = 2
-        pipette.aspirate(sample_volume, standards_col_4)
-        pipette.dispense(sample_volume, target)
-        pipette.well_bottom_clearance.aspirate = 2
-        pipette.mix(3, sample_volume, target)
-        protocol_context.delay(seconds=3)
-        pipette.blow_out(target.bottom(3.5))
-        pipette.touch_tip(v_offset=-5)
-        pipette.drop_tip()
+        # Transfer each Dilution Plate replicate to its quadrant of the qPCR Plate, one sample column per tip. The plate map sets the
+        # Dilution Plate aspiration position, a little lower for each replicate as the wells empty
+        for group in plate_passes:
+            if group_replicates or group[0]['content'] != 'sample':
+                continue
+            dilution_plate = dilution_plates[group[0]['dilution']]
+            for t in group:
+                dilution_source = dilution_plate.rows()[0][t['source_column']-1]
+                target = qPCR_plate[t['well']]
+                
+                pipette.pick_up_tip()
+                pipette.well_bottom_clearance.aspirate = t['aspirate_height']
+                in_liquid(protocol_context, pipette, liquid_class, 'aspirate', sample_volume, dilution_source)
+                in_liquid(protocol_context, pipette, liquid_class, 'dispense', sample_volume, target)
+                pipette.well_bottom_clearance.aspirate = liquid_class['dispense_clearance']
+                in_liquid(protocol_context, pipette, liquid_class, 'mix', 3, sample_volume, target)
+                settle(protocol_context, liquid_class['settle'])
+                pipette.blow_out(target.bottom(liquid_class['blow_out_height']))
+                pipette.touch_tip(v_offset=liquid_class['touch_tip_offset'])
+                pipette.drop_tip()
+            
+        protocol_context.comment("Phase: Standards")
+
+        # Define Standards & NTCs Flow Rates and Aspiration Position
+        liquid_class = classes['standards']
+            
+         # Dispense Standards & NTCs into qPCR Plate
+        for target in [qPCR_plate[t['well']] for group in plate_passes if group[0]['content'] == 'standards' for t in group]:
+            pipette.pick_up_tip()
+            apply_liquid_class(pipette, liquid_class)
+            in_liquid(protocol_context, pipette, liquid_class, 'aspirate', standards_volume, standards_col_4)
+            in_liquid(protocol_context, pipette, liquid_class, 'dispense', standards_volume, target)
+            pipette.well_bottom_clearance.aspirate = liquid_class['dispense_clearance']
+            in_liquid(protocol_context, pipette, liquid_class, 'mix', 3, standards_volume, target)
+            settle(protocol_context, liquid_class['settle'])
+            pipette.blow_out(target.bottom(liquid_class['blow_out_height']))
+            pipette.touch_tip(v_offset=liquid_class['touch_tip_offset'])
+            pipette.drop_tip()
 
     protocol_context.set_rail_lights(True)
         
@@ -614,30 +774,38 @@ def run(protocol_context):
     ################################################################################################################################################################################
     ######################################################################Deck Unloading Instructions###############################################################################
     ################################################################################################################################################################################
-    protocol_context.pause("Please remove Tip Waste from deck grid 12 to biohazard bin.")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Remove Dilution Plates from deck grid 2 & 3 to biohazard bin.")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Remove Reagent Plate from deck grid 10 Temperature Module to biohazard bin.")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Seal qPCR plate with MicroAmp Optical Adhesive Cover and remove from deck.")
-    protocol_context.set_rail_lights(False)
-    protocol_context.delay(seconds=1)
-    protocol_context.set_rail_lights(True)
-    protocol_context.pause("Remove Tip Boxes from deck. Wipe Down Deck with 70% Ethanol. Once you click 'Resume', pipette head will raise and script will end!")
+    # Record the partly used tip rack of each tip type for the next run
+    tip_prompts = []
+    for racks, used, aside in [(tipracks, used_columns, set_aside)]:
+        if aside:# IE the partly used rack set aside before the run keeps its tip state
+            tip_prompts.append("""Keep the partly used {} uL Tip Box set aside before the run ({} columns used) for the next run.""".format(str(tip_volumes[racks[0].load_name]), str(aside)))
+            continue
+        rack, tip_state[racks[0].load_name] = next_tip_column(racks, used)
+        if rack and tip_state[rack.load_name]:
+            tip_prompts.append("""Keep the partly used Tip Box in position {} ({} columns used) for the next run.""".format(rack.parent, str(tip_state[rack.load_name])))
+    if not dry_run_mode:# IE a dry run puts every tip back
+        save_tip_state(protocol_context, tip_state_file, tip_state)
+    
+    teardown_prompts = [
+        "Please remove Tip Waste from deck grid 12 to biohazard bin.",
+        "Remove Dilution Plates from deck grid 2 & 3 to biohazard bin.",
+        "Remove Reagent Plate from deck grid 10 Temperature Module to biohazard bin.",
+        "Seal qPCR plate with MicroAmp Optical Adhesive Cover and remove from deck.",
+        "Remove Tip Boxes from deck. Wipe Down Deck with 70% Ethanol. Once you click 'Resume', pipette head will raise and script will end!"]
+    if tip_state_file and not dry_run_mode:
+        teardown_prompts[-1:-1] = tip_prompts
+    operator_prompts(protocol_context, teardown_prompts, batch_prompts)
     ################################################################################################################################################################################
     ################################################################################################################################################################################
     
     #protocol_context.set_rail_lights(False) #if this is left on, then on your next run, you cannot keep light on even if you turn it on via code. The light will flash but not stay on.
     protocol_context.set_rail_lights(False) # is above note true?? Test with real samples. Test with Closing opentrons App, then turning back on. If that doesnt work, try hard booting the Robot, and see if it works.    
     
+    # Close the run timeline, if one was streamed
+    close_timeline(protocol_context)
+
 if __name__ == '__main__':
+    from opentrons import simulate
     protocol = simulate.get_protocol_api('2.10')
     run(protocol)
     for line in protocol.commands():
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+"""
+Standard curve and library quantification for the KAPA qPCR protocols
+
+Reads the Cq export of each qPCR plate and the run's plate map from
+export_plate_map.py, or from Step 2's plate_map() for --samples or
+--sample-sheet. Each plate gets a standard curve fit on its KAPA DNA
+Standards 1-6 (20 pM down to 0.0002 pM, 452 bp), with the PCR
+efficiency, R squared and a check of the NTCs. Each library's
+concentration comes from the mean Cq of its 1:10k and 1:20k replicates.
+It is size adjusted to --fragment-length and back-calculated through
+the Step 1 dilutions set by sample_volume_* and dilution_volume_*. Every
+plate and library is worked out at once, as arrays.
+
+Flags:
+- A replicate more than --replicate-tolerance cycles from the median of
+  its triplicate is an outlier and is left out of the mean.
+- A library is flagged when its two dilutions give concentrations more
+  than --dilution-tolerance apart, relative to their mean.
+- A library is flagged when a dilution falls outside the standard
+  curve.
+
+Cq exports are CSV files with a Well and a Cq (or Ct) column, like the
+Bio-Rad CFX "Quantification Cq Results" export. Give them in qPCR plate
+order.
+
+Usage:
+    python analyze_qpcr.py plate1_cq.csv --samples 48
+    python analyze_qpcr.py plate1_cq.csv plate2_cq.csv --plate-map plate_map.csv --fragment-length 550 --output libraries.csv
+    python analyze_qpcr.py plate1_cq.csv --sample-sheet samples.csv --set sample_volume_1=4 --set dilution_volume_1=996
+"""
+
+import argparse
+import csv
+import math
+import os
+import re
+import warnings
+
+import numpy as np
+
+import estimate_runtime
+import export_plate_map
+
+
+# KAPA DNA Standards by Reagent Plate row (pM), None for the NTCs in rows G and H
+standard_concentrations = [20, 2, 0.2, 0.02, 0.002, 0.0002, None, None]
+standard_length = 452# bp
+dilutions = ['10k', '20k']
+
+# KAPA acceptance criteria for a standard curve
+efficiency_range = (0.9, 1.1)
+min_r_squared = 0.99
+ntc_margin = 3# cycles an NTC must come up after Standard 6
+
+well_pattern = re.compile(r'^([A-P])0*(\d+)$')
+fields = ['plate', 'source_well', 'sample', 'cq_10k', 'cq_20k', 'nM_10k', 'nM_20k', 'concentration_nM', 'flags']
+
+
+def read_cq(path):
+    """Return {384 well: Cq} from a qPCR Cq export, NaN for wells that did not come up. Rows above the header are skipped, and a
+    well listed more than once (e.g. once per fluorophore) keeps its first Cq."""
+    with open(path, newline='', encoding='utf-8-sig') as cq_file:
+        lines = list(csv.reader(cq_file))
+    for h, header in enumerate(lines):
+        names = [name.strip().lower() for name in header]
+        cq_column = next((names.index(name) for name in ('cq', 'ct', 'c(t)') if name in names), None)
+        if 'well' in names and cq_column is not None:
+            break
+    else:
+        raise ValueError("{} has no Well and Cq columns".format(path))
+    well_column = names.index('well')
+    cqs = {}
+    for line in lines[h+1:]:
+        match = well_pattern.match(line[well_column].strip()) if len(line) > max(well_column, cq_column) else None
+        if match:
+            try:
+                cq = float(line[cq_column])
+            except ValueError:# IE Undetermined, N/A or blank
+                cq = math.nan
+            cqs.setdefault(match.group(1)+match.group(2), cq)
+    return cqs
+
+
+def dilution_factors(protocol_path, values=None):
+    """Return the total dilution of the 1:10k and 1:20k Dilution Plates, from the protocol's sample_volume_* and dilution_volume_*."""
+    protocol = estimate_runtime.load_protocol(protocol_path, values)
+    sample_volume_1, dilution_volume_1, sample_volume_2, dilution_volume_2, sample_volume_3, dilution_volume_3 = protocol.get_values(
+        "sample_volume_1", "dilution_volume_1", "sample_volume_2", "dilution_volume_2", "sample_volume_3", "dilution_volume_3")
+    dilution_10k = ((sample_volume_1+dilution_volume_1)/sample_volume_1)*((sample_volume_2+dilution_volume_2)/sample_volume_2)
+    return np.array([dilution_10k, dilution_10k*((sample_volume_3+dilution_volume_3)/sample_volume_3)])
+
+
+def fit_standards(cq_standards):
+    """Fit Cq = slope*log10(pM) + intercept to the (plate, standard, replicate) Cq array of Standards 1-6. Returns per plate arrays of
+    slope, intercept, R squared and efficiency, NaN for plates with too few standards to fit."""
+    x = np.broadcast_to(np.log10(standard_concentrations[:6])[None, :, None], cq_standards[:, :6].shape)
+    y = cq_standards[:, :6]
+    ok = np.isfinite(y)
+    x, y = np.where(ok, x, 0), np.where(ok, y, 0)
+    n = ok.sum((1, 2))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sum_x, sum_y, sum_xx, sum_xy = x.sum((1, 2)), y.sum((1, 2)), (x*x).sum((1, 2)), (x*y).sum((1, 2))
+        slope = ((n*sum_xy)-(sum_x*sum_y))/((n*sum_xx)-(sum_x**2))
+        intercept = (sum_y-(slope*sum_x))/n
+        residual = np.where(ok, y-((slope[:, None, None]*x)+intercept[:, None, None]), 0)
+        spread = np.where(ok, y-(sum_y/n)[:, None, None], 0)
+        r_squared = 1-((residual**2).sum((1, 2))/(spread**2).sum((1, 2)))
+        efficiency = (10**(-1/slope))-1
+    return slope, intercept, r_squared, efficiency
+
+
+def analyze(rows, cq_plates, factors, fragment_length=standard_length, replicate_tolerance=0.5, dilution_tolerance=0.1):
+    """Quantify every library in the plate map rows from cq_plates (one {well: Cq} per qPCR plate) and the dilution factors of the
+    1:10k and 1:20k plates. Returns (curves, libraries): a dict per plate and one per library, with its flags."""
+    plate_num = len(cq_plates)
+    rows = [r for r in rows if r['content'] in ('sample', 'standards') and r['plate'] <= plate_num]
+    libraries = list(dict.fromkeys((r['plate'], r['source_well'], r['sample']) for r in rows if r['content'] == 'sample'))
+    library_index = {library: i for i, library in enumerate(libraries)}
+
+    # Lay every Cq out as (plate, standard, replicate) and (library, dilution, replicate) arrays, NaN where a well has no Cq
+    cq_standards = np.full((plate_num, len(standard_concentrations), 3), np.nan)
+    cq_libraries = np.full((len(libraries), len(dilutions), 3), np.nan)
+    for r in rows:
+        cq = cq_plates[r['plate']-1].get(r['well'], np.nan)
+        if r['content'] == 'standards':
+            cq_standards[r['plate']-1, export_plate_map.standard_labels.index(r['sample']), r['replicate']-1] = cq
+        else:
+            cq_libraries[library_index[(r['plate'], r['source_well'], r['sample'])], dilutions.index(r['dilution']), r['replicate']-1] = cq
+
+    slope, intercept, r_squared, efficiency = fit_standards(cq_standards)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)# IE all NaN slices, from wells that did not come up
+        standard_cqs = np.nanmean(cq_standards, 2)
+        ntc_cq = np.nanmin(cq_standards[:, 6:], (1, 2))
+
+        # Replicate outliers, against the median of a full triplicate
+        replicates = np.isfinite(cq_libraries).sum(2)
+        median = np.nanmedian(cq_libraries, 2)
+        outliers = (replicates[..., None] == 3) & (np.abs(cq_libraries-median[..., None]) > replicate_tolerance)
+        kept = np.where(outliers, np.nan, cq_libraries)
+        mean_cq = np.nanmean(kept, 2)
+        spread = np.nanmax(kept, 2)-np.nanmin(kept, 2)
+
+        # Back-calculate each dilution to the undiluted library (nM), size adjusted to the Standards' fragment length
+        plate = np.array([library[0]-1 for library in libraries], dtype=int)
+        picomolar = 10**((mean_cq-intercept[plate, None])/slope[plate, None])
+        nanomolar = picomolar*factors[None, :]*(standard_length/fragment_length)/1000
+        concentration = np.nanmean(nanomolar, 1)
+        disagreement = np.abs(nanomolar[:, 0]-nanomolar[:, 1])/concentration
+        out_of_range = (mean_cq < standard_cqs[plate, 0, None]) | (mean_cq > standard_cqs[plate, 5, None])
+
+    curves = []
+    for p in range(plate_num):
+        flags = []
+        if not efficiency_range[0] <= efficiency[p] <= efficiency_range[1]:
+            flags.append("efficiency {:.0%}".format(efficiency[p]))
+        if not r_squared[p] >= min_r_squared:
+            flags.append("R squared {:.3f}".format(r_squared[p]))
+        if ntc_cq[p] < standard_cqs[p, 5]+ntc_margin:
+            flags.append("NTC Cq {:.1f}".format(ntc_cq[p]))
+        curves.append(dict(plate=p+1, slope=slope[p], intercept=intercept[p], r_squared=r_squared[p], efficiency=efficiency[p], flags=flags))
+
+    results = []
+    for i, (p, source_well, sample) in enumerate(libraries):
+        flags = []
+        for d, dilution in enumerate(dilutions):
+            flags.extend("{} replicate {} outlier".format(dilution, r+1) for r in np.flatnonzero(outliers[i, d]))
+            if replicates[i, d] < 3:
+                flags.append("{} {} of 3 replicates".format(dilution, replicates[i, d]))
+            if spread[i, d] > replicate_tolerance:
+                flags.append("{} replicates {:.1f} cycles apart".format(dilution, spread[i, d]))
+            if out_of_range[i, d]:
+                flags.append("{} outside standards".format(dilution))
+        if disagreement[i] > dilution_tolerance:
+            flags.append("dilutions {:.0%} apart".format(disagreement[i]))
+        results.append(dict(plate=p, source_well=source_well, sample=sample, cq_10k=mean_cq[i, 0], cq_20k=mean_cq[i, 1], nM_10k=nanomolar[i, 0],
+                            nM_20k=nanomolar[i, 1], concentration_nM=concentration[i], flags=flags))
+    return curves, results
+
+
+def write_libraries(libraries, path):
+    with open(path, 'w', newline='') as output:
+        writer = csv.DictWriter(output, fieldnames=fields)
+        writer.writeheader()
+        for library in libraries:
+            writer.writerow({f: ('' if isinstance(v, float) and math.isnan(v) else round(v, 4) if isinstance(v, float) else v)
+                             for f, v in dict(library, flags='; '.join(library['flags'])).items()})
+
+
+def main(argv=None):
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('cq', nargs='+', help="Cq export of each qPCR plate, in plate order")
+    parser.add_argument('--plate-map', help="plate map .csv or .json from export_plate_map.py")
+    parser.add_argument('--samples', type=int, default=0, help="sample_number of the run, without a plate map or sample sheet")
+    parser.add_argument('--sample-sheet', help="\"Well,Sample\" CSV sample sheet of the run, without a plate map")
+    parser.add_argument('--protocol', default=os.path.join(here, 'Kapa_qPCR_Step2.py'), help="protocol whose plate_map() placed the samples")
+    parser.add_argument('--dilution-protocol', default=os.path.join(here, 'Kapa_qPCR_Step1.py'), help="protocol that made the dilutions")
+    parser.add_argument('--set', action='append', metavar='NAME=VALUE', help="override a get_values() field of the run (JSON value)")
+    parser.add_argument('--fragment-length', type=float, default=standard_length, help="average library fragment length (bp)")
+    parser.add_argument('--replicate-tolerance', type=float, default=0.5, help="cycles a replicate may be from its triplicate's median")
+    parser.add_argument('--dilution-tolerance', type=float, default=0.1, help="fraction the two dilutions' concentrations may differ by")
+    parser.add_argument('--output', help="also write the libraries to this .csv")
+    args = parser.parse_args(argv)
+
+    values = estimate_runtime.parse_values(args.set)
+    if args.plate_map:
+        rows = export_plate_map.read_rows(args.plate_map)
+    elif args.samples or args.sample_sheet:
+        sample_sheet = ''
+        if args.sample_sheet:
+            with open(args.sample_sheet) as sheet_file:
+                sample_sheet = sheet_file.read()
+        rows = export_plate_map.protocol_rows(estimate_runtime.load_protocol(args.protocol, values), sample_sheet, args.samples)
+    else:
+        parser.error("give --plate-map, --samples or --sample-sheet")
+
+    curves, libraries = analyze(rows, [read_cq(path) for path in args.cq], dilution_factors(args.dilution_protocol, values),
+                                args.fragment_length, args.replicate_tolerance, args.dilution_tolerance)
+    print('{:<6} {:>8} {:>10} {:>10} {:>11}  {}'.format('Plate', 'Slope', 'Intercept', 'R squared', 'Efficiency', 'Flags'))
+    for c in curves:
+        print('{:<6} {:>8.3f} {:>10.2f} {:>10.4f} {:>11.1%}  {}'.format(c['plate'], c['slope'], c['intercept'], c['r_squared'], c['efficiency'], '; '.join(c['flags'])))
+    print('')
+    print('{:<6} {:<7} {:<20} {:>8} {:>8} {:>10}  {}'.format('Plate', 'Well', 'Sample', 'Cq 10k', 'Cq 20k', 'nM', 'Flags'))
+    for library in libraries:
+        print('{:<6} {:<7} {:<20} {:>8.2f} {:>8.2f} {:>10.3f}  {}'.format(library['plate'], library['source_well'], str(library['sample']), library['cq_10k'],
+                                                                      library['cq_20k'], library['concentration_nM'], '; '.join(library['flags'])))
+    print('{} libraries on {} qPCR plate(s), {} flagged'.format(len(libraries), len(curves), sum(bool(library['flags']) for library in libraries)))
+    if args.output:
+        write_libraries(libraries, args.output)
+
+
+if __name__ == '__main__':
+    main()
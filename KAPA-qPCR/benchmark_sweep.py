@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Parameter sweep benchmark for the KAPA qPCR protocols
+
+Simulates each protocol for every sample_number and every volume set and
+writes one row per run: estimated robot time, tips used against the tips
+loaded, hardware command count and simulator wall time. Commit the output
+and diff it to catch throughput regressions before they reach the robot.
+
+Usage:
+    python benchmark_sweep.py --labware-dir labware --output sweep.csv
+    python benchmark_sweep.py Kapa_qPCR_Step2.py --samples 1 96 --sets sets.json --output sweep.json
+    python benchmark_sweep.py --fast --output sweep.csv
+
+A sets file maps a volume set name to get_values() overrides, e.g.
+    {"default": {}, "multi_dispense": {"multi_dispense": true}}
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+
+import estimate_runtime
+
+
+fields = ['protocol', 'volume_set', 'sample_number', 'estimated_seconds', 'estimated_time', 'tips_used', 'tips_loaded', 'tip_racks', 'commands', 'traced_commands', 'simulator_seconds', 'error']
+
+
+def run_one(protocol_path, values, labware_dir=None, fast=False):
+    """Simulate one configuration and return its benchmark row."""
+    row = dict(protocol=os.path.basename(protocol_path), sample_number=values.get('sample_number'))
+    start = time.perf_counter()
+    try:
+        trace = estimate_runtime.estimate(protocol_path, values, labware_dir, fast=fast)
+    except Exception as e:
+        row.update(simulator_seconds=round(time.perf_counter() - start, 3), error='{}: {}'.format(type(e).__name__, e))
+        return row
+    seconds = sum(c['seconds'] for c in trace.commands)
+    pick_ups = {}
+    loads = {i.mount: 1 for i in trace.instruments}# IE the initial tip box load plus one per mid-run refill
+    for command in trace.commands:
+        if command['command'] == 'pick_up_tip':
+            pick_ups[command['mount']] = pick_ups.get(command['mount'], 0) + 1
+        elif command['command'] == 'reset_tipracks':
+            loads[command['mount']] += 1
+    row.update(
+        estimated_seconds=round(seconds, 1),
+        estimated_time=estimate_runtime.format_seconds(seconds),
+        # Per mount, as "left:used right:used"
+        tips_used=' '.join('{}:{}'.format(i.mount, pick_ups.get(i.mount, 0)*i.channels) for i in trace.instruments),
+        tips_loaded=' '.join('{}:{}'.format(i.mount, loads[i.mount]*sum(len(r.wells()) for r in i.tip_racks)) for i in trace.instruments),
+        tip_racks=' '.join('{}:{}'.format(i.mount, len(i.tip_racks)) for i in trace.instruments),
+        commands=len(trace.context.commands()),
+        traced_commands=len(trace.commands),
+        simulator_seconds=round(time.perf_counter() - start, 3),
+        error='')
+    return row
+
+
+def sweep(protocol_paths, sample_numbers, volume_sets, labware_dir=None, progress=None, fast=False):
+    """Yield a benchmark row for every protocol x volume set x sample_number."""
+    for protocol_path in protocol_paths:
+        for set_name, overrides in volume_sets.items():
+            for sample_number in sample_numbers:
+                values = dict(overrides, sample_number=sample_number)
+                row = run_one(protocol_path, values, labware_dir, fast)
+                row['volume_set'] = set_name
+                if progress:
+                    progress(row)
+                yield row
+
+
+def write_rows(rows, path):
+    """Write rows as CSV, or as JSON if path ends in .json. Rows are sorted so the output diffs cleanly."""
+    rows = sorted(rows, key=lambda r: (r['protocol'], r['volume_set'], r['sample_number']))
+    with open(path, 'w', newline='') as output:
+        if path.endswith('.json'):
+            json.dump([{f: r.get(f, '') for f in fields} for r in rows], output, indent=1)
+            output.write('\n')
+        else:
+            writer = csv.DictWriter(output, fieldnames=fields, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def main(argv=None):
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('protocols', nargs='*', default=[os.path.join(here, 'Kapa_qPCR_Step1.py'), os.path.join(here, 'Kapa_qPCR_Step2.py')])
+    parser.add_argument('--samples', nargs=2, type=int, default=[1, 96], metavar=('FIRST', 'LAST'), help="sample_number range to sweep (inclusive)")
+    parser.add_argument('--step', type=int, default=1, help="sample_number step")
+    parser.add_argument('--sets', help="JSON file of {volume set name: get_values() overrides}")
+    parser.add_argument('--labware-dir', default=os.path.join(here, 'labware'), help="directory of custom labware .json definitions")
+    parser.add_argument('--output', default='sweep.csv', help="output .csv or .json")
+    parser.add_argument('--fast', action='store_true', help="simulate with the recording context instead of opentrons")
+    args = parser.parse_args(argv)
+
+    volume_sets = {'default': {}}
+    if args.sets:
+        with open(args.sets) as sets_file:
+            volume_sets = json.load(sets_file)
+    sample_numbers = range(args.samples[0], args.samples[1] + 1, args.step)
+
+    def progress(row):
+        print('{protocol} {volume_set} n={sample_number}: {0} {1}'.format(row.get('estimated_time', '-'), row['error'], **row))
+
+    write_rows(list(sweep(args.protocols, sample_numbers, volume_sets, args.labware_dir, progress, args.fast)), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Gravimetric calibration of the KAPA qPCR liquid classes
+
+Fits a volume correction curve per pipette, liquid class and flow rate
+from weighing runs. The CSV has one row per weighed dispense, with the
+columns pipette (the pipette model, as in pipette_type, e.g.
+p20_multi_gen2), liquid (the liquid class), flow_rate (uL/s),
+target_volume (the uL set) and measured_mass (mg), and optionally
+density (mg/uL, 1 when left out). Every group gets a least squares line
+delivered = slope*set + intercept, all groups fit at once. A group
+weighed at a single volume gets a slope of 1, a constant correction
+like the hand-set ones.
+
+flow_rate is the dispense rate, and also the aspirate rate of liquid
+classes that aspirate and dispense at one rate (the library, Master
+Mix and Standards classes). The curves at the current rate of each
+liquid class, or at the rate picked with --flow-rate, are printed as
+"liquid_classes" overrides for get_values, one curve per pipette model
+weighed. A protocol then sets every aspirate and dispense volume of that
+class on that pipette from its curve instead of the fixed correction. Validate a raised flow rate this way before
+using it.
+
+Usage:
+    python calibrate.py weighings.csv
+    python calibrate.py weighings.csv --protocol Kapa_qPCR_Step2.py --flow-rate dilute_library=8 --flow-rate standards=8
+"""
+
+import argparse
+import csv
+import json
+import os
+
+import numpy as np
+
+import estimate_runtime
+
+
+def read_weighings(path):
+    """Return the rows of a gravimetric CSV file, with the numeric columns as floats."""
+    with open(path, newline='') as weighings_file:
+        rows = list(csv.DictReader(weighings_file))
+    for row in rows:
+        for column in ('flow_rate', 'target_volume', 'measured_mass'):
+            row[column] = float(row[column])
+        row['density'] = float(row.get('density') or 1)
+    return rows
+
+
+def fit(rows):
+    """Fit delivered = slope*set + intercept for each (pipette, liquid, flow rate) group of rows. Returns {group: dict(slope,
+    intercept, n, rmse, max_error)}, the errors in uL of the fit delivered volumes."""
+    groups = sorted(set((r['pipette'], r['liquid'], r['flow_rate']) for r in rows))
+    index = np.array([groups.index((r['pipette'], r['liquid'], r['flow_rate'])) for r in rows])
+    x = np.array([r['target_volume'] for r in rows])
+    y = np.array([r['measured_mass']/r['density'] for r in rows])
+
+    # Closed form least squares from per group sums, so every group is fit in one pass over the rows
+    n = np.bincount(index, minlength=len(groups))
+    sum_x, sum_y = np.bincount(index, x, len(groups)), np.bincount(index, y, len(groups))
+    sum_xx, sum_xy = np.bincount(index, x*x, len(groups)), np.bincount(index, x*y, len(groups))
+    denominator = (n*sum_xx)-(sum_x**2)
+    spread = denominator > 1e-9*np.maximum(n*sum_xx, 1)# IE weighed at more than one volume
+    slope = np.where(spread, ((n*sum_xy)-(sum_x*sum_y))/np.where(spread, denominator, 1), 1.0)
+    intercept = (sum_y-(slope*sum_x))/n
+
+    residual = y-((slope[index]*x)+intercept[index])
+    rmse = np.sqrt(np.bincount(index, residual**2, len(groups))/n)
+    max_error = np.zeros(len(groups))
+    np.maximum.at(max_error, index, np.abs(residual))
+    return {group: dict(slope=float(slope[g]), intercept=float(intercept[g]), n=int(n[g]), rmse=float(rmse[g]), max_error=float(max_error[g]))
+            for g, group in enumerate(groups)}
+
+
+def overrides(curves, liquid_classes, flow_rates=None):
+    """Return the liquid_classes overrides that calibrate each of liquid_classes with data at its dispense rate, or at its rate in
+    flow_rates ({liquid class: uL/s}), and the notes on what was left out. A liquid class weighed with more than one pipette gets a
+    curve per pipette model."""
+    flow_rates = flow_rates or {}
+    result, notes = {}, []
+    for name, settings in liquid_classes.items():
+        rate = flow_rates.get(name, settings['dispense'])
+        matches = sorted(pipette for pipette, liquid, flow_rate in curves if liquid == name and flow_rate == rate)
+        if not matches:
+            if name in flow_rates or any(liquid == name for pipette, liquid, flow_rate in curves):
+                notes.append("{}: no weighings at {:g} uL/s".format(name, rate))
+            continue
+        result[name] = {'calibration': {pipette: [round(curves[(pipette, name, rate)]['slope'], 4), round(curves[(pipette, name, rate)]['intercept'], 3)]
+                                        for pipette in matches}}
+        if rate != settings['dispense']:
+            result[name]['dispense'] = rate
+            if settings['aspirate'] == settings['dispense']:
+                result[name]['aspirate'] = rate
+    return result, notes
+
+
+def main(argv=None):
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('weighings', help="gravimetric CSV file")
+    parser.add_argument('--protocol', action='append', help="protocol whose liquid classes to calibrate (default: Step 1 and Step 2)")
+    parser.add_argument('--flow-rate', action='append', metavar='CLASS=RATE', help="calibrate CLASS at RATE uL/s instead of its current rate")
+    args = parser.parse_args(argv)
+
+    curves = fit(read_weighings(args.weighings))
+    print('{:<18} {:<18} {:>6} {:>4} {:>8} {:>10} {:>6} {:>6}'.format('Pipette', 'Liquid', 'Rate', 'n', 'Slope', 'Intercept', 'RMSE', 'Max'))
+    for (pipette, liquid, flow_rate), curve in curves.items():
+        print('{:<18} {:<18} {:>6g} {:>4} {:>8.4f} {:>10.3f} {:>6.3f} {:>6.3f}'.format(
+            pipette, liquid, flow_rate, curve['n'], curve['slope'], curve['intercept'], curve['rmse'], curve['max_error']))
+
+    liquid_classes = {}
+    for path in args.protocol or [os.path.join(here, 'Kapa_qPCR_Step1.py'), os.path.join(here, 'Kapa_qPCR_Step2.py')]:
+        liquid_classes.update(estimate_runtime.load_protocol(path).liquid_classes)
+    result, notes = overrides(curves, liquid_classes, {name: float(rate) for name, rate in estimate_runtime.parse_values(args.flow_rate).items()})
+    for note in notes:
+        print(note)
+    print('')
+    print('"liquid_classes":{}'.format(json.dumps(result)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+"""
+Golden command-trace regression check for the KAPA qPCR protocols
+
+Simulates each protocol for a matrix of sample_number values and compares
+the command stream, the tips used per mount and the estimated robot time
+per phase against the golden traces stored in golden/. Any change is
+reported per phase with the time it adds or saves and the first command
+that differs, and the check exits non-zero. After an intended change,
+re-record the golden traces with --update and commit them with it.
+
+Runs under the RecordingContext by default, --simulator uses the
+Opentrons simulator instead. Both give the same traces.
+
+The protocols are uploaded to the robot as single files, so each carries
+its own copy of the shared helpers and tables (liquid classes, labware
+geometry...). The check also fails when a top-level definition that two
+protocols share differs between them, compared by syntax tree so
+comments and formatting are free to differ. Dict tables are compared
+entry by entry.
+
+Usage:
+    python check_traces.py
+    python check_traces.py Kapa_qPCR_Step2.py --samples 8 96
+    python check_traces.py --labware-dir labware --update
+"""
+
+import argparse
+import ast
+import difflib
+import json
+import os
+import re
+import sys
+
+import estimate_runtime
+
+
+default_samples = [1, 8, 9, 24, 48, 96]# a partial and a full first column, a second column started, and half and full plates
+max_samples = {'Kapa_qPCR_Combined.py': 48}# IE the Combined protocol takes up to 6 sample columns
+
+protocol_definitions = {'get_values', 'metadata', 'run'}# top-level definitions each protocol has its own of
+
+
+long_float = re.compile(r'\d+\.\d{4,}')
+
+
+def _value(value):
+    """Round floats, including those in location strings, so the simulator's float noise does not count as a change."""
+    if isinstance(value, float):
+        return round(value, 3)
+    return long_float.sub(lambda m: str(round(float(m.group(0)), 3)), value) if isinstance(value, str) else value
+
+
+def record(protocol_path, sample_number, labware_dir=None, fast=True):
+    """Simulate one case and return its golden trace."""
+    values = dict(sample_number=sample_number)
+    trace = estimate_runtime.estimate(protocol_path, values, labware_dir, fast=fast)
+    phases = {}
+    tips = {i.mount: 0 for i in trace.instruments}
+    commands = []
+    for command in trace.commands:
+        phases[command['phase']] = phases.get(command['phase'], 0) + command['seconds']
+        if command['command'] == 'pick_up_tip':
+            tips[command['mount']] += 1
+        # Times are compared per phase, so they stay out of the command text
+        details = ' '.join('{}={}'.format(k, _value(v)) for k, v in command.items()
+                           if k not in ('phase', 'command', 'seconds', 'travel') and v is not None)
+        commands.append([command['phase'], (command['command']+' '+details).strip()])
+    return dict(protocol=os.path.basename(protocol_path), values=values,
+                seconds=round(sum(phases.values()), 1),
+                phases={phase: round(seconds, 1) for phase, seconds in phases.items()},
+                tips=tips, commands=commands)
+
+
+def golden_path(golden_dir, protocol_path, sample_number):
+    return os.path.join(golden_dir, '{}_{}.json'.format(os.path.splitext(os.path.basename(protocol_path))[0], sample_number))
+
+
+def write_golden(path, golden):
+    """Write a golden trace with one command per line, so it diffs readably."""
+    header = {k: v for k, v in golden.items() if k != 'commands'}
+    with open(path, 'w', encoding='utf-8') as golden_file:
+        golden_file.write(json.dumps(header, indent=1, ensure_ascii=False)[:-2]+',\n "commands": [\n')
+        golden_file.write(',\n'.join('  '+json.dumps(c, ensure_ascii=False) for c in golden['commands']))
+        golden_file.write('\n ]\n}\n')
+
+
+def read_golden(path):
+    with open(path, encoding='utf-8') as golden_file:
+        return json.load(golden_file)
+
+
+def diff(golden, current, tolerance=1.0):
+    """Return the differences between a golden and a current trace as report lines, empty when they match. Phase times within
+    tolerance seconds of the golden ones count as unchanged."""
+    lines = []
+    for mount in sorted(set(golden['tips']) | set(current['tips'])):
+        before, after = golden['tips'].get(mount, 0), current['tips'].get(mount, 0)
+        if before != after:
+            lines.append('tips {}: {} -> {} ({:+d})'.format(mount, before, after, after-before))
+
+    # Commands added and removed per phase, with the first change in each
+    changes = {}
+    matcher = difflib.SequenceMatcher(None, [tuple(c) for c in golden['commands']], [tuple(c) for c in current['commands']], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        for commands, sign, index in ((golden['commands'][i1:i2], '-', 0), (current['commands'][j1:j2], '+', 1)):
+            for phase, text in commands:
+                change = changes.setdefault(phase, [0, 0, []])
+                change[index] += 1
+                if len(change[2]) < 2 and not any(line.startswith(sign) for line in change[2]):
+                    change[2].append('{} {}'.format(sign, text))
+
+    phases = list(golden['phases']) + [p for p in current['phases'] if p not in golden['phases']]
+    for phase in phases:
+        before, after = golden['phases'].get(phase, 0), current['phases'].get(phase, 0)
+        removed, added, examples = changes.get(phase, (0, 0, []))
+        if abs(after-before) <= tolerance and not removed and not added:
+            continue
+        lines.append('{}: {} -> {} ({}{}), {} commands removed, {} added'.format(
+            phase, estimate_runtime.format_seconds(before), estimate_runtime.format_seconds(after),
+            '-' if after < before else '+', estimate_runtime.format_seconds(abs(after-before)), removed, added))
+        lines.extend('    '+example for example in examples)
+    if lines:
+        lines.append('Total: {} -> {}'.format(estimate_runtime.format_seconds(golden['seconds']), estimate_runtime.format_seconds(current['seconds'])))
+    return lines
+
+
+def shared_definitions(protocol_path):
+    """Return {name: syntax tree dump} of the top-level definitions of the protocol at protocol_path, other than its own
+    protocol_definitions. Each entry of a dict table (e.g. liquid_classes) is a definition of its own, named "table['key']"."""
+    with open(protocol_path, encoding='utf-8') as protocol_file:
+        tree = ast.parse(protocol_file.read())
+    definitions = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            name, items = node.name, [(node.name, node)]
+        elif isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            name = node.targets[0].id
+            if isinstance(node.value, ast.Dict) and all(isinstance(k, ast.Constant) for k in node.value.keys):
+                items = [('{}[{!r}]'.format(name, k.value), v) for k, v in zip(node.value.keys, node.value.values)]
+            else:
+                items = [(name, node)]
+        else:
+            continue
+        if name not in protocol_definitions:
+            definitions.update((item, ast.dump(definition)) for item, definition in items)
+    return definitions
+
+
+def check_sync(protocol_paths):
+    """Return a report line for each definition that two or more of the protocols at protocol_paths share but that differs between
+    them, empty when every shared copy matches."""
+    copies = {}
+    for path in protocol_paths:
+        for name, dump in shared_definitions(path).items():
+            copies.setdefault(name, {}).setdefault(dump, []).append(os.path.basename(path))
+    return ['{} differs: {}'.format(name, ' vs '.join(', '.join(paths) for paths in versions.values()))
+            for name, versions in copies.items() if len(versions) > 1]
+
+
+def main(argv=None):
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('protocols', nargs='*', default=[os.path.join(here, name) for name in ('Kapa_qPCR_Step1.py', 'Kapa_qPCR_Step2.py', 'Kapa_qPCR_Combined.py')])
+    parser.add_argument('--samples', nargs='+', type=int, help="sample_number values to check (default: {} or up to each protocol's maximum)".format(' '.join(map(str, default_samples))))
+    parser.add_argument('--golden-dir', default=os.path.join(here, 'golden'), help="directory of the golden traces")
+    parser.add_argument('--labware-dir', default=os.path.join(here, 'labware'), help="directory of custom labware .json definitions")
+    parser.add_argument('--tolerance', type=float, default=1.0, help="seconds a phase may drift before it counts as changed")
+    parser.add_argument('--simulator', action='store_true', help="run under the Opentrons simulator instead of the RecordingContext")
+    parser.add_argument('--update', action='store_true', help="re-record the golden traces instead of checking them")
+    args = parser.parse_args(argv)
+
+    failed = 0
+    if len(args.protocols) > 1:
+        lines = check_sync(args.protocols)
+        print('Shared definitions: {}'.format('CHANGED' if lines else 'ok'))
+        for line in lines:
+            print('  '+line)
+        failed += len(lines)
+    for protocol_path in args.protocols:
+        maximum = max_samples.get(os.path.basename(protocol_path), max(default_samples))
+        for sample_number in args.samples or [n for n in default_samples if n <= maximum]:
+            path = golden_path(args.golden_dir, protocol_path, sample_number)
+            name = os.path.basename(path)
+            try:
+                current = record(protocol_path, sample_number, args.labware_dir, fast=not args.simulator)
+            except Exception as e:
+                print('{}: ERROR {}: {}'.format(name, type(e).__name__, e))
+                failed += 1
+                continue
+            if args.update:
+                os.makedirs(args.golden_dir, exist_ok=True)
+                write_golden(path, current)
+                print('{}: recorded {} commands, {}'.format(name, len(current['commands']), estimate_runtime.format_seconds(current['seconds'])))
+                continue
+            if not os.path.exists(path):
+                print('{}: MISSING, record it with --update'.format(name))
+                failed += 1
+                continue
+            lines = diff(read_golden(path), current, args.tolerance)
+            print('{}: {}'.format(name, 'CHANGED' if lines else 'ok'))
+            for line in lines:
+                print('  '+line)
+            failed += bool(lines)
+    if failed:
+        print('{} case(s) failed'.format(failed))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,441 @@
+#!/usr/bin/env python
+"""
+Offline run-time estimator for the KAPA qPCR protocols
+
+Runs a protocol's run() under the Opentrons simulator with every
+protocol_context, pipette and temperature module call traced, and turns
+the trace into an estimated robot time per phase. Phases are marked in
+the protocols with protocol_context.comment("Phase: ...").
+
+--timeline writes the modelled run in the same JSONL format a protocol
+streams to its "timeline_file" on the robot, and --compare sets such a
+measured timeline against the model phase by phase. --baseline compares
+the model with a second run of other get_values() overrides instead.
+
+Usage:
+    python estimate_runtime.py Kapa_qPCR_Step2.py --set sample_number=48
+    python estimate_runtime.py Kapa_qPCR_Step1.py --labware-dir labware --json
+    python estimate_runtime.py Kapa_qPCR_Step2.py --fast
+    python estimate_runtime.py Kapa_qPCR_Step2.py --set sample_number=48 --compare measured.jsonl
+    python estimate_runtime.py Kapa_qPCR_Step2.py --set place_tip_boxes=true --baseline place_tip_boxes=false
+    python estimate_runtime.py Kapa_qPCR_Step2.py --set dry_run=true --baseline dry_run=false
+"""
+
+import argparse
+import importlib.util
+import json
+import math
+import os
+import re
+
+
+# Timing model for the OT-2. Speeds are in mm/s, times in seconds. Tune these against measured runs
+default_model = {
+    'xy_speed': 400,# default gantry speed
+    'z_speed': 125,# default mount speed when max_speeds does not cap it
+    'travel_margin': 10,# mm above the tallest labware when moving between labware
+    'arc_margin': 10,# mm above the well top when moving within one labware
+    'pick_up_tip': 2.5,# press and retract, excluding travel to the rack
+    'drop_tip': 1.5,# plunger eject, excluding travel to the trash
+    'blow_out': 1.0,
+    'touch_tip': 2.0,# four side touches
+    'plunger_overhead': 0.3,# per aspirate/dispense plunger start and stop
+    'ambient_temperature': 25,
+    'temperature_ramp': 0.035,# deg C per second, ~10 min from ambient to 4 C
+    'pause': 0,# operator time at each pause is not robot time
+    'operator_pause': 60,# per prompt, but a temperature ramp started before a pause keeps running while the operator works
+    }
+
+phase_prefix = 'Phase: '
+well_pattern = re.compile(r'[A-P](\d+) of .+ on \w+')
+checklist_pattern = re.compile(r'(?:^|  )\d+\. ')# an item of a batched prompt checklist, see operator_prompts()
+
+
+def load_protocol(path, values=None):
+    """Import the protocol at path with get_values() overridden by values."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    protocol = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(protocol)
+    if values:
+        get_values = protocol.get_values
+        protocol.get_values = lambda *names: [values.get(n, v) for n, v in zip(names, get_values(*names))]
+    return protocol
+
+
+def load_labware_dir(path):
+    """Return {load name: definition} for the custom labware .json files in path."""
+    labware = {}
+    if path and os.path.isdir(path):
+        for filename in sorted(os.listdir(path)):
+            if filename.endswith('.json'):
+                with open(os.path.join(path, filename)) as labware_file:
+                    definition = json.load(labware_file)
+                labware[definition['parameters']['loadName']] = definition
+    return labware
+
+
+def simulation_context(api_level, labware_dir=None, fast=False):
+    """Return an Opentrons simulator ProtocolContext with any custom labware loaded. With fast, return the dependency-free
+    RecordingContext of recording_context.py instead."""
+    if fast:
+        from recording_context import RecordingContext
+        return RecordingContext(load_labware_dir(labware_dir))
+    from opentrons import simulate
+    return simulate.get_protocol_api(api_level, extra_labware=load_labware_dir(labware_dir) or None)
+
+
+def _point(location):
+    """Return the (x, y, z) deck coordinate and labware of a Well or Location."""
+    if hasattr(location, 'point'):
+        labware = location.labware.as_well() if location.labware.is_well else None
+        return location.point, (labware.parent if labware is not None else None)
+    return location.top().point, location.parent
+
+
+def prompt_count(msg):
+    """Return the # of operator prompts in a pause message: the items of a batched checklist, else 1."""
+    return max(1, len(checklist_pattern.findall(msg or '')))
+
+
+class Trace:
+    """Ordered record of traced commands with their modelled durations."""
+
+    def __init__(self, context, model=None):
+        self.context = context
+        self.model = dict(default_model, **(model or {}))
+        self.commands = []
+        self.instruments = []
+        self.phase = 'Setup'
+        self.position = None
+        self.temperature = self.model['ambient_temperature']
+        self.ramp = None# (clock at start, seconds to target) of a non-blocking temperature ramp
+        self.travel_z = None
+
+    def record(self, command, seconds, **details):
+        entry = dict(phase=self.phase, command=command, seconds=seconds)
+        entry.update(details)
+        self.commands.append(entry)
+        return entry
+
+    def clock(self):
+        """Return the seconds elapsed so far, counting operator_pause for each prompt at a pause, so a batched checklist takes the
+        operator as long as its prompts one at a time."""
+        return sum(c['seconds'] for c in self.commands) + (self.model['operator_pause']*sum(prompt_count(c.get('msg')) for c in self.commands if c['command'] == 'pause'))
+
+    def z_speed(self, mount):
+        axis = 'Z' if mount == 'left' else 'A'# max_speeds 'Z' is the left mount, 'A' the right
+        return min(self.context.max_speeds.get(axis) or self.model['z_speed'], self.model['z_speed'])
+
+    def move(self, location, mount):
+        """Return the modelled seconds to move the mount from its last position to location."""
+        if location is None:
+            return 0
+        point, labware = _point(location)
+        if self.position is None:
+            self.position = (point, labware)
+            return 0
+        last_point, last_labware = self.position
+        self.position = (point, labware)
+        if self.travel_z is None:
+            self.travel_z = max(l.highest_z for l in self.context.loaded_labwares.values()) + self.model['travel_margin']
+        if labware is not None and labware is last_labware:
+            safe_z = labware.highest_z + self.model['arc_margin']
+        else:
+            safe_z = self.travel_z
+        xy = math.hypot(point.x - last_point.x, point.y - last_point.y)
+        if xy == 0:
+            z = abs(point.z - last_point.z)
+        else:
+            z = max(safe_z - last_point.z, 0) + max(safe_z - point.z, 0)
+        return (xy/self.model['xy_speed']) + (z/self.z_speed(mount))
+
+
+class TracedInstrument:
+    """Stand-in for an InstrumentContext that records every liquid handling call."""
+
+    def __init__(self, instrument, trace):
+        object.__setattr__(self, '_instrument', instrument)
+        object.__setattr__(self, '_trace', trace)
+        object.__setattr__(self, '_last_tip', None)
+
+    def __getattr__(self, name):
+        return getattr(self._instrument, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._instrument, name, value)
+
+    def _liquid(self, command, volume, location, rate):
+        trace = self._trace
+        volume = volume if volume is not None else self._instrument.max_volume
+        travel = trace.move(location, self._instrument.mount)
+        seconds = travel + (volume/rate) + trace.model['plunger_overhead']
+        trace.record(command, seconds, travel=travel, volume=volume, rate=rate, mount=self._instrument.mount, location=str(location))
+
+    def aspirate(self, volume=None, location=None, rate=1.0):
+        self._liquid('aspirate', volume, location, self._instrument.flow_rate.aspirate*rate)
+        return self._instrument.aspirate(volume, location, rate)
+
+    def dispense(self, volume=None, location=None, rate=1.0):
+        self._liquid('dispense', volume, location, self._instrument.flow_rate.dispense*rate)
+        return self._instrument.dispense(volume, location, rate)
+
+    def mix(self, repetitions=1, volume=None, location=None, rate=1.0):
+        trace = self._trace
+        volume = volume if volume is not None else self._instrument.max_volume
+        travel = trace.move(location, self._instrument.mount)
+        flow_rate = self._instrument.flow_rate
+        seconds = travel + (repetitions*((volume/(flow_rate.aspirate*rate)) + (volume/(flow_rate.dispense*rate)) + (2*trace.model['plunger_overhead'])))
+        trace.record('mix', seconds, travel=travel, volume=volume*repetitions, repetitions=repetitions, mount=self._instrument.mount, location=str(location))
+        return self._instrument.mix(repetitions, volume, location, rate)
+
+    def blow_out(self, location=None):
+        trace = self._trace
+        travel = trace.move(location, self._instrument.mount)
+        trace.record('blow_out', travel + trace.model['blow_out'], travel=travel, mount=self._instrument.mount, location=str(location))
+        return self._instrument.blow_out(location)
+
+    def touch_tip(self, location=None, radius=1.0, v_offset=-1.0, speed=60.0):
+        self._trace.record('touch_tip', self._trace.model['touch_tip'], mount=self._instrument.mount)
+        return self._instrument.touch_tip(location, radius, v_offset, speed)
+
+    def move_to(self, location, **kwargs):
+        trace = self._trace
+        travel = trace.move(location, self._instrument.mount)
+        trace.record('move_to', travel, travel=travel, mount=self._instrument.mount, location=str(location))
+        return self._instrument.move_to(location, **kwargs)
+
+    def pick_up_tip(self, location=None, **kwargs):
+        trace = self._trace
+        tip = location
+        if tip is None:
+            # Like the pipette, search from the rack holding starting_tip on
+            tipracks = self._instrument.tip_racks
+            starting_tip = self._instrument.starting_tip
+            if starting_tip is not None and starting_tip.parent in tipracks:
+                tipracks = tipracks[tipracks.index(starting_tip.parent):]
+            for i, tiprack in enumerate(tipracks):
+                tip = tiprack.next_tip(self._instrument.channels, starting_tip if i == 0 else None)
+                if tip is not None:
+                    break
+        object.__setattr__(self, '_last_tip', tip)
+        travel = trace.move(tip, self._instrument.mount)
+        trace.record('pick_up_tip', travel + trace.model['pick_up_tip'], travel=travel, mount=self._instrument.mount, location=str(tip))
+        return self._instrument.pick_up_tip(location, **kwargs)
+
+    def drop_tip(self, location=None, **kwargs):
+        trace = self._trace
+        travel = trace.move(location if location is not None else trace.context.fixed_trash.wells()[0], self._instrument.mount)
+        trace.record('drop_tip', travel + trace.model['drop_tip'], travel=travel, mount=self._instrument.mount)
+        return self._instrument.drop_tip(location, **kwargs)
+
+    def reset_tipracks(self):
+        self._trace.record('reset_tipracks', 0, mount=self._instrument.mount)
+        return self._instrument.reset_tipracks()
+
+    def return_tip(self, **kwargs):
+        trace = self._trace
+        travel = trace.move(self._last_tip, self._instrument.mount)
+        trace.record('return_tip', travel + trace.model['drop_tip'], travel=travel, mount=self._instrument.mount)
+        return self._instrument.return_tip(**kwargs)
+
+
+class TracedTemperatureModule:
+    """Stand-in for a TemperatureModuleContext that models the ramp time of set_temperature and start_set_temperature."""
+
+    def __init__(self, module, trace):
+        object.__setattr__(self, '_module', module)
+        object.__setattr__(self, '_trace', trace)
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._module, name, value)
+
+    def set_temperature(self, celsius):
+        trace = self._trace
+        seconds = abs(trace.temperature - celsius)/trace.model['temperature_ramp']
+        trace.temperature = celsius
+        trace.record('set_temperature', seconds, celsius=celsius)
+        return self._module.set_temperature(celsius)
+
+    def start_set_temperature(self, celsius):
+        trace = self._trace
+        trace.ramp = (trace.clock(), abs(trace.temperature - celsius)/trace.model['temperature_ramp'])
+        trace.temperature = celsius
+        trace.record('start_set_temperature', 0, celsius=celsius)
+        return self._module.start_set_temperature(celsius)
+
+    def await_temperature(self, celsius):
+        trace = self._trace
+        seconds = 0
+        if trace.ramp is not None:
+            start, ramp_seconds = trace.ramp
+            seconds = max(0, ramp_seconds - (trace.clock() - start))
+            trace.ramp = None
+        trace.record('await_temperature', seconds, celsius=celsius)
+        return self._module.await_temperature(celsius)
+
+    def deactivate(self):
+        self._trace.temperature = self._trace.model['ambient_temperature']
+        self._trace.ramp = None
+        self._trace.record('deactivate', 0)
+        return self._module.deactivate()
+
+
+class TracedContext:
+    """Stand-in for a ProtocolContext that routes loaded instruments and modules through a Trace."""
+
+    def __init__(self, context, trace):
+        object.__setattr__(self, '_context', context)
+        object.__setattr__(self, '_trace', trace)
+
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._context, name, value)
+
+    def load_instrument(self, *args, **kwargs):
+        instrument = self._context.load_instrument(*args, **kwargs)
+        self._trace.instruments.append(instrument)
+        return TracedInstrument(instrument, self._trace)
+
+    def load_module(self, *args, **kwargs):
+        module = self._context.load_module(*args, **kwargs)
+        if hasattr(module, 'set_temperature'):
+            return TracedTemperatureModule(module, self._trace)
+        return module
+
+    def comment(self, msg):
+        if msg.startswith(phase_prefix):
+            self._trace.phase = msg[len(phase_prefix):]
+        return self._context.comment(msg)
+
+    def delay(self, seconds=0, minutes=0, msg=None):
+        self._trace.record('delay', seconds + (60*minutes))
+        return self._context.delay(seconds=seconds, minutes=minutes, msg=msg)
+
+    def pause(self, msg=None):
+        self._trace.record('pause', self._trace.model['pause'], msg=msg)
+        return self._context.pause(msg)
+
+
+def estimate(protocol_path, values=None, labware_dir=None, model=None, context=None, fast=False):
+    """Run the protocol at protocol_path under simulation (fast: under the RecordingContext) and return its Trace."""
+    protocol = load_protocol(protocol_path, values)
+    if context is None:
+        context = simulation_context(protocol.metadata['apiLevel'], labware_dir, fast)
+    trace = Trace(context, model)
+    protocol.run(TracedContext(context, trace))
+    return trace
+
+
+def summarize(trace, key='phase'):
+    """Return [(phase, seconds, tips, commands)] in run order, plus a 'Total' row. key='command' groups by command instead."""
+    groups = {}
+    for command in trace.commands:
+        row = groups.setdefault(command[key], [0, 0, 0])
+        row[0] += command['seconds']
+        row[1] += command['command'] == 'pick_up_tip'
+        row[2] += 1
+    rows = [(group, seconds, tips, count) for group, (seconds, tips, count) in groups.items()]
+    rows.append(('Total', sum(r[1] for r in rows), sum(r[2] for r in rows), sum(r[3] for r in rows)))
+    return rows
+
+
+def timeline(trace):
+    """Return the trace as run timeline lines, in the format the protocols stream to their timeline_file. Like on the robot, tips picked
+    up from the next tip in the racks have no location."""
+    lines = []
+    clock = 0
+    for command in trace.commands:
+        well = well_pattern.search(command.get('location') or '') if command['command'] != 'pick_up_tip' else None
+        volume = command.get('volume')
+        if volume is not None and command['command'] == 'mix':
+            volume = volume/command['repetitions']
+        lines.append(dict(command=command['command'], phase=command['phase'], mount=command.get('mount'), volume=volume,
+                          location=well.group(0) if well else None, column=int(well.group(1)) if well else None,
+                          start=round(clock, 3), end=round(clock + command['seconds'], 3), seconds=round(command['seconds'], 3)))
+        clock += command['seconds']
+    return lines
+
+
+def read_timeline(path):
+    """Return the lines of a run timeline .jsonl file."""
+    with open(path) as timeline_file:
+        return [json.loads(line) for line in timeline_file if line.strip()]
+
+
+def compare(modelled, measured):
+    """Return [(phase, modelled seconds, measured seconds)] in run order, plus a 'Total' row. Pauses are left out, the time the
+    operator takes at a pause is not robot time."""
+    phases = {}
+    for column, lines in ((0, modelled), (1, measured)):
+        for line in lines:
+            if line['command'] != 'pause':
+                phases.setdefault(line['phase'], [0, 0])[column] += line['seconds']
+    rows = [(phase, seconds[0], seconds[1]) for phase, seconds in phases.items()]
+    rows.append(('Total', sum(r[1] for r in rows), sum(r[2] for r in rows)))
+    return rows
+
+
+def format_seconds(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+
+
+def parse_values(pairs):
+    """Turn ['sample_number=48', 'multi_dispense=true'] into get_values overrides."""
+    values = {}
+    for pair in pairs or []:
+        name, _, value = pair.partition('=')
+        try:
+            values[name] = json.loads(value)
+        except ValueError:
+            values[name] = value
+    return values
+
+
+def main(argv=None):
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('protocol', help="protocol file, e.g. Kapa_qPCR_Step2.py")
+    parser.add_argument('--set', action='append', metavar='NAME=VALUE', help="override a get_values() field (JSON value)")
+    parser.add_argument('--labware-dir', default=os.path.join(here, 'labware'), help="directory of custom labware .json definitions")
+    parser.add_argument('--json', action='store_true', help="print every traced command as JSON instead of the phase table")
+    parser.add_argument('--fast', action='store_true', help="run under the dependency-free RecordingContext instead of the Opentrons simulator")
+    parser.add_argument('--timeline', metavar='FILE', help="also write the modelled run timeline to FILE (.jsonl)")
+    parser.add_argument('--compare', metavar='TIMELINE', help="compare the model with a run timeline measured on the robot")
+    parser.add_argument('--baseline', action='append', metavar='NAME=VALUE', help="compare the model with a run of these overrides on top of --set")
+    args = parser.parse_args(argv)
+
+    trace = estimate(args.protocol, parse_values(args.set), args.labware_dir, fast=args.fast)
+    if args.timeline:
+        with open(args.timeline, 'w') as timeline_file:
+            timeline_file.writelines(json.dumps(line)+'\n' for line in timeline(trace))
+    if args.compare or args.baseline:
+        if args.compare:
+            headers, rows = ('Modelled', 'Measured'), compare(timeline(trace), read_timeline(args.compare))
+        else:
+            baseline = estimate(args.protocol, dict(parse_values(args.set), **parse_values(args.baseline)), args.labware_dir, fast=args.fast)
+            headers, rows = ('Baseline', 'Modelled'), compare(timeline(baseline), timeline(trace))
+        print('{:<22} {:>10} {:>10} {:>10}'.format('Phase', headers[0], headers[1], 'Difference'))
+        for phase, first, second in rows:
+            print('{:<22} {:>10} {:>10} {:>10}'.format(phase, format_seconds(first), format_seconds(second),
+                                                        ('-' if second < first else '+')+format_seconds(abs(second-first))))
+        return
+    if args.json:
+        print(json.dumps(trace.commands, indent=1))
+        return
+    for key in ('phase', 'command'):
+        print('{:<22} {:>10} {:>6} {:>9}'.format(key.title(), 'Robot time', 'Tips', 'Commands'))
+        for group, seconds, tips, count in summarize(trace, key):
+            print('{:<22} {:>10} {:>6} {:>9}'.format(group, format_seconds(seconds), tips, count))
+        print('')
+
+
+if __name__ == '__main__':
+    main()
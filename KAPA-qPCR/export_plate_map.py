@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+qPCR plate map export for the KAPA qPCR protocols
+
+Writes the plate map a protocol pipettes, one row per 384 well, as the plate setup for the qPCR instrument and the
+analysis step. The map comes from the protocol's own plate_map(), so the export always matches what the robot does.
+
+Usage:
+    python export_plate_map.py --samples 48 --output plate_map.csv
+    python export_plate_map.py Kapa_qPCR_Combined.py --sample-sheet samples.csv --output plate_map.json
+
+A sample sheet is the same "Well,Sample" CSV given to the protocol's "sample_sheet" field.
+"""
+
+import argparse
+import csv
+import json
+import os
+
+import estimate_runtime
+
+
+fields = ['plate', 'well', 'content', 'sample', 'dilution', 'replicate', 'quadrant', 'source_well']
+rows_384 = 'ABCDEFGHIJKLMNOP'
+rows_96 = 'ABCDEFGH'
+# Contents of the Standards & NTCs column by Reagent Plate row: KAPA DNA Standards 1-6 in rows A-F, NTCs in rows G and H
+standard_labels = ['Standard {}'.format(i+1) for i in range(6)]+['NTC 1', 'NTC 2']
+
+
+def channel_wells(well, channels=8):
+    """Return the 384 wells under each channel of a multichannel whose first channel is at well. Channels land on every other row."""
+    first_row = rows_384.index(well[0])
+    return ['{}{}'.format(rows_384[first_row+(2*i)], well[1:]) for i in range(channels)]
+
+
+def plate_map_wells(transfers, sample_ids, sample_cols, channels=8):
+    """Expand plate_map() transfers into one row per 384 well.
+
+    sample_ids maps Initial Sample Plate wells to sample IDs, and dilution plate column i holds Initial Sample Plate column
+    sample_cols[i-1], as returned by the protocol's read_sample_sheet() and sample_columns(). source_well is the Initial Sample
+    Plate well. Wells filled from an empty position of a partial column are marked 'empty'. Standards & NTCs are labelled by
+    Reagent Plate row (see standard_labels).
+    """
+    rows = []
+    for t in transfers:
+        for i, well in enumerate(channel_wells(t['well'], channels)):
+            row = dict(plate=t['plate'], well=well, content=t['content'], dilution=t['dilution'], replicate=t['replicate'], quadrant=t['quadrant'])
+            if t['content'] == 'sample':
+                source_well = '{}{}'.format(rows_96[i], sample_cols[t['source_column']-1]+1)
+                row.update(sample=sample_ids.get(source_well), source_well=source_well)
+                if source_well not in sample_ids:
+                    row['content'] = 'empty'
+            else:
+                row.update(sample=standard_labels[i], source_well=None)
+            rows.append(row)
+    return rows
+
+
+def protocol_rows(protocol, sample_sheet='', sample_number=0):
+    """Return the plate map rows of a run of protocol (loaded with estimate_runtime.load_protocol) from its sample sheet text or
+    sample_number."""
+    sample_ids = protocol.read_sample_sheet(sample_sheet, sample_number)
+    sample_cols = protocol.sample_columns(sample_ids)
+    return plate_map_wells(protocol.plate_map(len(sample_cols)), sample_ids, sample_cols)
+
+
+def read_rows(path):
+    """Read rows written by write_rows, with plate, replicate and quadrant as ints and blanks as None."""
+    with open(path, newline='') as plate_map_file:
+        rows = json.load(plate_map_file) if path.endswith('.json') else list(csv.DictReader(plate_map_file))
+    for row in rows:
+        for f in fields:
+            if row.get(f) in ('', None):
+                row[f] = None
+            elif f in ('plate', 'replicate', 'quadrant'):
+                row[f] = int(row[f])
+    return rows
+
+
+def write_rows(rows, path):
+    """Write rows as CSV, or as JSON if path ends in .json."""
+    with open(path, 'w', newline='') as output:
+        if path.endswith('.json'):
+            json.dump([{f: r.get(f) for f in fields} for r in rows], output, indent=1)
+            output.write('\n')
+        else:
+            writer = csv.DictWriter(output, fieldnames=fields, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def main(argv=None):
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('protocol', nargs='?', default=os.path.join(here, 'Kapa_qPCR_Step2.py'), help="protocol file with a plate_map()")
+    parser.add_argument('--samples', type=int, default=0, help="sample_number of the run, without a sample sheet")
+    parser.add_argument('--sample-sheet', help="\"Well,Sample\" CSV sample sheet of the run")
+    parser.add_argument('--output', default='plate_map.csv', help="output .csv or .json")
+    args = parser.parse_args(argv)
+
+    if not args.samples and not args.sample_sheet:
+        parser.error("give --samples or --sample-sheet")
+    sample_sheet = ''
+    if args.sample_sheet:
+        with open(args.sample_sheet) as sheet_file:
+            sample_sheet = sheet_file.read()
+
+    rows = protocol_rows(estimate_runtime.load_protocol(args.protocol), sample_sheet, args.samples)
+    write_rows(rows, args.output)
+    print('{} wells on {} qPCR plate(s) written to {}'.format(len(rows), max(r['plate'] for r in rows), args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,432 @@
+#!/usr/bin/env python
+"""
+Dependency-free recording ProtocolContext for the KAPA qPCR protocols
+
+Implements the part of the Opentrons Protocol API (2.10) the protocols
+use: labware, the temperature module, pipettes with their tips, flow
+rates and well bottom clearances, liquid handling, pauses, delays, rail
+lights and max_speeds. Nothing moves; every command is appended to an
+ordered trace of compact tuples instead. Runs take milliseconds without
+the opentrons package, so sweeps and regression checks can simulate
+thousands of configurations. estimate_runtime.py and benchmark_sweep.py
+use it with --fast.
+
+Well positions follow the Opentrons labware definitions, so travel in
+the run-time model matches a full simulate run. Custom labware comes
+from the same .json definitions as the simulator's.
+
+Usage:
+    python recording_context.py Kapa_qPCR_Step2.py --set sample_number=48
+"""
+
+import argparse
+import collections
+import os
+
+import estimate_runtime
+
+
+Point = collections.namedtuple('Point', 'x y z')
+
+# Standard labware the protocols load, as (display name, rows, columns, A1 x and y, well spacing, well bottom z, well depth,
+# labware height, tip rack). Positions are in mm from the front left corner of the slot, as in the Opentrons definitions
+standard_labware = {
+    'biorad_96_wellplate_200ul_pcr': ('Bio-Rad 96 Well Plate 200 µL PCR', 8, 12, 14.38, 74.24, 9, 1.25, 14.81, 16.06, False),
+    'biorad_384_wellplate_50ul': ('Bio-Rad 384 Well Plate 50 µL', 16, 24, 12.13, 76.49, 4.5, 1.05, 9.35, 10.4, False),
+    'opentrons_96_tiprack_20ul': ('Opentrons OT-2 96 Tip Rack 20 µL', 8, 12, 14.38, 74.24, 9, 25.49, 39.2, 64.69, True),
+    'opentrons_96_tiprack_300ul': ('Opentrons OT-2 96 Tip Rack 300 µL', 8, 12, 14.38, 74.24, 9, 5.39, 59.3, 64.49, True),
+    }
+
+# Custom labware the protocols load, in the same form. These approximate the .json definitions uploaded to the robot, so the
+# protocols trace on a clean checkout. A definition in the labware directory takes precedence
+custom_labware = {
+    'agilent_4_well_73_ml_reagent_reservoir': ('Agilent 4 Well 73 mL', 1, 4, 20.0, 42.79, 29.25, 4.82, 39.22, 44.04, False),
+    'perkinelmer_96_wellplate_2000ul': ('PerkinElmer 96 Well Plate 2000 µL', 8, 12, 14.3, 74.15, 9, 3, 38, 41, False),
+    }
+
+# Pipettes as (max volume, min volume, channels, default flow rate (uL/s) at API level 2.10)
+pipettes = {
+    'p20_multi_gen2': (20, 1, 8, 7.6),
+    'p300_multi_gen2': (300, 20, 8, 94),
+    'p20_single_gen2': (20, 1, 1, 7.56),
+    'p300_single_gen2': (300, 20, 1, 92.86),
+    }
+
+# Temperature modules as (display name, labware offset from the slot)
+modules = {
+    'temperature module': ('Temperature Module GEN1', Point(-0.15, -0.15, 80.09)),
+    'tempdeck': ('Temperature Module GEN1', Point(-0.15, -0.15, 80.09)),
+    'temperature module gen2': ('Temperature Module GEN2', Point(-1.45, -0.15, 80.09)),
+    }
+
+slot_positions = {str(s): Point(132.5*((s-1) % 3), 90.5*((s-1)//3), 0) for s in range(1, 13)}
+
+
+def grid_definition(load_name, display_name, rows, columns, x, y, spacing, z, depth, height, tiprack):
+    """Return a labware definition (the parts used here) for a regular grid of wells."""
+    row_names = 'ABCDEFGHIJKLMNOP'[:rows]
+    ordering = [['{}{}'.format(r, c+1) for r in row_names] for c in range(columns)]
+    wells = {'{}{}'.format(r, c+1): dict(x=x+(spacing*c), y=y-(spacing*i), z=z, depth=depth)
+             for i, r in enumerate(row_names) for c in range(columns)}
+    return dict(ordering=ordering, wells=wells, dimensions=dict(zDimension=height), metadata=dict(displayName=display_name),
+                parameters=dict(loadName=load_name, isTiprack=tiprack))
+
+
+trash_definition = dict(ordering=[['A1']], wells={'A1': dict(x=82.84, y=80, z=82, depth=0)}, dimensions=dict(zDimension=82),
+                        metadata=dict(displayName='Opentrons Fixed Trash'), parameters=dict(loadName='opentrons_1_trash_1100ml_fixed', isTiprack=False))
+
+
+class Location:
+    """A point and the Well (or Labware) it belongs to."""
+
+    def __init__(self, point, labware):
+        self.point = point
+        self.labware = labware
+
+    def __str__(self):
+        return 'Location(point={}, labware={})'.format(self.point, self.labware)
+
+
+class Well:
+    is_well = True
+
+    def __init__(self, parent, well_name, point, depth):
+        self.parent = parent
+        self.well_name = well_name
+        self.depth = depth
+        self._bottom = point
+        self.has_tip = parent.is_tiprack
+
+    def as_well(self):
+        return self
+
+    def bottom(self, z=0):
+        return Location(self._bottom._replace(z=self._bottom.z+z), self)
+
+    def top(self, z=0):
+        return Location(self._bottom._replace(z=self._bottom.z+self.depth+z), self)
+
+    def __str__(self):
+        return '{} of {}'.format(self.well_name, self.parent)
+
+
+class Labware:
+    is_well = False
+
+    def __init__(self, definition, parent, offset, label=None):
+        self.load_name = definition['parameters']['loadName']
+        self.is_tiprack = definition['parameters'].get('isTiprack', False)
+        self.name = label or definition['metadata']['displayName']
+        self.parent = parent
+        self.highest_z = offset.z+definition['dimensions']['zDimension']
+        self._wells = collections.OrderedDict()
+        for name in [name for column in definition['ordering'] for name in column]:
+            w = definition['wells'][name]
+            self._wells[name] = Well(self, name, Point(float(offset.x+w['x']), float(offset.y+w['y']), float(offset.z+w['z'])), w['depth'])
+        self._columns = [[self._wells[name] for name in column] for column in definition['ordering']]
+
+    def wells(self):
+        return list(self._wells.values())
+
+    def wells_by_name(self):
+        return dict(self._wells)
+
+    def columns(self):
+        return [list(column) for column in self._columns]
+
+    def rows(self):
+        return [list(row) for row in zip(*self._columns)]
+
+    def __getitem__(self, well_name):
+        return self._wells[well_name]
+
+    def next_tip(self, num_tips=1, starting_tip=None):
+        """Return the first well from starting_tip on with num_tips tips below it in its column, or None."""
+        wells = self.wells()
+        for well in wells[wells.index(starting_tip) if starting_tip is not None else 0:]:
+            column = self._columns[int(well.well_name[1:])-1]
+            i = column.index(well)
+            if len(column[i:i+num_tips]) == num_tips and all(w.has_tip for w in column[i:i+num_tips]):
+                return well
+        return None
+
+    def use_tips(self, start_well, num_channels=1):
+        column = self._columns[int(start_well.well_name[1:])-1]
+        i = column.index(start_well)
+        for well in column[i:i+num_channels]:
+            well.has_tip = False
+
+    def reset(self):
+        for well in self._wells.values():
+            well.has_tip = self.is_tiprack
+
+    def as_well(self):
+        raise TypeError('{} is not a well'.format(self))
+
+    def __str__(self):
+        return '{} on {}'.format(self.name, self.parent)
+
+
+class TemperatureModule:
+    def __init__(self, context, name, slot):
+        self._context = context
+        display_name, offset = modules[name]
+        self.name = display_name
+        self.slot = slot
+        self.offset = Point(*(p+o for p, o in zip(slot_positions[slot], offset)))
+        self.labware = None
+        self.target = None
+        self.temperature = 25
+
+    def load_labware(self, load_name, label=None, namespace=None, version=None):
+        self.labware = self._context._place(load_name, self.slot, str(self), self.offset, label)
+        return self.labware
+
+    def start_set_temperature(self, celsius):
+        self.target = celsius
+        self._context._record('start_set_temperature', celsius)
+
+    def set_temperature(self, celsius):
+        self.target = self.temperature = celsius
+        self._context._record('set_temperature', celsius)
+
+    def await_temperature(self, celsius):
+        self.temperature = celsius
+        self._context._record('await_temperature', celsius)
+
+    def deactivate(self):
+        self.target = None
+        self.temperature = 25
+        self._context._record('deactivate')
+
+    def __str__(self):
+        return '{} on {}'.format(self.name, self.slot)
+
+
+class Namespace:
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+
+class Instrument:
+    def __init__(self, context, name, mount, tip_racks):
+        self._context = context
+        self.name = name
+        self.mount = mount
+        self.max_volume, self.min_volume, self.channels, flow_rate = pipettes[name]
+        self.flow_rate = Namespace(aspirate=flow_rate, dispense=flow_rate, blow_out=flow_rate)
+        self.well_bottom_clearance = Namespace(aspirate=1.0, dispense=1.0)
+        self.tip_racks = list(tip_racks or [])
+        self.starting_tip = None
+        self.has_tip = False
+        self.current_volume = 0
+        self._last_tip = None
+
+    def _location(self, location, clearance):
+        """Resolve a Well to its bottom at clearance, and None to where the pipette already is."""
+        if location is None:
+            location = self._context.location_cache
+        elif isinstance(location, Well):
+            location = location.bottom(clearance)
+        self._context.location_cache = location
+        return location
+
+    def _require_tip(self, command):
+        if not self.has_tip:
+            raise RuntimeError('Cannot {} without a tip on the {} pipette'.format(command, self.mount))
+
+    def aspirate(self, volume=None, location=None, rate=1.0):
+        self._require_tip('aspirate')
+        volume = volume if volume else self.max_volume-self.current_volume
+        if self.current_volume+volume > self.max_volume+1e-9:
+            raise ValueError('Cannot aspirate {} uL into {} uL already in the {} pipette'.format(volume, self.current_volume, self.name))
+        location = self._location(location, self.well_bottom_clearance.aspirate)
+        self.current_volume += volume
+        self._context._record('aspirate', self.mount, volume, location, self.flow_rate.aspirate*rate)
+        return self
+
+    def dispense(self, volume=None, location=None, rate=1.0):
+        self._require_tip('dispense')
+        volume = volume if volume is not None else self.current_volume
+        location = self._location(location, self.well_bottom_clearance.dispense)
+        self.current_volume = max(0, self.current_volume-volume)
+        self._context._record('dispense', self.mount, volume, location, self.flow_rate.dispense*rate)
+        return self
+
+    def mix(self, repetitions=1, volume=None, location=None, rate=1.0):
+        self._require_tip('mix')
+        volume = volume if volume is not None else self.max_volume
+        location = self._location(location, self.well_bottom_clearance.aspirate)
+        self._context._record('mix', self.mount, repetitions, volume, location)
+        return self
+
+    def blow_out(self, location=None):
+        location = self._location(location.top() if isinstance(location, Well) else location, None)
+        self.current_volume = 0
+        self._context._record('blow_out', self.mount, location)
+        return self
+
+    def touch_tip(self, location=None, radius=1.0, v_offset=-1.0, speed=60.0):
+        self._require_tip('touch_tip')
+        self._context._record('touch_tip', self.mount, v_offset)
+        return self
+
+    def move_to(self, location, force_direct=False, minimum_z_height=None, speed=None):
+        self._context.location_cache = location
+        self._context._record('move_to', self.mount, location)
+        return self
+
+    def pick_up_tip(self, location=None, presses=None, increment=None):
+        if self.has_tip:
+            raise RuntimeError('The {} pipette already has a tip'.format(self.mount))
+        tip = location
+        if tip is None:
+            tipracks = self.tip_racks
+            if self.starting_tip is not None and self.starting_tip.parent in tipracks:
+                tipracks = tipracks[tipracks.index(self.starting_tip.parent):]
+            for i, tiprack in enumerate(tipracks):
+                tip = tiprack.next_tip(self.channels, self.starting_tip if i == 0 else None)
+                if tip is not None:
+                    break
+            if tip is None:
+                raise RuntimeError('The {} pipette is out of tips'.format(self.mount))
+        elif isinstance(tip, Location):
+            tip = tip.labware
+        tip.parent.use_tips(tip, self.channels)
+        self.has_tip = True
+        self._last_tip = tip
+        self._context.location_cache = tip.top()
+        self._context._record('pick_up_tip', self.mount, tip)
+        return self
+
+    def drop_tip(self, location=None, home_after=True):
+        self._require_tip('drop_tip')
+        location = location if location is not None else self._context.fixed_trash.wells()[0]
+        self.has_tip = False
+        self.current_volume = 0
+        self._context.location_cache = location.top() if isinstance(location, Well) else location
+        self._context._record('drop_tip', self.mount, location)
+        return self
+
+    def return_tip(self, home_after=True):
+        # Like the pipette, a returned tip stays used in tip tracking
+        self.drop_tip(self._last_tip)
+        return self
+
+    def reset_tipracks(self):
+        for tiprack in self.tip_racks:
+            tiprack.reset()
+
+
+class Deck(dict):
+    """The labware (or module labware) in each slot, keyed by slot name."""
+
+    def __getitem__(self, slot):
+        return dict.__getitem__(self, str(slot))
+
+    def __delitem__(self, slot):
+        dict.__delitem__(self, str(slot))
+
+    def position_for(self, slot):
+        return Location(slot_positions[str(slot)], str(slot))
+
+
+class RecordingContext:
+    """Stand-in for an Opentrons ProtocolContext that records commands instead of simulating hardware.
+
+    trace holds one tuple per command: (command, *arguments), with wells and locations as strings. labware maps the load names of
+    custom labware to their .json definitions.
+    """
+
+    def __init__(self, labware=None):
+        self.trace = []
+        self.max_speeds = {}
+        self.deck = Deck()
+        self.location_cache = None
+        self.rail_lights_on = False
+        self._definitions = dict(labware or {})
+        self.fixed_trash = Labware(trash_definition, '12', slot_positions['12'])
+        self.deck['12'] = self.fixed_trash
+
+    def _record(self, command, *arguments):
+        self.trace.append((command,)+tuple(str(a) if isinstance(a, (Well, Location)) else a for a in arguments))
+
+    def _definition(self, load_name):
+        if load_name in self._definitions:
+            return self._definitions[load_name]
+        if load_name in standard_labware:
+            return grid_definition(load_name, *standard_labware[load_name])
+        if load_name in custom_labware:
+            return grid_definition(load_name, *custom_labware[load_name])
+        raise ValueError('Unknown labware {}: add its .json definition to the labware directory'.format(load_name))
+
+    def _place(self, load_name, slot, parent, offset, label=None):
+        slot = str(slot)
+        if slot in self.deck:
+            raise ValueError('Slot {} already holds {}'.format(slot, self.deck[slot]))
+        labware = Labware(self._definition(load_name), parent, offset, label)
+        self.deck[slot] = labware
+        return labware
+
+    @property
+    def loaded_labwares(self):
+        return {int(slot): labware for slot, labware in self.deck.items() if isinstance(labware, Labware)}
+
+    def load_labware(self, load_name, location, label=None, namespace=None, version=None):
+        return self._place(load_name, location, str(location), slot_positions[str(location)], label)
+
+    def load_labware_from_definition(self, definition, location, label=None):
+        self._definitions[definition['parameters']['loadName']] = definition
+        return self.load_labware(definition['parameters']['loadName'], location, label)
+
+    def load_module(self, module_name, location=None, configuration=None):
+        if module_name.lower() not in modules:
+            raise ValueError('Only temperature modules are supported, not {}'.format(module_name))
+        return TemperatureModule(self, module_name.lower(), str(location))
+
+    def load_instrument(self, instrument_name, mount, tip_racks=None, replace=False):
+        if instrument_name not in pipettes:
+            raise ValueError('Unknown pipette {}'.format(instrument_name))
+        return Instrument(self, instrument_name, mount, tip_racks)
+
+    def is_simulating(self):
+        return True
+
+    def set_rail_lights(self, on):
+        self.rail_lights_on = on
+        self._record('set_rail_lights', on)
+
+    def comment(self, msg):
+        self._record('comment', msg)
+
+    def pause(self, msg=None):
+        self._record('pause', msg)
+
+    def delay(self, seconds=0, minutes=0, msg=None):
+        self._record('delay', seconds+(60*minutes))
+
+    def home(self):
+        self.location_cache = None
+        self._record('home')
+
+    def commands(self):
+        """Return the trace as one line per command."""
+        return [' '.join(str(a) for a in command) for command in self.trace]
+
+
+def main(argv=None):
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('protocol', help="protocol file, e.g. Kapa_qPCR_Step2.py")
+    parser.add_argument('--set', action='append', metavar='NAME=VALUE', help="override a get_values() field (JSON value)")
+    parser.add_argument('--labware-dir', default=os.path.join(here, 'labware'), help="directory of custom labware .json definitions")
+    args = parser.parse_args(argv)
+
+    context = RecordingContext(estimate_runtime.load_labware_dir(args.labware_dir))
+    estimate_runtime.load_protocol(args.protocol, estimate_runtime.parse_values(args.set)).run(context)
+    for line in context.commands():
+        print(line)
+
+
+if __name__ == '__main__':
+    main()